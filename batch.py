@@ -0,0 +1,230 @@
+import io
+import json
+import signal
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from os import makedirs, path
+from time import perf_counter
+from typing import Dict, List, NamedTuple
+from folders_types import Command
+from interpreter import Interpreter
+from loader import load_program
+from output import BufferedOutput
+from binary_format import is_binary_program, load_program_binary
+from program_cache import ProgramCache
+from limits import Limits, LimitedInterpreter, ResourceLimitExceeded
+
+# Runs many Folders programs across a pool of worker processes. Workers are started once and reused,
+# so imports, and the program cache, are paid for once per worker rather than once per program.
+
+class BatchResult(NamedTuple):
+    program: str
+    status: str             # "ok", "error", "timeout" or "limit"
+    wall_time: float
+    instructions: int | None
+    stdout: str
+    error: str | None
+
+class Timeout(Exception):
+    pass
+
+# Counts the commands it executes; a subclass so that the plain Interpreter pays nothing for it
+class CountingInterpreter(Interpreter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.instructions = 0
+
+    def run_command(self, command: Command) -> List[Command] | None:
+        self.instructions += 1
+        return super().run_command(command)
+
+# State of a worker process, set up by init_worker
+worker_program_cache: ProgramCache | None = None
+
+def init_worker(cache_dir: str | None, use_cache: bool):
+    global worker_program_cache
+    worker_program_cache = ProgramCache(cache_dir) if use_cache else None
+
+# The SIGALRM handler for a run. It only raises while the program is still running, so a timer that
+# fires just as the run ends, before it is disarmed, can't turn a finished run into a timeout, or raise
+# while the result is being recorded.
+class Deadline:
+    def __init__(self):
+        self.running = True
+
+    def expire(self, signum, frame):
+        if self.running:
+            raise Timeout()
+
+def load(program_path: str) -> List[Command]:
+    if is_binary_program(program_path):
+        return load_program_binary(program_path)
+    if worker_program_cache is not None:
+        return worker_program_cache.load_program(program_path)
+    return load_program(program_path)
+
+def run_one(program_path: str, stdin_path: str | None, timeout: float | None, engine: str, limits: Limits = Limits()) -> BatchResult:
+    stdout = io.StringIO()
+    output = BufferedOutput(stdout)
+    instructions = None
+    status, error = "ok", None
+
+    saved_stdin = sys.stdin
+    # SIGALRM interrupts the program wherever it is; it's only available on Unix
+    use_alarm = timeout is not None and hasattr(signal, "setitimer")
+    deadline = Deadline()
+    if use_alarm:
+        assert(timeout is not None)
+        previous_handler = signal.signal(signal.SIGALRM, deadline.expire)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    start = perf_counter()
+    try:
+        try:
+            # A missing or unreadable input file is reported like any other error
+            sys.stdin = open(stdin_path, "r") if stdin_path is not None else io.StringIO("")
+            program = load(program_path)
+            match engine:
+                case "tree" if limits.any():
+                    limited = LimitedInterpreter(output, limits=limits)
+                    try:
+                        limited.run_program(program)
+                    finally:
+                        instructions = limited.steps
+                case "tree":
+                    interpreter = CountingInterpreter(output)
+                    try:
+                        interpreter.run_program(program)
+                    finally:
+                        instructions = interpreter.instructions
+                case "vm":
+                    from vm import VM, compile_program
+                    VM(compile_program(program), output).run()
+                case "python":
+                    from transpiler import transpile_program, run_python
+                    run_python(transpile_program(program), program_path, output)
+        finally:
+            deadline.running = False
+    except Timeout:
+        status, error = "timeout", f"Timed out after {timeout}s"
+    except ResourceLimitExceeded as e:
+        status, error = "limit", str(e)
+    except Exception as e:
+        status, error = "error", f"{type(e).__name__}: {e}"
+    finally:
+        wall_time = perf_counter() - start
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+        if sys.stdin is not saved_stdin:
+            sys.stdin.close()
+        sys.stdin = saved_stdin
+
+    return BatchResult(program_path, status, wall_time, instructions, stdout.getvalue(), error)
+
+def stdin_for(program_path: str, stdin_dir: str | None, stdin_path: str | None) -> str | None:
+    if stdin_dir is not None:
+        candidate = path.join(stdin_dir, f"{path.basename(path.normpath(program_path))}.in")
+        if path.isfile(candidate):
+            return candidate
+    return stdin_path
+
+class BatchRunner:
+    def __init__(self, jobs: int | None = None, timeout: float | None = None, engine: str = "tree",
+                 cache_dir: str | None = None, use_cache: bool = True, limits: Limits = Limits()):
+        self.jobs = jobs
+        self.timeout = timeout
+        self.engine = engine
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self.limits = limits
+
+    # Yields (index, result) pairs as programs finish, the index being the program's position in `programs`
+    def run(self, programs: List[str], stdin_dir: str | None = None, stdin_path: str | None = None):
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=init_worker, initargs=(self.cache_dir, self.use_cache)) as executor:
+            futures = {
+                executor.submit(run_one, program, stdin_for(program, stdin_dir, stdin_path), self.timeout, self.engine, self.limits): i
+                for i, program in enumerate(programs)
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+def expand_programs(patterns: List[str]) -> List[str]:
+    programs = []
+    for pattern in patterns:
+        matches = sorted(glob(pattern))
+        programs.extend(matches if len(matches) > 0 else [pattern])
+    return programs
+
+def summarize(results: List[BatchResult], elapsed: float) -> Dict:
+    counts: Dict[str, int] = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    return {
+        "programs": len(results),
+        "elapsed": elapsed,
+        "statuses": counts,
+        "results": [
+            {
+                "program": result.program,
+                "status": result.status,
+                "wall_time": result.wall_time,
+                "instructions": result.instructions,
+                "stdout_bytes": len(result.stdout.encode("utf-8")),
+                "error": result.error,
+            }
+            for result in results
+        ],
+    }
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser(description="Run many Folders programs across a pool of worker processes")
+    arg_parser.add_argument("programs", nargs="+", help="Program directories or binary programs (glob patterns are expanded)")
+    arg_parser.add_argument("--jobs", "-j", help="Number of worker processes (defaults to the number of CPUs)", type=int)
+    arg_parser.add_argument("--timeout", "-t", help="Seconds each program may run for", type=float)
+    arg_parser.add_argument("--engine", "-e", help="Execution engine (only tree counts instructions)", choices=["tree", "vm", "python"], default="tree")
+    arg_parser.add_argument("--max-steps", help="Tree engine: stop a program after it executes this many commands", type=int)
+    arg_parser.add_argument("--max-output-bytes", help="Tree engine: stop a program before it prints more than this many bytes", type=int)
+    arg_parser.add_argument("--max-variables", help="Tree engine: stop a program that declares more than this many variables", type=int)
+    arg_parser.add_argument("--max-string-length", help="Tree engine: stop a program when a variable holds a longer string", type=int)
+    arg_parser.add_argument("--stdin", help="File fed to every program's input")
+    arg_parser.add_argument("--stdin-dir", help="Directory of per-program input files, named <program>.in")
+    arg_parser.add_argument("--output-dir", "-o", help="Write each program's output to <program>.out in this directory")
+    arg_parser.add_argument("--summary", "-s", help="Write a JSON summary to this file")
+    arg_parser.add_argument("--no-cache", help="Always rescan programs instead of using the program cache", action="store_true")
+    arg_parser.add_argument("--cache-dir", help="Directory holding the program cache")
+    args = arg_parser.parse_args()
+
+    # The timeout already bounds wall time, and is enforced for every engine
+    limits = Limits(args.max_steps, None, args.max_output_bytes, args.max_variables, args.max_string_length)
+    if limits.any() and args.engine != "tree":
+        arg_parser.error("resource limits need the tree engine")
+
+    programs = expand_programs(args.programs)
+    runner = BatchRunner(args.jobs, args.timeout, args.engine, args.cache_dir, not args.no_cache, limits)
+
+    if args.output_dir is not None:
+        makedirs(args.output_dir, exist_ok=True)
+
+    # Results are printed as they finish, and summarized in the order the programs were given
+    results: List[BatchResult | None] = [None] * len(programs)
+    start = perf_counter()
+    print(f"{'program':<40} {'status':<8} {'time (s)':>9} {'instructions':>13}", file=sys.stderr)
+    for i, result in runner.run(programs, args.stdin_dir, args.stdin):
+        results[i] = result
+        instructions = "-" if result.instructions is None else result.instructions
+        print(f"{result.program:<40} {result.status:<8} {result.wall_time:>9.3f} {instructions:>13}", file=sys.stderr)
+        if result.error is not None:
+            print(f"    {result.error}", file=sys.stderr)
+        if args.output_dir is not None:
+            with open(path.join(args.output_dir, f"{path.basename(path.normpath(result.program))}.out"), "w") as f:
+                f.write(result.stdout)
+    summary = summarize([result for result in results if result is not None], perf_counter() - start)
+
+    if args.summary is not None:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=2)
+    statuses = ", ".join(f"{count} {status}" for status, count in sorted(summary["statuses"].items()))
+    print(f"{summary['programs']} programs in {summary['elapsed']:.2f}s: {statuses}", file=sys.stderr)
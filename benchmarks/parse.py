@@ -0,0 +1,84 @@
+# Compares the parsy parser with the hand-written one in fast_parser.py on large generated scripts,
+# checking that both produce the same AST.
+# Run from the repository root: python -m benchmarks.parse [--lines 1000 10000 50000] [--repeat 3]
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+from typing import Callable, List
+from fast_parser import parse_program
+from parser import program_parser
+
+type_names = ["int", "float", "char", "string"]
+operators = ["+", "-", "*", "/", "<", ">", "=="]
+
+def random_expression(rng: Random, var_names: List[str], depth: int) -> str:
+    if depth == 0 or rng.random() < 0.3:
+        match rng.randrange(4):
+            case 0:
+                return str(rng.randrange(-1000, 1000))
+            case 1:
+                return f"{rng.uniform(-100, 100):.3f}"
+            case 2:
+                return f'"text {rng.randrange(100)}\\n"'
+            case _:
+                return rng.choice(var_names)
+    lhs = random_expression(rng, var_names, depth - 1)
+    rhs = random_expression(rng, var_names, depth - 1)
+    if rng.random() < 0.2:
+        return f"({lhs} {rng.choice(operators)} {rhs})"
+    return f"{lhs} {rng.choice(operators)} {rhs}"
+
+# Syntactically valid folderscript (it isn't meant to type check) of roughly `lines` lines
+def generate_script(lines: int, seed: int = 0, max_depth: int = 6) -> str:
+    rng = Random(seed)
+    var_names = [f"var_{i}" for i in range(50)]
+    out = [f"{rng.choice(type_names)} {var_name}" for var_name in var_names]
+    level = 0
+    while len(out) < lines:
+        indent = "    " * level
+        match rng.randrange(8):
+            case 0 | 1 if level < max_depth:
+                keyword = rng.choice(["if", "while"])
+                out.append(f"{indent}{keyword} {random_expression(rng, var_names, 2)}: # block {len(out)}")
+                level += 1
+                out.append(f"{indent}    print({random_expression(rng, var_names, 3)})")
+            case 2 if level > 0:
+                level -= 1
+                out.append("")
+            case 3:
+                out.append(f"{indent}input({rng.choice(var_names)})")
+            case 4 if rng.random() < 0.5:
+                # parser.py matches char literals greedily, so only one per line
+                out.append(f"{indent}{rng.choice(var_names)} = '{chr(rng.randrange(ord('a'), ord('z') + 1))}'")
+            case 5:
+                out.append(f"{indent}print({random_expression(rng, var_names, 4)})")
+            case _:
+                out.append(f"{indent}{rng.choice(var_names)} = {random_expression(rng, var_names, 4)}")
+    return "\n".join(out) + "\n"
+
+def best_time(parse: Callable[[str], list], script: str, repeat: int):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = perf_counter()
+        result = parse(script)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument("--lines", "-l", help="Script sizes to compare, in lines", type=int, nargs="+", default=[1000, 10000, 50000])
+    arg_parser.add_argument("--repeat", "-r", help="Runs per parser (best is reported)", type=int, default=3)
+    arg_parser.add_argument("--seed", help="Random seed for the generated scripts", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    print(f"{'lines':>8} {'bytes':>10} {'parsy (s)':>10} {'fast (s)':>10} {'lines/s':>10} {'speedup':>8}")
+    for lines in args.lines:
+        script = generate_script(lines, args.seed)
+        parsy_time, parsy_program = best_time(program_parser.parse, script, args.repeat)
+        fast_time, fast_program = best_time(parse_program, script, args.repeat)
+        assert(parsy_time is not None and fast_time is not None)
+        assert(repr(parsy_program) == repr(fast_program))
+        print(f"{lines:>8} {len(script):>10} {parsy_time:>10.4f} {fast_time:>10.4f} "
+              f"{lines / fast_time:>10.0f} {parsy_time / fast_time:>7.2f}x")
@@ -0,0 +1,54 @@
+# Stress test for parsing from many threads at once. Generated scripts, some with syntax errors, are
+# parsed concurrently by both parsers, and every result must match parsing the same script alone.
+# Run from the repository root: python -m benchmarks.parse_threads [--scripts 200] [--threads 16]
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from sys import setswitchinterval
+from time import perf_counter
+from typing import Callable, List
+from parsy import ParseError as ParsyError
+from fast_parser import parse_program as fast_parse_program, ParseError
+from parser import parse_program
+from benchmarks.parse import generate_script
+
+# A script with an unterminated block in the middle, which used to leave parser.py's indent level
+# raised for the next parse
+def broken_script(script: str) -> str:
+    lines = script.splitlines()
+    middle = len(lines) // 2
+    return "\n".join(lines[:middle] + ["if 1 == 1:"] + lines[middle:]) + "\n"
+
+def parse_result(parse: Callable[[str], list], script: str) -> str:
+    try:
+        return repr(parse(script))
+    except (ParsyError, ParseError) as e:
+        return f"error: {e}"
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument("--scripts", "-s", help="Number of scripts to parse", type=int, default=200)
+    arg_parser.add_argument("--lines", "-l", help="Lines per script", type=int, default=300)
+    arg_parser.add_argument("--threads", "-t", help="Number of threads parsing at once", type=int, default=16)
+    arg_parser.add_argument("--rounds", "-r", help="Times each script is parsed concurrently", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    scripts: List[str] = []
+    for i in range(args.scripts):
+        script = generate_script(args.lines, seed=i)
+        scripts.append(broken_script(script) if i % 4 == 3 else script)
+
+    # Switch threads as often as possible, so parses interleave in the middle of blocks
+    setswitchinterval(1e-6)
+
+    for name, parse in [("parser", parse_program), ("fast_parser", fast_parse_program)]:
+        expected = [parse_result(parse, script) for script in scripts]
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            results = list(executor.map(lambda script: parse_result(parse, script), scripts * args.rounds))
+        elapsed = perf_counter() - start
+
+        mismatches = sum(1 for i, result in enumerate(results) if result != expected[i % len(scripts)])
+        failures = sum(1 for result in expected if result.startswith("error"))
+        print(f"{name:<12} {len(results)} parses on {args.threads} threads in {elapsed:.2f}s, "
+              f"{failures} of {len(scripts)} scripts fail to parse, {mismatches} mismatches")
+        assert(mismatches == 0)
@@ -0,0 +1,197 @@
+# Times each stage of the pipeline (parse, compile, write, load, and running on the tree and disk
+# engines) for generated programs and the bundled examples. Results can be saved as JSON and compared
+# against an earlier run, failing when a stage got slower by more than a threshold.
+# Run from the repository root: python -m benchmarks.suite [--save results.json] [--baseline old.json]
+import io
+import json
+import platform
+import sys
+from argparse import ArgumentParser
+from glob import glob
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+from typing import Callable, Dict, List, NamedTuple
+from compiler import FoldersCompiler, count_folders
+from folders_types import Command, Expression
+from interpreter import Interpreter
+from loader import load_program
+from output import BufferedOutput
+from parser import program_parser
+from batch import CountingInterpreter
+
+class Shape(NamedTuple):
+    loop_depth: int     # nested while loops
+    iterations: int     # iterations of each loop
+    expr_depth: int     # depth of the expression computed in the innermost loop
+    string_length: int  # length of the string literal printed at the end
+
+shapes = {
+    "loops": Shape(loop_depth=3, iterations=12, expr_depth=2, string_length=16),
+    "expressions": Shape(loop_depth=1, iterations=300, expr_depth=6, string_length=16),
+    "strings": Shape(loop_depth=1, iterations=20, expr_depth=1, string_length=4000),
+}
+
+# Variables and literals combined with +, - and *, so evaluation can't fail
+def synthetic_expression(depth: int, var_names: List[str], seed: int) -> str:
+    if depth == 0:
+        return var_names[seed % len(var_names)] if seed % 3 else str(seed * 7919 % 1000)
+    operator = "+-*"[seed % 3]
+    lhs = synthetic_expression(depth - 1, var_names, seed * 2 + 1)
+    rhs = synthetic_expression(depth - 1, var_names, seed * 2 + 2)
+    return f"({lhs} {operator} {rhs})"
+
+# A program that runs, with nested counting loops around an assignment, and prints once at the end
+def synthetic_script(shape: Shape) -> str:
+    counters = [f"i{level}" for level in range(shape.loop_depth)]
+    lines = [f"int {counter}" for counter in counters] + ["int acc", "string text"]
+    lines.append(f'text = "{"x" * shape.string_length}"')
+    for level, counter in enumerate(counters):
+        indent = "    " * level
+        lines.append(f"{indent}{counter} = 0")
+        lines.append(f"{indent}while {counter} < {shape.iterations}:")
+    indent = "    " * shape.loop_depth
+    lines.append(f"{indent}acc = {synthetic_expression(shape.expr_depth, ['acc'] + counters, 1)}")
+    for level, counter in reversed(list(enumerate(counters))):
+        lines.append(f"{'    ' * (level + 1)}{counter} = {counter} + 1")
+    lines += ["print(acc)", "print(text)", "print('\\n')"]
+    return "\n".join(lines) + "\n"
+
+def count_nodes(program: List[Command]) -> int:
+    count = 0
+    stack: List[Command | Expression] = list(program)
+    while len(stack) > 0:
+        node = stack.pop()
+        count += 1
+        for name in ["expr", "value", "lhs", "rhs"]:
+            child = getattr(node, name, None)
+            if isinstance(child, Expression):
+                stack.append(child)
+        stack.extend(getattr(node, "commands", []))
+    return count
+
+def best_time(run: Callable[[], object], repeat: int, setup: Callable[[], object] | None = None) -> float:
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        run()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    assert(best is not None)
+    return best
+
+# Runs with input available and output discarded
+def quietly(run: Callable[[], object], stdin_text: str) -> Callable[[], object]:
+    def quiet_run():
+        saved_stdin = sys.stdin
+        sys.stdin = io.StringIO(stdin_text)
+        try:
+            return run()
+        finally:
+            sys.stdin = saved_stdin
+    return quiet_run
+
+def null_output() -> BufferedOutput:
+    return BufferedOutput(io.StringIO())
+
+def count_instructions(program: List[Command], stdin_text: str) -> int:
+    interpreter = CountingInterpreter(null_output())
+    quietly(lambda: interpreter.run_program(program), stdin_text)()
+    return interpreter.instructions
+
+def benchmark_script(script: str, scratch_dir: str, repeat: int, stdin_text: str) -> Dict[str, Dict]:
+    results: Dict[str, Dict] = {}
+    def record(stage: str, seconds: float, amount: int, unit: str):
+        results[stage] = { "seconds": seconds, "amount": amount, "unit": unit, "rate": amount / seconds }
+
+    program = program_parser.parse(script)
+    nodes = count_nodes(program)
+    record("parse", best_time(lambda: program_parser.parse(script), repeat), nodes, "nodes")
+
+    encoded = FoldersCompiler().compile(program)
+    folders = count_folders(encoded)
+    record("compile", best_time(lambda: FoldersCompiler().compile(program), repeat), folders, "folders")
+
+    build_dir = f"{scratch_dir}/build"
+    clear = lambda: rmtree(build_dir, ignore_errors=True)
+    record("write", best_time(lambda: FoldersCompiler.write_to_directory(build_dir, encoded), repeat, clear), folders, "folders")
+
+    record("load", best_time(lambda: load_program(build_dir), repeat), folders, "folders")
+
+    loaded = load_program(build_dir)
+    instructions = count_instructions(loaded, stdin_text)
+    tree = quietly(lambda: Interpreter(null_output()).run_program(loaded), stdin_text)
+    record("run_tree", best_time(tree, repeat), instructions, "instructions")
+    disk = quietly(lambda: Interpreter(null_output()).run_directory(build_dir), stdin_text)
+    record("run_disk", best_time(disk, repeat), instructions, "instructions")
+    clear()
+    return results
+
+# Stages that took more than (1 + threshold) times as long as in the baseline. Stages quicker than
+# min_seconds are mostly timer noise, so they are left out.
+def regressions(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float, min_seconds: float) -> List[str]:
+    found = []
+    for name, stages in results.items():
+        for stage, result in stages.items():
+            before = baseline.get(name, {}).get(stage)
+            if before is None or max(before["seconds"], result["seconds"]) < min_seconds:
+                continue
+            if result["seconds"] > before["seconds"] * (1 + threshold):
+                found.append(f"{name} {stage}: {before['seconds']:.4f}s -> {result['seconds']:.4f}s "
+                             f"({result['seconds'] / before['seconds'] - 1:+.1%})")
+    return found
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument("--shapes", "-s", help="Generated programs to run", nargs="*", choices=list(shapes), default=list(shapes))
+    arg_parser.add_argument("--loop-depth", help="Also run a generated program with this many nested loops", type=int)
+    arg_parser.add_argument("--iterations", help="Iterations of each loop of that program", type=int, default=10)
+    arg_parser.add_argument("--expr-depth", help="Expression depth of that program", type=int, default=3)
+    arg_parser.add_argument("--string-length", help="String literal length of that program", type=int, default=64)
+    arg_parser.add_argument("--examples", "-e", help="Example scripts to run", nargs="*", default=sorted(glob("examples/*.folderscript")))
+    arg_parser.add_argument("--stdin", help="Input given to programs that read it", default="bench\n" * 16)
+    arg_parser.add_argument("--repeat", "-r", help="Runs per stage (best is reported)", type=int, default=3)
+    arg_parser.add_argument("--save", help="Write the results to this JSON file")
+    arg_parser.add_argument("--baseline", "-b", help="Compare against results saved by an earlier run")
+    arg_parser.add_argument("--threshold", "-t", help="Fraction a stage may slow down before it counts as a regression", type=float, default=0.1)
+    arg_parser.add_argument("--min-seconds", help="Stages quicker than this aren't compared", type=float, default=0.005)
+    arg_parser.add_argument("--scratch", help="Directory to build into (defaults to a temporary directory)")
+    args = arg_parser.parse_args()
+
+    scripts: Dict[str, str] = { f"synthetic-{name}": synthetic_script(shapes[name]) for name in args.shapes }
+    if args.loop_depth is not None:
+        shape = Shape(args.loop_depth, args.iterations, args.expr_depth, args.string_length)
+        scripts["synthetic-custom"] = synthetic_script(shape)
+    for script_path in args.examples:
+        with open(script_path, "r") as f:
+            scripts[path.basename(script_path)] = f.read()
+
+    scratch_dir = mkdtemp(prefix="folders-bench-") if args.scratch is None else args.scratch
+    results: Dict[str, Dict[str, Dict]] = {}
+    print(f"{'program':<24} {'stage':<9} {'best (s)':>9} {'amount':>10} {'rate':>12} unit")
+    try:
+        for name, script in scripts.items():
+            results[name] = benchmark_script(script, scratch_dir, args.repeat, args.stdin)
+            for stage, result in results[name].items():
+                print(f"{name:<24} {stage:<9} {result['seconds']:>9.4f} {result['amount']:>10} "
+                      f"{result['rate']:>12.0f} {result['unit']}/s")
+    finally:
+        if args.scratch is None:
+            rmtree(scratch_dir, ignore_errors=True)
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump({ "python": platform.python_version(), "results": results }, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["results"]
+        found = regressions(results, baseline, args.threshold, args.min_seconds)
+        for regression in found:
+            print(f"regression: {regression}")
+        print(f"{len(found)} regressions against {args.baseline} (threshold {args.threshold:.0%})")
+        if len(found) > 0:
+            sys.exit(1)
@@ -0,0 +1,44 @@
+# Compares serial and parallel folder creation for the bundled examples.
+# Run from the repository root: python -m benchmarks.write_tree [--jobs 1 4 8] [--repeat 3]
+from argparse import ArgumentParser
+from glob import glob
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from compiler import FoldersCompiler
+from parser import program_parser
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument("--jobs", "-j", help="Thread counts to compare", type=int, nargs="+", default=[1, 4, 8])
+    arg_parser.add_argument("--repeat", "-r", help="Runs per configuration (best is reported)", type=int, default=3)
+    arg_parser.add_argument("--scratch", help="Directory to build into (defaults to a temporary directory)")
+    arg_parser.add_argument("scripts", nargs="*", default=sorted(glob("examples/*.folderscript")))
+    args = arg_parser.parse_args()
+
+    scratch_dir = mkdtemp(prefix="folders-bench-") if args.scratch is None else args.scratch
+
+    print(f"{'program':<28} {'jobs':>4} {'folders':>8} {'best (s)':>9} {'folders/s':>11} {'speedup':>8}")
+    try:
+        for script_path in args.scripts:
+            with open(script_path, "r") as f:
+                encoded = FoldersCompiler().compile(program_parser.parse(f.read()))
+
+            build_dir = f"{scratch_dir}/build"
+            serial_time = None
+            for jobs in args.jobs:
+                best = None
+                for _ in range(args.repeat):
+                    rmtree(build_dir, ignore_errors=True)
+                    stats = FoldersCompiler.write_to_directory(build_dir, encoded, jobs)
+                    best = stats.elapsed if best is None else min(best, stats.elapsed)
+                    folders_created = stats.folders_created
+                assert(best is not None)
+
+                serial_time = best if serial_time is None else serial_time
+                name = path.basename(script_path)
+                print(f"{name:<28} {jobs:>4} {folders_created:>8} {best:>9.4f} "
+                      f"{folders_created / best:>11.0f} {serial_time / best:>7.2f}x")
+    finally:
+        if args.scratch is None:
+            rmtree(scratch_dir, ignore_errors=True)
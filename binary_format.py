@@ -0,0 +1,133 @@
+import mmap
+from argparse import ArgumentParser
+from os import fstat
+from typing import List, Tuple
+from folders_types import Command
+from loader import Folder, scan_tree, decode_commands
+from compiler import FoldersCompiler
+
+# A Folders program as bytes: the magic number and format version, followed by the number of
+# subfolders of every folder, in preorder, as unsigned LEB128 varints. Folder names carry no meaning,
+# so this is a lossless encoding of the program.
+MAGIC = b"FLDR"
+VERSION = 1
+HEADER_SIZE = len(MAGIC) + 1
+
+def write_varint(value: int, dest: bytearray):
+    while value >= 0x80:
+        dest.append((value & 0x7f) | 0x80)
+        value >>= 7
+    dest.append(value)
+
+def encode_tree(tree: list) -> bytes:
+    out = bytearray(MAGIC)
+    out.append(VERSION)
+
+    stack = [tree]
+    while len(stack) > 0:
+        folder = stack.pop()
+        write_varint(len(folder), out)
+        stack.extend(reversed(folder))
+
+    return bytes(out)
+
+def read_varint(data: bytes | mmap.mmap, pos: int):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+# Rebuilds the tree from `data` (bytes or an mmap). Folders get the names the compiler would give
+# them, below `root_path`, so paths in diagnostics match the tree produced by `expand`.
+def decode_tree(data: bytes | mmap.mmap, root_path: str) -> Folder:
+    if len(data) < HEADER_SIZE or data[:len(MAGIC)] != MAGIC:
+        raise Exception("Not a binary Folders program")
+    if data[len(MAGIC)] != VERSION:
+        raise Exception(f"Unsupported binary Folders version: {data[len(MAGIC)]}")
+
+    try:
+        root, pos = decode_folders(data, root_path)
+    except IndexError:
+        raise Exception("Truncated binary Folders program") from None
+    if pos != len(data):
+        raise Exception(f"Unexpected data after the end of the binary Folders program, at byte {pos}")
+    return root
+
+# The folders after the header, and the position just past them
+def decode_folders(data: bytes | mmap.mmap, root_path: str) -> Tuple[Folder, int]:
+    names: List[str] = []
+    root = Folder(root_path)
+    count, pos = read_varint(data, HEADER_SIZE)
+    stack = [[root, count]]
+
+    while len(stack) > 0:
+        top = stack[-1]
+        if top[1] == 0:
+            stack.pop()
+            continue
+        top[1] -= 1
+
+        parent = top[0]
+        index = len(parent)
+        if index == len(names):
+            names.append(FoldersCompiler.folder_name_from_index(index))
+        folder = Folder(f"{parent.path}/{names[index]}")
+        parent.append(folder)
+
+        # Almost every folder has fewer than 128 subfolders, which is a single byte
+        count = data[pos]
+        if count < 0x80:
+            pos += 1
+        else:
+            count, pos = read_varint(data, pos)
+        if count > 0:
+            stack.append([folder, count])
+
+    return root, pos
+
+def read_tree(binary_path: str) -> Folder:
+    with open(binary_path, "rb") as f:
+        # An empty file can't be mapped
+        if fstat(f.fileno()).st_size == 0:
+            return decode_tree(b"", binary_path)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return decode_tree(data, binary_path)
+
+def is_binary_program(program_path: str) -> bool:
+    try:
+        with open(program_path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except (IsADirectoryError, PermissionError):
+        return False
+
+def load_program_binary(binary_path: str) -> List[Command]:
+    return decode_commands(read_tree(binary_path))
+
+def write_binary(binary_path: str, tree: list):
+    with open(binary_path, "wb") as f:
+        f.write(encode_tree(tree))
+
+def collapse(program_dir: str, binary_path: str, jobs: int = 1):
+    write_binary(binary_path, scan_tree(program_dir, jobs))
+
+def expand(binary_path: str, program_dir: str, jobs: int = 1):
+    FoldersCompiler.write_to_directory(program_dir, read_tree(binary_path), jobs)
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser(description="Convert Folders programs between directories and the binary format")
+    arg_parser.add_argument("mode", choices=["collapse", "expand"], help="collapse: directory to binary, expand: binary to directory")
+    arg_parser.add_argument("--input", "-i", help="Input directory (collapse) or binary file (expand)", required=True)
+    arg_parser.add_argument("--output", "-o", help="Output binary file (collapse) or directory (expand)", required=True)
+    arg_parser.add_argument("--jobs", "-j", help="Number of threads scanning or creating folders", type=int, default=1)
+    args = arg_parser.parse_args()
+
+    match args.mode:
+        case "collapse":
+            collapse(args.input, args.output, args.jobs)
+        case "expand":
+            expand(args.input, args.output, args.jobs)
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+from os import sep
+from typing import Any, Callable, Dict, Hashable
+
+MISSING = object()
+
+# A dict-like cache that holds at most `max_size` entries (unbounded when None, nothing when 0),
+# evicting the least recently used entry first, and counting evictions and, unless `count_hits` is
+# False, hits and misses. The order of use is only kept when there is a limit, since it is only needed
+# to choose what to evict.
+class LRUCache:
+    def __init__(self, max_size: int | None = None, count_hits: bool = True):
+        assert(max_size is None or max_size >= 0)
+        self.max_size = max_size
+        self.count_hits = count_hits
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Looks an entry up as get does; for hot paths. When there is no order of use to keep and no hits
+        # to count, this is the dict's own get, which costs no Python call.
+        self.lookup: Callable[[Hashable, Any], Any] = \
+            self.entries.get if max_size is None and not count_hits else self.get
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        value = self.entries.get(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        if self.max_size is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_size == 0:
+            return
+        self.entries[key] = value
+        if self.max_size is None:
+            return
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self.entries.pop(key, None)
+
+    # Drops the entry for the path `prefix` and those of the paths below it, but not those of siblings
+    # whose names merely start with the same characters
+    def invalidate_prefix(self, prefix: str):
+        prefix = prefix.rstrip(sep)
+        below = prefix + sep
+        for key in [k for k in self.entries if isinstance(k, str) and (k == prefix or k.startswith(below))]:
+            del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self) -> Dict[str, int | None]:
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits if self.count_hits else None,
+            "misses": self.misses if self.count_hits else None,
+            "evictions": self.evictions,
+        }
@@ -1,15 +1,70 @@
-from typing import List
+from typing import List, NamedTuple
 from string import ascii_lowercase
-from subprocess import getoutput
-from os import walk
-from ctypes import c_float
+from os import mkdir, makedirs, rename, rmdir, unlink, scandir, strerror, fsencode, path
+from errno import EINVAL, ENOSYS
+from tempfile import mkdtemp
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+from ctypes import c_float, c_char_p, c_int, c_uint, CDLL, get_errno
 from argparse import ArgumentParser
 
 from folders_types import CommandType, ExpressionType, TypeType, Command, Expression, If, \
     While, Declare, Let, Print, Input, Lit, IntLit, FloatLit, StrLit, CharLit, EqualTo, \
         LessThan, GreaterThan, Add, Subtract, Multiply, Divide, Variable
 
-from parser import program_parser
+class WriteStats(NamedTuple):
+    folders_created: int
+    elapsed: float
+    folders_removed: int = 0
+
+class FolderCounts(NamedTuple):
+    before: int
+    after: int
+
+# The number of folders an encoded tree creates, not counting the root
+def count_folders(encoded: list) -> int:
+    count = 0
+    stack = [encoded]
+    while len(stack) > 0:
+        sublists = stack.pop()
+        count += len(sublists)
+        stack.extend(sublists)
+    return count
+
+# Removes a tree of folders with an explicit stack, since shutil.rmtree recurses once per level and
+# fails on deeply nested programs
+def remove_tree(root: str):
+    stack = [(root, False)]
+    while len(stack) > 0:
+        folder, emptied = stack.pop()
+        if emptied:
+            rmdir(folder)
+            continue
+        stack.append((folder, True))
+        with scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, False))
+                else:
+                    unlink(entry.path)
+
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+# Atomically swaps two existing paths with renameat2. Returns False where that isn't supported (other
+# platforms, older kernels or C libraries, some filesystems), leaving both paths as they were.
+def exchange_paths(a: str, b: str) -> bool:
+    try:
+        renameat2 = CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return False
+    renameat2.argtypes = [c_int, c_char_p, c_int, c_char_p, c_uint]
+    if renameat2(AT_FDCWD, fsencode(a), AT_FDCWD, fsencode(b), RENAME_EXCHANGE) == 0:
+        return True
+    errno = get_errno()
+    if errno in [EINVAL, ENOSYS]:
+        return False
+    raise OSError(errno, strerror(errno), a, None, b)
 
 encoded_nibbles = [ list(map(lambda b: [[]] if b == '1' else [], list(f"{i:04b}"))) for i in range(16) ]
 
@@ -17,126 +72,100 @@ encoded_nibbles = [ list(map(lambda b: [[]] if b == '1' else [], list(f"{i:04b}"
 class FoldersCompiler:
     def __init__(self):
         self.level = 0
+        self.write_stats: WriteStats | None = None
+        self.folder_counts: FolderCounts | None = None
+        # The program as compiled, after any optimization
+        self.program: List[Command] | None = None
 
     def encode_type_value(self, type_value: int, dest: List):
         dest.extend([ [] for _ in range(type_value) ])
 
+    # Blocks and expressions are encoded with explicit stacks rather than by recursion, so programs of
+    # any depth can be compiled
     def encode_commands(self, commands: List[Command], dest: List):
-        for c in commands:
-            self.encode_command(c, dest)
+        stack = [(command, dest) for command in reversed(commands)]
+        while len(stack) > 0:
+            command, dest = stack.pop()
+            c = [[], []]
+            dest.append(c)
+            self.encode_type_value(command.command_type, c[0])
+
+            match command.command_type:
+                case CommandType.If:
+                    assert(isinstance(command, If))
+                    c.append([])
+                    self.encode_expression(command.expr, c[1])
+                    stack.extend((sub, c[2]) for sub in reversed(command.commands))
+
+                case CommandType.While:
+                    assert(isinstance(command, While))
+                    c.append([])
+                    self.encode_expression(command.expr, c[1])
+                    stack.extend((sub, c[2]) for sub in reversed(command.commands))
+
+                case CommandType.Declare:
+                    assert(isinstance(command, Declare))
+                    c.append([])
+                    self.encode_type_value(command.type, c[1])
+                    self.encode_string(command.var_name, c[2])
+
+                case CommandType.Let:
+                    assert(isinstance(command, Let))
+                    c.append([])
+                    self.encode_string(command.var_name, c[1])
+                    self.encode_expression(command.value, c[2])
+
+                case CommandType.Print:
+                    assert(isinstance(command, Print))
+                    self.encode_expression(command.expr, c[1])
+
+                case CommandType.Input:
+                    assert(isinstance(command, Input))
+                    self.encode_string(command.var_name, c[1])
 
     def encode_command(self, command: Command, dest: List):
-        c = [[], []]
-        dest.append(c)
-        self.encode_type_value(command.command_type, c[0])
-
-        match command.command_type:
-            case CommandType.If:
-                assert(isinstance(command, If))
-                c.append([])
-                self.encode_expression(command.expr, c[1])
-                self.encode_commands(command.commands, c[2])
-
-            case CommandType.While:
-                assert(isinstance(command, While))
-                c.append([])
-                self.encode_expression(command.expr, c[1])
-                self.encode_commands(command.commands, c[2])
-
-            case CommandType.Declare:
-                assert(isinstance(command, Declare))
-                c.append([])
-                self.encode_type_value(command.type, c[1])
-                self.encode_string(command.var_name, c[2])
-
-            case CommandType.Let:
-                assert(isinstance(command, Let))
-                c.append([])
-                self.encode_string(command.var_name, c[1])
-                self.encode_expression(command.value, c[2])
-
-            case CommandType.Print:
-                assert(isinstance(command, Print))
-                self.encode_expression(command.expr, c[1])
-
-            case CommandType.Input:
-                assert(isinstance(command, Input))
-                self.encode_string(command.var_name, c[1])
-
+        self.encode_commands([command], dest)
 
     def encode_expression(self, expr: Expression, dest: List):
-        e = dest
-        e.extend([[], []])
-        self.encode_type_value(expr.expr_type, e[0])
-
-        match expr.expr_type:
-            case ExpressionType.Variable:
-                assert(isinstance(expr, Variable))
-                self.encode_string(expr.var_name, e[1])
-
-            case ExpressionType.Add:
-                assert(isinstance(expr, Add))
-                e.append([])
-                self.encode_expression(expr.lhs, e[1])
-                self.encode_expression(expr.rhs, e[2])
-
-            case ExpressionType.Subtract:
-                assert(isinstance(expr, Subtract))
-                e.append([])
-                self.encode_expression(expr.lhs, e[1])
-                self.encode_expression(expr.rhs, e[2])
-
-            case ExpressionType.Multiply:
-                assert(isinstance(expr, Multiply))
-                e.append([])
-                self.encode_expression(expr.lhs, e[1])
-                self.encode_expression(expr.rhs, e[2])
-
-            case ExpressionType.Divide:
-                assert(isinstance(expr, Divide))
-                e.append([])
-                self.encode_expression(expr.lhs, e[1])
-                self.encode_expression(expr.rhs, e[2])
-
-            case ExpressionType.LiteralValue:
-                assert(isinstance(expr, Lit))
-                self.encode_type_value(expr.lit_type, e[1])
-                e.append([])
-
-                match expr.lit_type:
-                    case TypeType.Int:
-                        assert(isinstance(expr, IntLit))
-                        self.encode_int(expr.value, e[2])
-
-                    case TypeType.Float:
-                        assert(isinstance(expr, FloatLit))
-                        self.encode_float(expr.value, e[2])
-
-                    case TypeType.String:
-                        assert(isinstance(expr, StrLit))
-                        self.encode_string(expr.value, e[2])
-
-                    case TypeType.Char:
-                        assert(isinstance(expr, CharLit))
-                        self.encode_char(expr.value, e[2])
-
-            case ExpressionType.EqualTo:
-                assert(isinstance(expr, EqualTo))
-                e.append([])
-                self.encode_expression(expr.lhs, e[1])
-                self.encode_expression(expr.rhs, e[2])
-
-            case ExpressionType.GreaterThan:
-                assert(isinstance(expr, GreaterThan))
-                e.append([])
-                self.encode_expression(expr.lhs, e[1])
-                self.encode_expression(expr.rhs, e[2])
-
-            case ExpressionType.LessThan:
-                assert(isinstance(expr, LessThan))
-                e.append([])
-                self.encode_expression(expr.lhs, e[1])
-                self.encode_expression(expr.rhs, e[2])
+        stack = [(expr, dest)]
+        while len(stack) > 0:
+            expr, e = stack.pop()
+            e.extend([[], []])
+            self.encode_type_value(expr.expr_type, e[0])
+
+            match expr.expr_type:
+                case ExpressionType.Variable:
+                    assert(isinstance(expr, Variable))
+                    self.encode_string(expr.var_name, e[1])
+
+                case ExpressionType.LiteralValue:
+                    assert(isinstance(expr, Lit))
+                    self.encode_type_value(expr.lit_type, e[1])
+                    e.append([])
+
+                    match expr.lit_type:
+                        case TypeType.Int:
+                            assert(isinstance(expr, IntLit))
+                            self.encode_int(expr.value, e[2])
+
+                        case TypeType.Float:
+                            assert(isinstance(expr, FloatLit))
+                            self.encode_float(expr.value, e[2])
+
+                        case TypeType.String:
+                            assert(isinstance(expr, StrLit))
+                            self.encode_string(expr.value, e[2])
+
+                        case TypeType.Char:
+                            assert(isinstance(expr, CharLit))
+                            self.encode_char(expr.value, e[2])
+
+                case ExpressionType.Add | ExpressionType.Subtract | ExpressionType.Multiply | ExpressionType.Divide | \
+                     ExpressionType.EqualTo | ExpressionType.GreaterThan | ExpressionType.LessThan:
+                    assert(isinstance(expr, (Add, Subtract, Multiply, Divide, EqualTo, GreaterThan, LessThan)))
+                    e.append([])
+                    stack.append((expr.rhs, e[2]))
+                    stack.append((expr.lhs, e[1]))
 
     def encode_int(self, value: int, dest: List):
         for i in range(8):
@@ -178,42 +207,175 @@ class FoldersCompiler:
         return [FoldersCompiler.folder_name_from_index(i) for i in range(len(l))]
 
     @staticmethod
-    def _write_structure_to_disk(base_dir: str, encoded: list):
-        if len(encoded) == 0:
-            return
+    def _write_structure_to_disk(base_dir: str, encoded: list) -> int:
+        folders_created = 0
+        stack = [(base_dir, encoded)]
+        while len(stack) > 0:
+            parent, sublists = stack.pop()
+            for i, sublist in enumerate(sublists):
+                folder = f"{parent}/{FoldersCompiler.folder_name_from_index(i)}"
+                mkdir(folder)
+                folders_created += 1
+                if len(sublist) > 0:
+                    stack.append((folder, sublist))
+        return folders_created
 
-        paths = [f"{base_dir}/{name}" for name in FoldersCompiler.list_to_names(encoded)]
-        getoutput(f"mkdir -p {' '.join(paths)}")
-        for path, sublist in zip(paths, encoded):
-            FoldersCompiler._write_structure_to_disk(path, sublist)
+    @staticmethod
+    def _write_structure_to_disk_parallel(base_dir: str, encoded: list, jobs: int) -> int:
+        # Create the top of the tree serially, breadth first, until there are enough independent
+        # subtrees to keep every worker busy, then create those subtrees concurrently
+        folders_created = 0
+        subtrees = [(base_dir, encoded)]
+        while 0 < len(subtrees) < jobs * 4:
+            next_subtrees = []
+            for parent, sublists in subtrees:
+                for i, sublist in enumerate(sublists):
+                    folder = f"{parent}/{FoldersCompiler.folder_name_from_index(i)}"
+                    mkdir(folder)
+                    folders_created += 1
+                    if len(sublist) > 0:
+                        next_subtrees.append((folder, sublist))
+            subtrees = next_subtrees
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            counts = executor.map(lambda subtree: FoldersCompiler._write_structure_to_disk(*subtree), subtrees)
+            return folders_created + sum(counts)
 
-    def compile(self, program: List[Command], write_to_disk = False, build_dir = "build"):
+    @staticmethod
+    def write_to_directory(build_dir: str, encoded: list, jobs: int = 1) -> WriteStats:
+        # Build inside a private directory next to the destination, then swap it into place, so the
+        # destination is never observed half-written. Where the swap can't be done in one step, the old
+        # tree is moved aside first and moved back if the new one can't take its place.
+        start = perf_counter()
+        build_dir = path.normpath(build_dir)
+        parent = path.dirname(build_dir) or "."
+        makedirs(parent, exist_ok=True)
+
+        staging_dir = mkdtemp(prefix=".folders-", dir=parent)
+        try:
+            build = f"{staging_dir}/build"
+            mkdir(build)
+            if jobs > 1:
+                folders_created = FoldersCompiler._write_structure_to_disk_parallel(build, encoded, jobs)
+            else:
+                folders_created = FoldersCompiler._write_structure_to_disk(build, encoded)
+            if not path.lexists(build_dir):
+                rename(build, build_dir)
+            elif not exchange_paths(build, build_dir):
+                rename(build_dir, f"{staging_dir}/previous")
+                try:
+                    rename(build, build_dir)
+                except OSError:
+                    rename(f"{staging_dir}/previous", build_dir)
+                    raise
+        finally:
+            try:
+                remove_tree(staging_dir)
+            except OSError:
+                pass
+
+        return WriteStats(folders_created, perf_counter() - start)
+
+    def compile(self, program: List[Command], write_to_disk = False, build_dir = "build", jobs = 1, optimize = False, minimize = False,
+                incremental = False, rescan = False):
+        folders_before = None
+        if optimize or minimize:
+            unoptimized = []
+            self.encode_commands(program, unoptimized)
+            folders_before = count_folders(unoptimized)
+
+        if optimize:
+            from optimizer import optimize_program
+            program = optimize_program(program)
+        if minimize:
+            from minimizer import minimize_program
+            program = minimize_program(program)
+
+        self.program = program
         out = []
         self.encode_commands(program, out)
+        if folders_before is not None:
+            self.folder_counts = FolderCounts(folders_before, count_folders(out))
 
-        if write_to_disk:
-            getoutput(f"rm -rf {build_dir}")
-            getoutput(f"mkdir -p {build_dir}")
-            FoldersCompiler._write_structure_to_disk(build_dir, out)
+        if write_to_disk and incremental:
+            from incremental import update_directory
+            self.write_stats = update_directory(build_dir, out, jobs, rescan)
+        elif write_to_disk:
+            self.write_stats = FoldersCompiler.write_to_directory(build_dir, out, jobs)
 
         return out
 
 if __name__ == "__main__":
     arg_parser = ArgumentParser()
     arg_parser.add_argument("--input", "-i", help="Input folderscript program", required=True)
-    arg_parser.add_argument("--output", "-o", help="Output directory", required=True)
+    arg_parser.add_argument("--output", "-o", help="Output directory")
+    arg_parser.add_argument("--emit-binary", help="Also write the program in the binary Folders format to this file")
+    arg_parser.add_argument("--emit-python", help="Also write the program as Python source to this file")
+    arg_parser.add_argument("--jobs", "-j", help="Number of threads creating folders", type=int, default=1)
+    arg_parser.add_argument("--parser", "-p", help="Folderscript parser to use (fast needs no parsy and reports errors by line and column)", choices=["parsy", "fast"], default="parsy")
+    arg_parser.add_argument("--optimize", "-O", help="Fold constants and remove dead code before compiling", action="store_true")
+    arg_parser.add_argument("--minimize", "-m", help="Rename variables and share literals to emit as few folders as possible", action="store_true")
+    arg_parser.add_argument("--incremental", help="Only create and remove the folders that changed since the last compile to --output", action="store_true")
+    arg_parser.add_argument("--rescan", help="With --incremental, scan --output for its folders instead of trusting the manifest, to repair edits made by hand", action="store_true")
+    arg_parser.add_argument("--source-map", help="Also write a source map beside each output, mapping its folders back to the script", action="store_true")
     arg_parser.add_argument("--verbose", "-v", help="Verbose mode", action="store_true")
     args = arg_parser.parse_args()
 
+    if args.output is None and args.emit_python is None and args.emit_binary is None:
+        arg_parser.error("at least one of --output, --emit-binary or --emit-python is required")
+
+    if args.rescan and not args.incremental:
+        arg_parser.error("--rescan requires --incremental")
+
     with open(args.input, "r") as f:
         script = f.read()
 
-    parsed = program_parser.parse(script)
+    if args.parser == "fast":
+        from fast_parser import parse_program, ParseError
+        try:
+            parsed = parse_program(script)
+        except ParseError as e:
+            arg_parser.exit(1, f"{args.input}: {e}\n")
+    else:
+        from parser import program_parser
+        parse_program = program_parser.parse
+        parsed = parse_program(script)
 
-    build_dir = args.output
     compiler = FoldersCompiler()
-    compiler.compile(parsed, True, build_dir)
-
-    if args.verbose:
-        folders_created = len([x for x in walk(build_dir)]) - 1
-        print(f"Program compiled to {folders_created} folders")
+    encoded = compiler.compile(parsed, args.output is not None, args.output, args.jobs, args.optimize, args.minimize,
+                               args.incremental, args.rescan)
+
+    if compiler.folder_counts is not None:
+        before, after = compiler.folder_counts
+        print(f"Folders: {before} before optimization, {after} after ({after / max(before, 1):.1%})")
+
+    if args.emit_python is not None:
+        from transpiler import transpile_program
+        # The program as compiled, after any optimization and minimization
+        assert(compiler.program is not None)
+        with open(args.emit_python, "w") as f:
+            f.write(transpile_program(compiler.program))
+
+    if args.emit_binary is not None:
+        from binary_format import write_binary
+        write_binary(args.emit_binary, encoded)
+
+    if args.source_map:
+        from source_map import write_source_map
+        assert(compiler.program is not None)
+        for program_path in [args.output, args.emit_binary]:
+            if program_path is not None:
+                # An incremental compile keeps the names folders were first written with
+                tree = None
+                if args.incremental and program_path == args.output:
+                    from incremental import written_tree
+                    tree = written_tree(args.output, args.jobs)
+                write_source_map(program_path, args.input, compiler.program, tree)
+
+    if args.output is not None and args.verbose:
+        assert(compiler.write_stats is not None)
+        folders_created, elapsed, folders_removed = compiler.write_stats
+        if args.incremental:
+            print(f"Program updated in {elapsed:.3f}s: {folders_created} folders created, {folders_removed} removed")
+        else:
+            print(f"Program compiled to {folders_created} folders in {elapsed:.3f}s")
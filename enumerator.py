@@ -1,92 +1,98 @@
-from os import scandir
-from folders_types import CommandType
-
-def get_dir(dir: str):
-    return sorted([d.path for d in scandir(dir) if d.is_dir()])
-
-def get_dir_count(dir: str):
-    return len([d.path for d in scandir(dir) if d.is_dir()])
-
-class Enumerator:
-    def __init__(self):
-        self.level = 0
-
-    def push_level(self):
-        self.level += 1
-
-    def pop_level(self):
-        self.level -= 1
-
-    def log(self, command_type: str, command_dir: str, arg: str = ""):
-        indent = " " * (4 * self.level)
-        print(f"[{command_dir:<25}] {indent}{command_type}{f'({arg})' if len(arg) else ''}")
-
-    def enumerate_commands(self, commands_dir: str):
-        command_paths = get_dir(commands_dir)
-        for command_dir in command_paths:
-            self.enumerate_command(command_dir)
-
-    def enumerate_command(self, command_dir: str):
-        c = get_dir(command_dir)
+import json
+import sys
+from argparse import ArgumentParser
+from typing import Dict, Iterator, NamedTuple, TextIO
+from folders_types import CommandType, TypeType, Span
+from loader import list_dir, scan_tree, decode_str, decode_expression
+from source_map import SourceMap, load_source_map
+
+# Disassembles a compiled program one command at a time. The tree is walked with an explicit stack of
+# directory listings rather than scanned up front, so memory use is bounded by the nesting depth of the
+# program (plus the expression being decoded), not its size, and deep nesting needs no recursion.
+
+class Record(NamedTuple):
+    path: str
+    depth: int
+    command: str
+    args: Dict[str, str]
+    span: Span | None = None
+
+def count_subfolders(folder_path: str) -> int:
+    return len(list_dir(folder_path))
+
+def decode_expression_at(folder_path: str) -> str:
+    return repr(decode_expression(scan_tree(folder_path)))
+
+def decode_str_at(folder_path: str) -> str:
+    return decode_str(scan_tree(folder_path))
+
+def enumerate_program(program_dir: str, source_map: SourceMap | None = None) -> Iterator[Record]:
+    for record in enumerate_commands(program_dir):
+        yield record if source_map is None else record._replace(span=source_map.lookup(record.path))
+
+def enumerate_commands(program_dir: str) -> Iterator[Record]:
+    stack = [iter(list_dir(program_dir))]
+    while len(stack) > 0:
+        command_dir = next(stack[-1], None)
+        if command_dir is None:
+            stack.pop()
+            continue
+
+        depth = len(stack) - 1
+        c = list_dir(command_dir)
         assert(len(c) >= 2)
-
-        command_type = c[0]
-        match get_dir_count(command_type):
+        match count_subfolders(c[0]):
             case CommandType.If:
-                self.log("If", command_dir)
                 assert(len(c) == 3)
-                self.push_level()
-                self.enumerate_commands(c[2])
-                self.pop_level()
+                yield Record(command_dir, depth, "If", {"condition": decode_expression_at(c[1])})
+                stack.append(iter(list_dir(c[2])))
 
             case CommandType.While:
-                self.log("While", command_dir)
                 assert(len(c) == 3)
-                self.push_level()
-                self.enumerate_commands(c[2])
-                self.pop_level()
+                yield Record(command_dir, depth, "While", {"condition": decode_expression_at(c[1])})
+                stack.append(iter(list_dir(c[2])))
 
             case CommandType.Declare:
                 assert(len(c) == 3)
-                var_name = self.eval_str(c[2])
-                self.log("Declare", command_dir, var_name)
+                var_type = TypeType(count_subfolders(c[1])).name
+                yield Record(command_dir, depth, "Declare", {"type": var_type, "var": decode_str_at(c[2])})
 
             case CommandType.Let:
                 assert(len(c) == 3)
-                var_name = self.eval_str(c[1])
-                self.log("Let", command_dir, var_name)
+                yield Record(command_dir, depth, "Let", {"var": decode_str_at(c[1]), "value": decode_expression_at(c[2])})
 
             case CommandType.Print:
-                self.log("Print", command_dir)
+                yield Record(command_dir, depth, "Print", {"value": decode_expression_at(c[1])})
 
             case CommandType.Input:
-                var_name = self.eval_str(c[1])
-                self.log("Input", command_dir, var_name)
+                yield Record(command_dir, depth, "Input", {"var": decode_str_at(c[1])})
 
-            case _:
+            case command_type:
                 raise Exception(f"Invalid command: {command_type}")
 
-    def eval_str(self, str_dir: str):
-        bs = get_dir(str_dir)
-        value = bytearray([])
-
-        for byte_dir in bs:
-            nibble_dirs = get_dir(byte_dir)
-            assert(len(nibble_dirs) == 2)
-            value.append((self.eval_nibble(nibble_dirs[0]) << 4) | self.eval_nibble(nibble_dirs[1]))
-
-        return value.decode("utf-8")
-
-    def eval_nibble(self, nibble_dir: str):
-        n = get_dir(nibble_dir)
-        assert(len(n) == 4)
-
-        nibble = 0
-        for i, bit_dir in enumerate(n):
-            nibble |= get_dir_count(bit_dir) << (3 - i)
-        return nibble
-
-
-program_dir = "build"
-enumerator = Enumerator()
-enumerator.enumerate_commands(program_dir)
+def format_record(record: Record) -> str:
+    indent = " " * (4 * record.depth)
+    args = ", ".join(record.args.values())
+    line = f"[{record.path:<25}] {indent}{record.command}{f'({args})' if len(args) else ''}"
+    return line if record.span is None else f"{line}  # line {record.span.line}"
+
+def write_records(records: Iterator[Record], out: TextIO, as_json: bool = False):
+    for record in records:
+        out.write(json.dumps(record._asdict()) if as_json else format_record(record))
+        out.write("\n")
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser(description="Disassemble a compiled Folders program")
+    arg_parser.add_argument("program_dir", help="Directory of the compiled program", nargs="?", default="build")
+    arg_parser.add_argument("--json", "-J", help="Write one JSON object per command (JSON lines)", action="store_true")
+    arg_parser.add_argument("--output", "-o", help="Write to this file instead of stdout")
+    arg_parser.add_argument("--no-source-map", help="Don't annotate commands with their lines from the program's source map", action="store_true")
+    args = arg_parser.parse_args()
+
+    source_map = None if args.no_source_map else load_source_map(args.program_dir)
+    records = enumerate_program(args.program_dir, source_map)
+    if args.output is None:
+        write_records(records, sys.stdout, args.json)
+    else:
+        with open(args.output, "w") as f:
+            write_records(records, f, args.json)
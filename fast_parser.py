@@ -0,0 +1,267 @@
+import re
+from typing import Dict, List, NamedTuple, Type
+from folders_types import Span, TypeType, Command, Expression, If, While, Declare, Let, Print, Input, \
+    IntLit, FloatLit, StrLit, CharLit, EqualTo, LessThan, GreaterThan, Add, Subtract, Multiply, \
+    Divide, Variable
+
+# A folderscript parser that doesn't need parsy: a tokenizer that tracks indentation itself and emits
+# INDENT and DEDENT tokens, and a recursive descent parser that handles binary operators by precedence
+# climbing. Every source line is scanned once and nothing is ever re-parsed, so parse time is linear
+# in the size of the script. It produces the same folders_types AST as parser.program_parser.
+
+class ParseError(Exception):
+    def __init__(self, message: str, line: int, column: int):
+        super().__init__(f"line {line}, column {column}: {message}")
+        self.message = message
+        self.line = line
+        self.column = column
+
+class Token(NamedTuple):
+    kind: str
+    value: str
+    line: int
+    column: int
+
+NAME    = "name"
+INT     = "int"
+FLOAT   = "float"
+STRING  = "string"
+CHAR    = "char"
+OP      = "op"
+NEWLINE = "newline"
+INDENT  = "indent"
+DEDENT  = "dedent"
+EOF     = "eof"
+
+INDENT_WIDTH = 4
+
+token_pattern = re.compile(r"""
+    (?P<space>[ \t]+)
+  | (?P<comment>\#.*)
+  | (?P<float>\d+\.\d+)
+  | (?P<int>\d+)
+  | (?P<name>[a-zA-Z_][a-zA-Z0-9_]*)
+  | (?P<string>"(?:\\.|[^"\\])*")
+  | (?P<char>'(?:\\.|[^'\\])+')
+  | (?P<op>==|[-+*/<>=():])
+""", re.VERBOSE)
+
+line_pattern = re.compile(r"\r\n|\r|\n")
+
+def tokenize(source: str) -> List[Token]:
+    tokens: List[Token] = []
+    indents = [0]
+
+    for line_number, line in enumerate(line_pattern.split(source), 1):
+        stripped = line.lstrip(" \t")
+        if len(stripped) == 0 or stripped[0] == "#":
+            continue
+
+        indent = len(line) - len(stripped)
+        if "\t" in line[:indent]:
+            raise ParseError("Tabs can't be used for indentation", line_number, 1)
+        if indent % INDENT_WIDTH != 0:
+            raise ParseError(f"Indentation must be a multiple of {INDENT_WIDTH} spaces", line_number, 1)
+        if indent > indents[-1]:
+            if indent != indents[-1] + INDENT_WIDTH:
+                raise ParseError("Unexpected indent", line_number, 1)
+            indents.append(indent)
+            tokens.append(Token(INDENT, "", line_number, 1))
+        while indent < indents[-1]:
+            indents.pop()
+            tokens.append(Token(DEDENT, "", line_number, indent + 1))
+
+        pos = indent
+        while pos < len(line):
+            match = token_pattern.match(line, pos)
+            if match is None:
+                raise ParseError(f"Unexpected character {line[pos]!r}", line_number, pos + 1)
+            kind = match.lastgroup
+            if kind == "comment":
+                break
+            if kind != "space":
+                tokens.append(Token(kind, match.group(), line_number, pos + 1)) # type: ignore
+            pos = match.end()
+        tokens.append(Token(NEWLINE, "", line_number, len(line) + 1))
+
+    end_line = tokens[-1].line + 1 if len(tokens) > 0 else 1
+    for _ in indents[1:]:
+        tokens.append(Token(DEDENT, "", end_line, 1))
+    tokens.append(Token(EOF, "", end_line, 1))
+    return tokens
+
+def unescape(s: str):
+    return s.encode().decode("unicode_escape")
+
+type_names = {
+    "int": TypeType.Int,
+    "float": TypeType.Float,
+    "char": TypeType.Char,
+    "string": TypeType.String,
+}
+
+# Binding power of each binary operator; all of them are left associative
+precedences = {
+    "==": 1,
+    "<": 2,
+    ">": 2,
+    "+": 3,
+    "-": 3,
+    "*": 4,
+    "/": 4,
+}
+
+binary_nodes: Dict[str, Type[Expression]] = {
+    "==": EqualTo,
+    "<": LessThan,
+    ">": GreaterThan,
+    "+": Add,
+    "-": Subtract,
+    "*": Multiply,
+    "/": Divide,
+}
+
+class Parser:
+    def __init__(self, tokens: List[Token]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset: int = 0) -> Token:
+        return self.tokens[min(self.pos + offset, len(self.tokens) - 1)]
+
+    def advance(self) -> Token:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def error(self, expected: str, token: Token | None = None):
+        token = self.peek() if token is None else token
+        found = token.kind if token.value == "" else repr(token.value)
+        raise ParseError(f"Expected {expected}, found {found}", token.line, token.column)
+
+    def expect(self, kind: str, value: str | None = None) -> Token:
+        token = self.peek()
+        if token.kind != kind or (value is not None and token.value != value):
+            self.error(repr(value) if value is not None else kind)
+        return self.advance()
+
+    # Gives `node` the span from `start` to the end of the last token consumed
+    def located(self, node, start: Token):
+        end = self.tokens[self.pos - 1]
+        node.span = Span(start.line, start.column, end.line, end.column + len(end.value))
+        return node
+
+    def is_op(self, value: str, offset: int = 0) -> bool:
+        token = self.peek(offset)
+        return token.kind == OP and token.value == value
+
+    def parse_program(self) -> List[Command]:
+        commands = []
+        while self.peek().kind != EOF:
+            commands.append(self.parse_command())
+        return commands
+
+    def parse_block(self) -> List[Command]:
+        self.expect(NEWLINE)
+        self.expect(INDENT)
+        commands = []
+        while self.peek().kind != DEDENT:
+            commands.append(self.parse_command())
+        self.advance()
+        return commands
+
+    def parse_command(self) -> Command:
+        token = self.peek()
+        if token.kind != NAME:
+            self.error("a command")
+
+        command: Command
+        if self.is_op("=", 1):
+            self.advance()
+            self.advance()
+            command = Let(token.value, self.parse_expression())
+        elif token.value in ["if", "while"]:
+            self.advance()
+            expr = self.parse_expression()
+            self.expect(OP, ":")
+            commands = self.parse_block()
+            command = If(expr, commands) if token.value == "if" else While(expr, commands)
+            end = commands[-1].span
+            assert(end is not None)
+            command.span = Span(token.line, token.column, end.end_line, end.end_column)
+            return command
+        elif token.value in type_names and self.peek(1).kind == NAME:
+            self.advance()
+            command = Declare(type_names[token.value], self.advance().value)
+        elif token.value == "print" and self.is_op("(", 1):
+            self.advance()
+            command = Print(self.parse_primary())
+        elif token.value == "input" and self.is_op("(", 1):
+            self.advance()
+            self.advance()
+            var_name = self.expect(NAME).value
+            self.expect(OP, ")")
+            command = Input(var_name)
+        else:
+            self.error("a command", self.peek(1))
+
+        self.located(command, token)
+        self.expect(NEWLINE)
+        return command
+
+    def parse_expression(self, min_precedence: int = 1) -> Expression:
+        lhs = self.parse_primary()
+        while True:
+            token = self.peek()
+            precedence = precedences.get(token.value, 0) if token.kind == OP else 0
+            if precedence < min_precedence:
+                return lhs
+            self.advance()
+            rhs = self.parse_expression(precedence + 1)
+            expr = binary_nodes[token.value](lhs, rhs) # type: ignore
+            expr.span = Span(lhs.span.line, lhs.span.column, rhs.span.end_line, rhs.span.end_column) # type: ignore
+            lhs = expr
+
+    def parse_primary(self) -> Expression:
+        token = self.peek()
+        expr = self.parse_operand()
+        return expr if token.kind == OP and token.value == "(" else self.located(expr, token)
+
+    def parse_operand(self) -> Expression:
+        token = self.advance()
+        if token.kind == NAME:
+            return Variable(token.value)
+        if token.kind == INT:
+            return self.int_literal(token, token.value)
+        if token.kind == FLOAT:
+            return FloatLit(float(token.value))
+        if token.kind == STRING:
+            return StrLit(unescape(token.value[1:-1]))
+        if token.kind == CHAR:
+            value = unescape(token.value[1:-1])
+            if len(value) != 1:
+                raise ParseError(f"Invalid char literal {token.value}", token.line, token.column)
+            return CharLit(value)
+        if token.kind == OP and token.value == "(":
+            expr = self.parse_expression()
+            self.expect(OP, ")")
+            return expr
+        if token.kind == OP and token.value == "-":
+            # A minus sign written directly before a number is part of the literal
+            number = self.peek()
+            if number.kind in [INT, FLOAT] and number.line == token.line and number.column == token.column + 1:
+                self.advance()
+                if number.kind == INT:
+                    return self.int_literal(token, f"-{number.value}")
+                return FloatLit(float(f"-{number.value}"))
+        self.error("an expression", token)
+        assert(False)
+
+    def int_literal(self, token: Token, text: str) -> IntLit:
+        value = int(text)
+        if value < -2147483647 or value > 0xffffffff:
+            raise ParseError(f"Integer literal out of range: {text}", token.line, token.column)
+        return IntLit(value)
+
+def parse_program(source: str) -> List[Command]:
+    return Parser(tokenize(source)).parse_program()
@@ -1,5 +1,5 @@
 from enum import IntEnum
-from typing import List
+from typing import List, Callable, NamedTuple
 
 class CommandType(IntEnum):
     If           = 0
@@ -40,13 +40,28 @@ class TypeType(IntEnum):
             case _:
                 assert(False)
 
+# Where a node came from in the folderscript source; lines and columns start at 1 and the end is exclusive
+class Span(NamedTuple):
+    line: int
+    column: int
+    end_line: int
+    end_column: int
+
 class Command:
     def __init__(self, command_type: CommandType):
         self.command_type = command_type
+        self.path: str | None = None
+        self.span: Span | None = None
 
 class Expression:
     def __init__(self, expr_type: ExpressionType):
         self.expr_type = expr_type
+        self.path: str | None = None
+        self.span: Span | None = None
+        self.value_type: TypeType | None = None
+        self.operation: Callable | None = None
+        # Operators on the longest path down to a variable or literal, set by the type checker
+        self.height = 0
 
 # Commands
 class If(Command):
@@ -103,6 +118,20 @@ class Input(Command):
     def __repr__(self):
         return f"Input({self.var_name})"
 
+# Written out with an explicit stack, so expressions of any depth can be printed
+def expression_repr(expr: Expression) -> str:
+    parts: List[str] = []
+    stack: List[Expression | str] = [expr]
+    while len(stack) > 0:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+        elif item.expr_type in [ExpressionType.Variable, ExpressionType.LiteralValue]:
+            parts.append(repr(item))
+        else:
+            stack.extend([")", item.rhs, ", ", item.lhs, f"{type(item).__name__}("]) # type: ignore
+    return "".join(parts)
+
 # Expressions (Literals)
 class Lit(Expression):
     def __init__(self, lit_type: TypeType):
@@ -155,7 +184,7 @@ class EqualTo(Expression):
         self.rhs = rhs
 
     def __repr__(self):
-        return f"EqualTo({self.lhs}, {self.rhs})"
+        return expression_repr(self)
 
 class LessThan(Expression):
     def __init__(self, lhs: Expression, rhs: Expression):
@@ -164,7 +193,7 @@ class LessThan(Expression):
         self.rhs = rhs
 
     def __repr__(self):
-        return f"LessThan({self.lhs}, {self.rhs})"
+        return expression_repr(self)
 
 class GreaterThan(Expression):
     def __init__(self, lhs: Expression, rhs: Expression):
@@ -173,7 +202,7 @@ class GreaterThan(Expression):
         self.rhs = rhs
 
     def __repr__(self):
-        return f"GreaterThan({self.lhs}, {self.rhs})"
+        return expression_repr(self)
 
 # Expressions (Arithmetic)
 class Add(Expression):
@@ -183,7 +212,7 @@ class Add(Expression):
         self.rhs = rhs
 
     def __repr__(self):
-        return f"Add({self.lhs}, {self.rhs})"
+        return expression_repr(self)
 
 class Subtract(Expression):
     def __init__(self, lhs: Expression, rhs: Expression):
@@ -192,7 +221,7 @@ class Subtract(Expression):
         self.rhs = rhs
 
     def __repr__(self):
-        return f"Subtract({self.lhs}, {self.rhs})"
+        return expression_repr(self)
 
 class Multiply(Expression):
     def __init__(self, lhs: Expression, rhs: Expression):
@@ -201,7 +230,7 @@ class Multiply(Expression):
         self.rhs = rhs
 
     def __repr__(self):
-        return f"Multiply({self.lhs}, {self.rhs})"
+        return expression_repr(self)
 
 class Divide(Expression):
     def __init__(self, lhs: Expression, rhs: Expression):
@@ -210,7 +239,7 @@ class Divide(Expression):
         self.rhs = rhs
 
     def __repr__(self):
-        return f"Divide({self.lhs}, {self.rhs})"
+        return expression_repr(self)
 
 # Expressions (Variable)
 class Variable(Expression):
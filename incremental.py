@@ -0,0 +1,260 @@
+import marshal
+from difflib import SequenceMatcher
+from os import mkdir, stat, replace, getpid, path
+from time import perf_counter
+from typing import Dict, List, Tuple
+from loader import Folder, scan_tree
+from compiler import FoldersCompiler, WriteStats, remove_tree
+
+MANIFEST_VERSION = 1
+
+# Folder names only matter through their order, so a folder inserted between two others gets a name
+# that sorts between theirs and nothing else is renamed. Names use digits and lowercase letters, which
+# sort the same way by code point and in common locales, and never end in "0", so there is always a
+# name below any other.
+digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+def midpoint(lo: str, hi: str | None) -> str:
+    # A name strictly between lo ("" for no lower bound) and hi (None for no upper bound)
+    if hi is not None:
+        prefix = 0
+        while prefix < len(hi) and (lo[prefix] if prefix < len(lo) else digits[0]) == hi[prefix]:
+            prefix += 1
+        if prefix > 0:
+            return hi[:prefix] + midpoint(lo[prefix:], hi[prefix:])
+
+    digit_lo = digits.index(lo[0]) if len(lo) > 0 else 0
+    digit_hi = digits.index(hi[0]) if hi is not None else len(digits)
+    if digit_hi - digit_lo > 1:
+        return digits[(digit_lo + digit_hi) // 2]
+    if hi is not None and len(hi) > 1:
+        return hi[0]
+    return digits[digit_lo] + midpoint(lo[1:], None)
+
+# `count` names between lo and hi, bisecting so that they stay short
+def names_between(lo: str, hi: str | None, count: int) -> List[str]:
+    if count == 0:
+        return []
+    mid = midpoint(lo, hi)
+    below = count // 2
+    return names_between(lo, mid, below) + [mid] + names_between(mid, hi, count - below - 1)
+
+def manifest_path(build_dir: str) -> str:
+    build_dir = path.normpath(build_dir)
+    return path.join(path.dirname(build_dir), f".{path.basename(build_dir)}.folders-manifest")
+
+def root_identity(build_dir: str) -> Tuple[int, int]:
+    st = stat(build_dir)
+    return st.st_ino, st.st_mtime_ns
+
+# A folder of a compiled tree, known by its name rather than its path
+class Node(list):
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        super().__init__()
+        self.name = name
+
+def named_tree(tree: Folder) -> Node:
+    root = Node("")
+    stack = [(tree, root)]
+    while len(stack) > 0:
+        folder, node = stack.pop()
+        for child in folder:
+            child_node = Node(path.basename(child.path)) # type: ignore
+            node.append(child_node)
+            stack.append((child, child_node))
+    return root
+
+# The tree write_to_directory creates for `encoded`, without reading it back
+def canonical_tree(encoded: list) -> Node:
+    root = Node("")
+    stack = [(root, encoded)]
+    while len(stack) > 0:
+        parent, sublists = stack.pop()
+        for i, sublist in enumerate(sublists):
+            child = Node(FoldersCompiler.folder_name_from_index(i))
+            parent.append(child)
+            stack.append((child, sublist))
+    return root
+
+# The manifest records the name of every folder of a compiled tree, as the number of subfolders of
+# each folder in preorder followed by all the names, so the next incremental compile needn't scan the
+# tree. It lives next to the tree, so writing it doesn't touch the tree's timestamps. It is only
+# trusted while the tree's root is the same directory with the same mtime; edits made deeper in the
+# tree by hand aren't noticed (use rescan for those).
+def write_manifest(build_dir: str, tree: Node):
+    counts: List[int] = []
+    names: List[str] = []
+    stack = [tree]
+    while len(stack) > 0:
+        node = stack.pop()
+        counts.append(len(node))
+        names.extend([child.name for child in node])
+        stack.extend(reversed(node))
+
+    manifest = manifest_path(build_dir)
+    temp_path = f"{manifest}.{getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        marshal.dump((MANIFEST_VERSION, root_identity(build_dir), counts, names), f)
+    replace(temp_path, manifest)
+
+def read_manifest(build_dir: str) -> Node | None:
+    try:
+        with open(manifest_path(build_dir), "rb") as f:
+            version, identity, counts, names = marshal.load(f)
+        if version != MANIFEST_VERSION or tuple(identity) != root_identity(build_dir):
+            return None
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+    root = Node("")
+    next_count = iter(counts)
+    next_name = iter(names)
+    stack = [root]
+    while len(stack) > 0:
+        node = stack.pop()
+        count = next(next_count)
+        if count > 0:
+            node.extend([Node(next(next_name)) for _ in range(count)])
+            stack.extend(reversed(node))
+    return root
+
+# The names of the folders of a compiled tree, from its manifest, or by scanning it when there is none
+def written_tree(build_dir: str, jobs: int = 1) -> Node:
+    tree = read_manifest(build_dir)
+    return named_tree(scan_tree(build_dir, jobs)) if tree is None else tree
+
+# Gives every distinct folder structure in the trees a small integer, so subtrees can be compared by
+# identity (hash consing). The result maps id() of each folder to its structure. Every folder comes
+# after its parent in breadth first order, so numbering in reverse numbers children first.
+def number_structures(trees: List[list]) -> Dict[int, int]:
+    structures: Dict[tuple, int] = {}
+    ids: Dict[int, int] = {}
+    order = list(trees)
+    for folder in order:
+        order.extend(folder)
+    for folder in reversed(order):
+        key = tuple(map(ids.__getitem__, map(id, folder)))
+        ids[id(folder)] = structures.setdefault(key, len(structures))
+    return ids
+
+def count_tree(folder: list) -> int:
+    count = 0
+    stack = [folder]
+    while len(stack) > 0:
+        count += 1
+        stack.extend(stack.pop())
+    return count
+
+# Brings a compiled tree on disk in line with a newly encoded program, creating and removing only the
+# folders that differ. The children of each folder are diffed by structure: unchanged subtrees are
+# kept, subtrees that replace one another are diffed in turn, and the rest are removed or created.
+# Unlike write_to_directory this edits the tree in place.
+class IncrementalWriter:
+    def __init__(self):
+        self.folders_created = 0
+        self.folders_removed = 0
+
+    def create(self, folder_path: str, name: str, encoded: list) -> Node:
+        mkdir(folder_path)
+        self.folders_created += 1
+        created = Node(name)
+        stack = [(folder_path, created, encoded)]
+        while len(stack) > 0:
+            parent_path, parent, sublists = stack.pop()
+            for i, sublist in enumerate(sublists):
+                child = Node(FoldersCompiler.folder_name_from_index(i))
+                child_path = f"{parent_path}/{child.name}"
+                mkdir(child_path)
+                self.folders_created += 1
+                parent.append(child)
+                if len(sublist) > 0:
+                    stack.append((child_path, child, sublist))
+        return created
+
+    def remove(self, folder_path: str, node: Node):
+        self.folders_removed += count_tree(node)
+        remove_tree(folder_path)
+
+    def update(self, build_dir: str, current: Node, encoded: list) -> Node:
+        ids = number_structures([current, encoded])
+        updated = Node(current.name)
+        stack = [(build_dir, current, encoded, updated)]
+        while len(stack) > 0:
+            folder_path, old, new, result = stack.pop()
+            old_ids = [ids[id(child)] for child in old]
+            new_ids = [ids[id(child)] for child in new]
+            if old_ids == new_ids:
+                result.extend(old)
+                continue
+
+            # Only the middle, between the common prefix and suffix, needs diffing
+            start = 0
+            while start < min(len(old_ids), len(new_ids)) and old_ids[start] == new_ids[start]:
+                start += 1
+            end = 0
+            while end < min(len(old_ids), len(new_ids)) - start and old_ids[-1 - end] == new_ids[-1 - end]:
+                end += 1
+
+            matcher = SequenceMatcher(None, old_ids[start:len(old_ids) - end], new_ids[start:len(new_ids) - end], autojunk=False)
+            # (old child or None, new sublist or None) in their final order
+            plan: List[Tuple[Node | None, list | None]] = [(child, None) for child in old[:start]]
+            removed: List[Node] = []
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                i1, i2, j1, j2 = i1 + start, i2 + start, j1 + start, j2 + start
+                if tag == "equal":
+                    plan.extend((child, None) for child in old[i1:i2])
+                    continue
+                paired = min(i2 - i1, j2 - j1)
+                plan.extend(zip(old[i1:i1 + paired], new[j1:j1 + paired]))
+                removed.extend(old[i1 + paired:i2])
+                plan.extend((None, sublist) for sublist in new[j1 + paired:j2])
+            plan.extend((child, None) for child in old[len(old) - end:])
+
+            # Removals go first, so a new folder can reuse a removed folder's name
+            for node in removed:
+                self.remove(f"{folder_path}/{node.name}", node)
+
+            i = 0
+            while i < len(plan):
+                child, sublist = plan[i]
+                if child is not None:
+                    if sublist is None:
+                        result.append(child)
+                    else:
+                        replacement = Node(child.name)
+                        result.append(replacement)
+                        stack.append((f"{folder_path}/{child.name}", child, sublist, replacement))
+                    i += 1
+                    continue
+
+                # A run of new folders, named between the folders around them
+                run_end = i
+                while run_end < len(plan) and plan[run_end][0] is None:
+                    run_end += 1
+                lo = result[-1].name if len(result) > 0 else ""
+                hi = plan[run_end][0].name if run_end < len(plan) else None # type: ignore
+                for name, (_, sublist) in zip(names_between(lo, hi, run_end - i), plan[i:run_end]):
+                    result.append(self.create(f"{folder_path}/{name}", name, sublist)) # type: ignore
+                i = run_end
+
+        return updated
+
+def update_directory(build_dir: str, encoded: list, jobs: int = 1, rescan: bool = False) -> WriteStats:
+    start = perf_counter()
+    build_dir = path.normpath(build_dir)
+
+    if not path.isdir(build_dir):
+        stats = FoldersCompiler.write_to_directory(build_dir, encoded, jobs)
+        write_manifest(build_dir, canonical_tree(encoded))
+        return WriteStats(stats.folders_created, perf_counter() - start)
+
+    current = None if rescan else read_manifest(build_dir)
+    if current is None:
+        current = named_tree(scan_tree(build_dir, jobs))
+
+    writer = IncrementalWriter()
+    updated = writer.update(build_dir, current, encoded)
+    write_manifest(build_dir, updated)
+    return WriteStats(writer.folders_created, perf_counter() - start, writer.folders_removed)
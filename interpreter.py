@@ -1,30 +1,22 @@
-from os import scandir
-from typing import Dict, Callable, List
+from os import scandir, path
+from sys import stderr, intern
+from typing import Dict, Callable, Iterator, List, Tuple
 from struct import unpack
+from types import TracebackType
 from argparse import ArgumentParser
-from folders_types import CommandType, ExpressionType, TypeType
-
-dir_cache = {}
-len_cache = {}
-expr_type_cache = {}
-expr_cache = {}
-
-def get_dir(dir: str) -> List[str]:
-    if dir in dir_cache:
-        return dir_cache[dir]
-    dirs = sorted([d.path for d in scandir(dir) if d.is_dir()])
-    dir_cache[dir] = dirs
-    return dirs
-
-def get_dir_count(dir: str) -> int:
-    if dir in len_cache:
-        return len_cache[dir]
-    dir_len = len([d.path for d in scandir(dir) if d.is_dir()])
-    len_cache[dir] = dir_len
-    return dir_len
-
-def get_dir_count_no_cache(dir: str):
-    return len([d.path for d in scandir(dir) if d.is_dir()])
+from folders_types import CommandType, ExpressionType, TypeType, Command, Expression, If, While, \
+    Declare, Let, Print, Input, Lit, Variable
+from loader import load_program, binary_expressions
+from typechecker import check_program
+from caches import LRUCache, MISSING
+from output import Output, UnbufferedOutput, make_output, DEFAULT_BUFFER_SIZE
+
+# The folder caches are unbounded unless limited, as they are freed along with their interpreter
+DEFAULT_CACHE_SIZE: int | None = None
+
+# Expressions up to this many operators deep are evaluated by recursion, which is quickest; deeper ones
+# with an explicit stack, so they aren't limited by the Python recursion limit
+MAX_RECURSIVE_HEIGHT = 64
 
 def as_i32(v: int):
     v &= 0xffffffff
@@ -75,41 +67,231 @@ class Var:
                 self.value = 0.0
 
 class Interpreter:
-    def __init__(self):
+    def __init__(self, output: Output | None = None, cache_size: int | None = DEFAULT_CACHE_SIZE, live: bool = False,
+                 count_hits: bool = False):
         self.vars: Dict[str, Var] = {}
+        self.output = UnbufferedOutput() if output is None else output
+
+        # Folder caches used when executing directly from disk, owned by this interpreter. In live
+        # mode nothing is cached, so every folder is reread when it is reached and a program can
+        # modify its own folders while it runs. Counting cache hits and misses slows every lookup, so it
+        # is only done when asked for.
+        self.live = live
+        if live:
+            cache_size = 0
+        self.dir_cache = LRUCache(cache_size, count_hits)
+        self.len_cache = LRUCache(cache_size, count_hits)
+        self.expr_type_cache = LRUCache(cache_size, count_hits)
+        self.expr_cache = LRUCache(cache_size, count_hits)
+        self.decoded_cache = LRUCache(cache_size, count_hits)
+
+    # Execution of a program that has already been loaded into memory (see loader.py)
+    def run_program(self, program: List[Command]):
+        check_program(program)
+        try:
+            self.run_commands(program)
+        finally:
+            self.output.flush()
+
+    # Blocks are run with an explicit stack rather than by recursion, so they can be nested to any depth.
+    # run_command returns the body of an If or While whose condition holds, which is pushed along with
+    # its command; once the body has run, leave_block is called with the command, and a While runs again.
+    def run_commands(self, commands: List[Command]):
+        run_command = self.run_command
+        blocks: List[Tuple[Iterator[Command], Command | None]] = [(iter(commands), None)]
+        while len(blocks) > 0:
+            block, owner = blocks[-1]
+            for command in block:
+                body = run_command(command)
+                if body is not None:
+                    blocks.append((iter(body), command))
+                    break
+            else:
+                blocks.pop()
+                if owner is not None:
+                    body = self.leave_block(owner)
+                    if body is not None:
+                        blocks.append((iter(body), owner))
+
+    def leave_block(self, command: Command) -> List[Command] | None:
+        if command.command_type == CommandType.While:
+            return self.run_command(command)
+        return None
+
+    def run_command(self, command: Command) -> List[Command] | None:
+        match command.command_type:
+            case CommandType.If:
+                assert(isinstance(command, If))
+                if self.evaluate(command.expr):
+                    return command.commands
 
-    def execute_commands(self, commands_dir: str):
-        command_paths = get_dir(commands_dir)
-        for command_dir in command_paths:
-            self.execute_command(command_dir)
+            case CommandType.While:
+                assert(isinstance(command, While))
+                if self.evaluate(command.expr):
+                    return command.commands
+
+            case CommandType.Declare:
+                assert(isinstance(command, Declare))
+                assert(command.var_name not in self.vars)
+                self.vars[command.var_name] = Var(command.type)
 
-    def execute_command(self, command_dir: str):
-        c = get_dir(command_dir)
+            case CommandType.Let:
+                assert(isinstance(command, Let))
+                assert(command.var_name in self.vars)
+                self.vars[command.var_name].value = self.evaluate(command.value) # type: ignore
+
+            case CommandType.Print:
+                assert(isinstance(command, Print))
+                self.output.write(self.evaluate(command.expr))
+
+            case CommandType.Input:
+                assert(isinstance(command, Input))
+                assert(command.var_name in self.vars)
+                self.read_input(self.vars[command.var_name])
+
+            case _:
+                raise Exception(f"Invalid command: {command.command_type}")
+        return None
+
+    def read_input(self, var: Var):
+        self.output.flush()
+        input_value = input()
+        match var.type:
+            case TypeType.Int:
+                var.value = int(input_value)
+            case TypeType.Char:
+                var.value = str(input_value)[0]
+            case TypeType.String:
+                var.value = str(input_value)
+            case TypeType.Float:
+                var.value = float(input_value)
+
+    def evaluate(self, expr: Expression):
+        match expr.expr_type:
+            case ExpressionType.Variable:
+                assert(isinstance(expr, Variable))
+                return self.vars[expr.var_name].value
+
+            case ExpressionType.LiteralValue:
+                assert(isinstance(expr, Lit))
+                if expr.lit_type == TypeType.Int:
+                    return as_i32(expr.value) # type: ignore
+                return expr.value # type: ignore
+
+            case _:
+                # Arithmetic and comparisons, specialised for their operand types by the type checker
+                if expr.height <= MAX_RECURSIVE_HEIGHT:
+                    return expr.operation(self.evaluate(expr.lhs), self.evaluate(expr.rhs)) # type: ignore
+                return self.evaluate_deep(expr)
+
+    # Expressions too deep to evaluate by recursion are walked with an explicit stack, left to right,
+    # down to subexpressions that are shallow enough again
+    def evaluate_deep(self, expr: Expression):
+        values: List[int | float | str] = []
+        stack = [(expr, False)]
+        while len(stack) > 0:
+            expr, operands_ready = stack.pop()
+            if operands_ready:
+                rhs = values.pop()
+                values[-1] = expr.operation(values[-1], rhs) # type: ignore
+            elif expr.height <= MAX_RECURSIVE_HEIGHT:
+                values.append(self.evaluate(expr))
+            else:
+                stack.append((expr, True))
+                stack.append((expr.rhs, False)) # type: ignore
+                stack.append((expr.lhs, False)) # type: ignore
+        return values[0]
+
+    # Direct execution of a program on disk, reading folders as they are reached
+    def run_directory(self, program_dir: str):
+        try:
+            self.execute_commands(program_dir)
+        finally:
+            self.output.flush()
+
+    def get_dir(self, dir: str) -> List[str]:
+        dirs = self.dir_cache.lookup(dir, MISSING)
+        if dirs is MISSING:
+            dirs = sorted([d.path for d in scandir(dir) if d.is_dir()])
+            self.dir_cache.put(dir, dirs)
+        return dirs
+
+    def get_dir_count(self, dir: str) -> int:
+        dir_len = self.len_cache.lookup(dir, MISSING)
+        if dir_len is MISSING:
+            dir_len = len([d.path for d in scandir(dir) if d.is_dir()])
+            self.len_cache.put(dir, dir_len)
+        return dir_len
+
+    def cache_expr_type(self, expr_dir: str, expr_type: TypeType) -> TypeType:
+        self.expr_type_cache.put(expr_dir, expr_type)
+        return expr_type
+
+    def caches(self) -> Dict[str, LRUCache]:
+        return {
+            "dir_cache": self.dir_cache,
+            "len_cache": self.len_cache,
+            "expr_type_cache": self.expr_type_cache,
+            "expr_cache": self.expr_cache,
+            "decoded_cache": self.decoded_cache,
+        }
+
+    def cache_stats(self) -> Dict[str, Dict[str, int | None]]:
+        return { name: cache.stats() for name, cache in self.caches().items() }
+
+    # Forgets everything cached about `path` and the folders below it, or everything when no path is given
+    def invalidate_caches(self, path: str | None = None):
+        for cache in self.caches().values():
+            if path is None:
+                cache.clear()
+            else:
+                cache.invalidate_prefix(path)
+
+    # As run_commands, with execute_command returning the folder of the body to run. The type of a
+    # command is read again when its body has run, since in live mode the program can have changed it.
+    def execute_commands(self, commands_dir: str):
+        execute_command = self.execute_command
+        blocks: List[Tuple[Iterator[str], str | None]] = [(iter(self.get_dir(commands_dir)), None)]
+        while len(blocks) > 0:
+            block, owner = blocks[-1]
+            for command_dir in block:
+                body_dir = execute_command(command_dir)
+                if body_dir is not None:
+                    blocks.append((iter(self.get_dir(body_dir)), command_dir))
+                    break
+            else:
+                blocks.pop()
+                if owner is not None:
+                    body_dir = self.leave_block_dir(owner)
+                    if body_dir is not None:
+                        blocks.append((iter(self.get_dir(body_dir)), owner))
+
+    def leave_block_dir(self, command_dir: str) -> str | None:
+        if self.get_dir_count(self.get_dir(command_dir)[0]) == CommandType.While:
+            return self.execute_command(command_dir)
+        return None
+
+    def execute_command(self, command_dir: str) -> str | None:
+        c = self.get_dir(command_dir)
         assert(len(c) >= 2)
 
         command_type = c[0]
-        match get_dir_count(command_type):
-            case CommandType.If:
-                assert(len(c) == 3)
-                condition = self.eval_expression(c[1])
-                if condition:
-                    self.execute_commands(c[2])
-
-            case CommandType.While:
+        match self.get_dir_count(command_type):
+            case CommandType.If | CommandType.While:
                 assert(len(c) == 3)
-                while self.eval_expression(c[1]):
-                    self.execute_commands(c[2])
+                if self.eval_expression(c[1]):
+                    return c[2]
 
             case CommandType.Declare:
                 assert(len(c) == 3)
-                type_type = TypeType(get_dir_count(c[1]))
-                var_name = self.eval_str(command_dir, c[2])
+                type_type = TypeType(self.get_dir_count(c[1]))
+                var_name = self.eval_str(c[2])
                 assert(var_name not in self.vars)
                 self.vars[var_name] = Var(type_type)
 
             case CommandType.Let:
                 assert(len(c) == 3)
-                var_name = self.eval_str(command_dir, c[1])
+                var_name = self.eval_str(c[1])
                 assert(var_name in self.vars)
 
                 expr_value = self.eval_expression(c[2])
@@ -117,12 +299,13 @@ class Interpreter:
 
             case CommandType.Print:
                 value = self.eval_expression(c[1])
-                print(value, end="")
+                self.output.write(value)
 
             case CommandType.Input:
-                var_name = self.eval_str(command_dir, c[1])
+                var_name = self.eval_str(c[1])
                 assert(var_name in self.vars)
 
+                self.output.flush()
                 input_value = input()
                 match self.vars[var_name].type:
                     case TypeType.Int:
@@ -136,30 +319,100 @@ class Interpreter:
 
             case _:
                 raise Exception(f"Invalid command: {command_type}")
+        return None
 
     def expression_is_literal(self, expr_dir: str):
-        e = get_dir(expr_dir)
-        return get_dir_count(e[0]) == ExpressionType.LiteralValue
+        e = self.get_dir(expr_dir)
+        return self.get_dir_count(e[0]) == ExpressionType.LiteralValue
 
-    def eval_expression(self, expr_dir: str):
-        if expr_dir in expr_cache:
-            return expr_cache[expr_dir]
+    # Operands are evaluated by recursion until `depth` (the operators above this expression in its
+    # statement) reaches MAX_RECURSIVE_HEIGHT, as in evaluate, and the rest with an explicit stack
+    def eval_expression(self, expr_dir: str, depth: int = 0):
+        value = self.expr_cache.lookup(expr_dir, MISSING)
+        if value is not MISSING:
+            return value
 
-        e = get_dir(expr_dir)
+        e = self.get_dir(expr_dir)
         assert(len(e) >= 2)
+        expr_type = self.get_dir_count(e[0])
+        if expr_type == ExpressionType.Variable:
+            return self.vars[self.eval_str(e[1])].value
+        if expr_type not in binary_expressions:
+            return self.eval_leaf(expr_dir, e)
+        if depth >= MAX_RECURSIVE_HEIGHT:
+            return self.eval_expression_deep(expr_dir)
+
+        assert(len(e) == 3)
+        lhs = self.eval_expression(e[1], depth + 1)
+        rhs = self.eval_expression(e[2], depth + 1)
+        return self.eval_operation(expr_dir, e, expr_type, lhs, rhs)
+
+    # The rest of an expression is walked with an explicit stack, left to right. An expression is pushed
+    # again with its subfolders once its operands are being evaluated.
+    def eval_expression_deep(self, expr_dir: str):
+        values: List[int | float | str] = []
+        stack: List[Tuple[str, List[str] | None]] = [(expr_dir, None)]
+        while len(stack) > 0:
+            expr_dir, e = stack.pop()
+            if e is not None:
+                rhs = values.pop()
+                values[-1] = self.eval_operation(expr_dir, e, self.get_dir_count(e[0]), values[-1], rhs)
+                continue
+
+            value = self.expr_cache.lookup(expr_dir, MISSING)
+            if value is not MISSING:
+                values.append(value)
+                continue
+
+            e = self.get_dir(expr_dir)
+            assert(len(e) >= 2)
+            if self.get_dir_count(e[0]) in binary_expressions:
+                assert(len(e) == 3)
+                stack.append((expr_dir, e))
+                stack.append((e[2], None))
+                stack.append((e[1], None))
+            else:
+                values.append(self.eval_leaf(expr_dir, e))
+        return values[0]
 
+    # Variables and literals
+    def eval_leaf(self, expr_dir: str, e: List[str]):
         expr_type = e[0]
-        match get_dir_count(expr_type):
+        match self.get_dir_count(expr_type):
             case ExpressionType.Variable:
-                var_name = self.eval_str(expr_dir + "_var", e[1])
+                var_name = self.eval_str(e[1])
                 assert(var_name in self.vars)
                 return self.vars[var_name].value
 
-            case ExpressionType.Add:
+            case ExpressionType.LiteralValue:
                 assert(len(e) == 3)
-                lhs = self.eval_expression(e[1])
-                rhs = self.eval_expression(e[2])
+                lit_type = self.get_dir_count(e[1])
+                match lit_type:
+                    case TypeType.Int:
+                        value = self.eval_int(e[2])
+
+                    case TypeType.Float:
+                        value = self.eval_float(e[2])
+
+                    case TypeType.String:
+                        return self.eval_str(e[2])
+
+                    case TypeType.Char:
+                        value = self.eval_char(e[2])
 
+                    case _:
+                        raise Exception(f"Invalid literal: {lit_type}")
+
+                self.expr_cache.put(expr_dir, value)
+                return value
+
+            case _:
+                raise Exception(f"Invalid expression: {expr_type}")
+
+    # Arithmetic and comparisons, given the values of the operands
+    def eval_operation(self, expr_dir: str, e: List[str], expr_type: int, lhs, rhs):
+        match expr_type:
+            case ExpressionType.Add:
                 expr_type = self.determine_expr_type(expr_dir)
                 match expr_type:
                     case TypeType.Int:
@@ -169,16 +422,7 @@ class Interpreter:
                     case TypeType.Char:
                         value = chr((ord(lhs) + ord(rhs)) & 0xff)
 
-                if self.expression_is_literal(e[1]) and self.expression_is_literal(e[2]):
-                    expr_cache[expr_dir] = value
-
-                return value
-
             case ExpressionType.Subtract:
-                assert(len(e) == 3)
-                lhs = self.eval_expression(e[1])
-                rhs = self.eval_expression(e[2])
-
                 expr_type = self.determine_expr_type(expr_dir)
                 assert(expr_type != TypeType.String)
 
@@ -190,16 +434,7 @@ class Interpreter:
                     case TypeType.Char:
                         value = chr((ord(lhs) - ord(rhs)) & 0xff)
 
-                if self.expression_is_literal(e[1]) and self.expression_is_literal(e[2]):
-                    expr_cache[expr_dir] = value
-
-                return value
-
             case ExpressionType.Multiply:
-                assert(len(e) == 3)
-                lhs = self.eval_expression(e[1])
-                rhs = self.eval_expression(e[2])
-
                 expr_type = self.determine_expr_type(expr_dir)
                 assert(not expr_type in [TypeType.String, TypeType.Char])
 
@@ -209,16 +444,7 @@ class Interpreter:
                     case _:
                         value = lhs * rhs
 
-                if self.expression_is_literal(e[1]) and self.expression_is_literal(e[2]):
-                    expr_cache[expr_dir] = value
-
-                return value
-
             case ExpressionType.Divide:
-                assert(len(e) == 3)
-                lhs = self.eval_expression(e[1])
-                rhs = self.eval_expression(e[2])
-
                 expr_type = self.determine_expr_type(expr_dir)
                 assert(expr_type != TypeType.String)
 
@@ -230,124 +456,99 @@ class Interpreter:
                     case TypeType.Char:
                         value = chr(ord(lhs) // ord(rhs))
 
-                if self.expression_is_literal(e[1]) and self.expression_is_literal(e[2]):
-                    expr_cache[expr_dir] = value
-
-                return value
-
-            case ExpressionType.LiteralValue:
-                assert(len(e) == 3)
-                lit_type = get_dir_count(e[1])
-                match lit_type:
-                    case TypeType.Int:
-                        value = self.eval_int(e[2])
-
-                    case TypeType.Float:
-                        value = self.eval_float(e[2])
-
-                    case TypeType.String:
-                        return self.eval_str(expr_dir, e[2])
-
-                    case TypeType.Char:
-                        value = self.eval_char(e[2])
-
-                    case _:
-                        raise Exception(f"Invalid literal: {lit_type}")
-
-                expr_cache[expr_dir] = value
-                return value
-
             case ExpressionType.EqualTo:
-                assert(len(e) == 3)
-                lhs = self.eval_expression(e[1])
-                rhs = self.eval_expression(e[2])
                 lhs_type = self.determine_expr_type(e[1])
                 rhs_type = self.determine_expr_type(e[2])
 
                 value = eq(lhs, rhs, lhs_type, rhs_type)
 
-                if self.expression_is_literal(e[1]) and self.expression_is_literal(e[2]):
-                    expr_cache[expr_dir] = value
-
-                return value
-
             case ExpressionType.GreaterThan:
-                assert(len(e) == 3)
-                lhs = self.eval_expression(e[1])
-                rhs = self.eval_expression(e[2])
                 lhs_type = self.determine_expr_type(e[1])
                 rhs_type = self.determine_expr_type(e[2])
 
                 value = gt(lhs, rhs, lhs_type, rhs_type)
 
-                if self.expression_is_literal(e[1]) and self.expression_is_literal(e[2]):
-                    expr_cache[expr_dir] = value
-
-                return value
-
             case ExpressionType.LessThan:
-                assert(len(e) == 3)
-                lhs = self.eval_expression(e[1])
-                rhs = self.eval_expression(e[2])
                 lhs_type = self.determine_expr_type(e[1])
                 rhs_type = self.determine_expr_type(e[2])
 
                 value = lt(lhs, rhs, lhs_type, rhs_type)
 
-                if self.expression_is_literal(e[1]) and self.expression_is_literal(e[2]):
-                    expr_cache[expr_dir] = value
-
-                return value
+        if self.expression_is_literal(e[1]) and self.expression_is_literal(e[2]):
+            self.expr_cache.put(expr_dir, value)
 
-            case _:
-                raise Exception(f"Invalid expression: {expr_type}")
+        return value
 
     def determine_expr_type(self, expr_dir: str) -> TypeType:
-        if expr_dir in expr_type_cache:
-            return expr_type_cache[expr_dir]
-        e = get_dir(expr_dir)
-        assert(len(e) >= 2)
-
-        expr_type = e[0]
-        match get_dir_count(expr_type):
-            case ExpressionType.Variable:
-                var_name = self.eval_str(expr_dir + "_var", e[1])
-                assert(var_name in self.vars)
-                expr_type_cache[expr_dir] = self.vars[var_name].type
-                return expr_type_cache[expr_dir]
+        expr_type = self.expr_type_cache.lookup(expr_dir, MISSING)
+        if expr_type is not MISSING:
+            return expr_type
+
+        types: List[TypeType] = []
+        stack: List[Tuple[str, List[str] | None]] = [(expr_dir, None)]
+        while len(stack) > 0:
+            expr_dir, e = stack.pop()
+            if e is not None:
+                # Only strings can have a char added to them; otherwise both operands have the type of the result
+                rhs = types.pop()
+                if types[-1] != rhs:
+                    assert(self.get_dir_count(e[0]) == ExpressionType.Add and types[-1] == TypeType.String and rhs == TypeType.Char)
+                types[-1] = self.cache_expr_type(expr_dir, types[-1])
+                continue
+
+            expr_type = self.expr_type_cache.lookup(expr_dir, MISSING)
+            if expr_type is not MISSING:
+                types.append(expr_type)
+                continue
+
+            e = self.get_dir(expr_dir)
+            assert(len(e) >= 2)
+
+            expr_type = e[0]
+            match self.get_dir_count(expr_type):
+                case ExpressionType.Variable:
+                    var_name = self.eval_str(e[1])
+                    assert(var_name in self.vars)
+                    types.append(self.cache_expr_type(expr_dir, self.vars[var_name].type))
+
+                case ExpressionType.Add | ExpressionType.Subtract | ExpressionType.Multiply | ExpressionType.Divide:
+                    assert(len(e) == 3)
+                    stack.append((expr_dir, e))
+                    stack.append((e[2], None))
+                    stack.append((e[1], None))
+
+                case ExpressionType.LiteralValue:
+                    types.append(self.cache_expr_type(expr_dir, TypeType(self.get_dir_count(e[1]))))
+
+                case ExpressionType.EqualTo | ExpressionType.GreaterThan | ExpressionType.LessThan:
+                    types.append(self.cache_expr_type(expr_dir, TypeType.Int))
+
+                case _:
+                    raise Exception(f"Invalid expression: {expr_type}")
+        return types[0]
+
+    # Literal and identifier subtrees are decoded once and then served from decoded_cache
+    def decoded(self, value_dir: str, decode: Callable[[str], int | float | str]):
+        value = self.decoded_cache.lookup(value_dir, MISSING)
+        if value is MISSING:
+            value = decode(value_dir)
+            self.decoded_cache.put(value_dir, value)
+        return value
 
-            case ExpressionType.Add:
-                assert(len(e) == 3)
-                lhs = self.determine_expr_type(e[1])
-                rhs = self.determine_expr_type(e[2])
-                if lhs != rhs:
-                    assert(lhs == TypeType.String and rhs == TypeType.Char)
-                    expr_type_cache[expr_dir] = TypeType.String
-                    return expr_type_cache[expr_dir]
-                expr_type_cache[expr_dir] = lhs
-                return expr_type_cache[expr_dir]
-
-            case ExpressionType.Subtract | ExpressionType.Multiply | ExpressionType.Divide:
-                assert(len(e) == 3)
-                lhs = self.determine_expr_type(e[1])
-                rhs = self.determine_expr_type(e[2])
-                assert(lhs == rhs)
-                expr_type_cache[expr_dir] = lhs
-                return expr_type_cache[expr_dir]
+    def eval_int(self, int_dir: str):
+        return self.decoded(int_dir, self.decode_int)
 
-            case ExpressionType.LiteralValue:
-                expr_type_cache[expr_dir] = TypeType(get_dir_count(e[1]))
-                return expr_type_cache[expr_dir]
+    def eval_str(self, str_dir: str):
+        return self.decoded(str_dir, self.decode_str)
 
-            case ExpressionType.EqualTo | ExpressionType.GreaterThan | ExpressionType.LessThan:
-                expr_type_cache[expr_dir] = TypeType.Int
-                return expr_type_cache[expr_dir]
+    def eval_char(self, char_dir: str):
+        return self.decoded(char_dir, self.decode_char)
 
-            case _:
-                raise Exception(f"Invalid expression: {expr_type}")
+    def eval_float(self, float_dir: str):
+        return self.decoded(float_dir, self.decode_float)
 
-    def eval_int(self, int_dir: str):
-        v = get_dir(int_dir)
+    def decode_int(self, int_dir: str):
+        v = self.get_dir(int_dir)
         assert(len(v) == 8)
 
         value = 0
@@ -360,30 +561,25 @@ class Interpreter:
 
         return value
 
-    def eval_str(self, expr_dir: str, str_dir: str):
-        if expr_dir in expr_cache:
-            return expr_cache[expr_dir]
-
-        bs = get_dir(str_dir)
+    def decode_str(self, str_dir: str):
+        bs = self.get_dir(str_dir)
         value = bytearray([])
 
         for byte_dir in bs:
-            nibble_dirs = get_dir(byte_dir)
+            nibble_dirs = self.get_dir(byte_dir)
             assert(len(nibble_dirs) == 2)
             value.append((self.eval_nibble(nibble_dirs[0]) << 4) | self.eval_nibble(nibble_dirs[1]))
 
-        value = value.decode("utf-8")
-        expr_cache[expr_dir] = value
-        return value
+        return intern(value.decode("utf-8"))
 
-    def eval_char(self, char_dir: str):
-        nibble_dirs = get_dir(char_dir)
+    def decode_char(self, char_dir: str):
+        nibble_dirs = self.get_dir(char_dir)
         assert(len(nibble_dirs) == 2)
         value = chr((self.eval_nibble(nibble_dirs[0]) << 4) | self.eval_nibble(nibble_dirs[1]))
         return value
 
-    def eval_float(self, float_dir: str):
-        v = get_dir(float_dir)
+    def decode_float(self, float_dir: str):
+        v = self.get_dir(float_dir)
         assert(len(v) == 8)
 
         raw_bytes = bytearray([])
@@ -398,19 +594,143 @@ class Interpreter:
         return value
 
     def eval_nibble(self, nibble_dir: str):
-        n = get_dir(nibble_dir)
+        n = self.get_dir(nibble_dir)
         assert(len(n) == 4)
 
         nibble = 0
         for i, bit_dir in enumerate(n):
-            nibble |= get_dir_count_no_cache(bit_dir) << (3 - i)
+            nibble |= self.get_dir_count(bit_dir) << (3 - i)
         return nibble
 
+def print_cache_stats(stats: Dict[str, Dict[str, int | None]]):
+    print(f"{'cache':<18} {'size':>9} {'max size':>9} {'hits':>10} {'misses':>10} {'evictions':>10}", file=stderr)
+    for name, s in stats.items():
+        size, max_size, hits, misses, evictions = ["-" if s[k] is None else s[k] for k in ("size", "max_size", "hits", "misses", "evictions")]
+        print(f"{name:<18} {size:>9} {max_size:>9} {hits:>10} {misses:>10} {evictions:>10}", file=stderr)
+
+# The folder of the innermost command or expression being run when an exception was raised, found in
+# the locals of the engines' frames so that running costs nothing extra
+def failing_node(tb: TracebackType | None) -> str | None:
+    node_path = None
+    while tb is not None:
+        frame_locals = tb.tb_frame.f_locals
+        for name in ["command", "expr"]:
+            node = frame_locals.get(name)
+            if isinstance(node, (Command, Expression)) and node.path is not None:
+                node_path = node.path
+        for name in ["command_dir", "expr_dir"]:
+            if isinstance(frame_locals.get(name), str):
+                node_path = frame_locals[name]
+        tb = tb.tb_next
+    return node_path
+
 if __name__ == "__main__":
     arg_parser = ArgumentParser()
-    arg_parser.add_argument("--input", "-i", help="Input folders directory", required=True)
+    arg_parser.add_argument("--input", "-i", help="Input folders directory, or program in the binary format", required=True)
+    arg_parser.add_argument("--engine", "-e", help="Execution engine (disk runs straight from the folders)", choices=["tree", "vm", "python", "disk"], default="tree")
+    arg_parser.add_argument("--jobs", "-j", help="Number of threads scanning the program", type=int, default=1)
+    arg_parser.add_argument("--optimize", "-O", help="Fold constants and remove dead code before running (not the disk engine)", action="store_true")
+    arg_parser.add_argument("--no-cache", help="Always rescan the program instead of using the program cache", action="store_true")
+    arg_parser.add_argument("--cache-dir", help="Directory holding the program cache")
+    arg_parser.add_argument("--cache-size", help="Maximum entries in each folder cache of the disk engine (0 for unbounded)", type=int, default=0)
+    arg_parser.add_argument("--live", help="Disk engine: cache nothing, rereading folders as they are reached", action="store_true")
+    arg_parser.add_argument("--watch", help="Tree engine: keep watching the program's folders, applying edits while it runs", action="store_true")
+    arg_parser.add_argument("--poll-interval", help="With --watch, poll for changes every this many seconds instead of using inotify", type=float)
+    arg_parser.add_argument("--cache-stats", help="Print cache statistics to stderr after running", action="store_true")
+    arg_parser.add_argument("--buffer-size", help="Output buffer size in characters", type=int, default=DEFAULT_BUFFER_SIZE)
+    arg_parser.add_argument("--unbuffered", "-u", help="Write output as soon as it is printed", action="store_true")
+    arg_parser.add_argument("--profile", help="Tree and disk engines: report where the program spends its time", action="store_true")
+    arg_parser.add_argument("--profile-format", help="Format of the profile", choices=["text", "json", "collapsed"], default="text")
+    arg_parser.add_argument("--profile-output", help="Write the profile to this file instead of stderr")
+    arg_parser.add_argument("--max-steps", help="Tree and disk engines: stop after executing this many commands", type=int)
+    arg_parser.add_argument("--max-seconds", help="Tree and disk engines: stop after running for this many seconds", type=float)
+    arg_parser.add_argument("--max-output-bytes", help="Tree and disk engines: stop before printing more than this many bytes", type=int)
+    arg_parser.add_argument("--max-variables", help="Tree and disk engines: stop when more than this many variables are declared", type=int)
+    arg_parser.add_argument("--max-string-length", help="Tree and disk engines: stop when a variable holds a longer string", type=int)
     args = arg_parser.parse_args()
 
-    program_dir = args.input
-    interpreter = Interpreter()
-    interpreter.execute_commands(program_dir)
+    from binary_format import is_binary_program, load_program_binary
+
+    output = make_output(0 if args.unbuffered else args.buffer_size)
+    from limits import Limits, LimitedInterpreter, ResourceLimitExceeded
+    limits = Limits(args.max_steps, args.max_seconds, args.max_output_bytes, args.max_variables, args.max_string_length)
+    interpreter_class: type[Interpreter] = Interpreter
+    interpreter_args = {}
+    if args.profile or limits.any():
+        if args.watch or args.engine not in ["tree", "disk"]:
+            arg_parser.error("--profile and resource limits need the tree or disk engine")
+    if args.profile and limits.any():
+        arg_parser.error("--profile can't be combined with resource limits")
+    if args.profile:
+        from profiler import ProfilingInterpreter
+        interpreter_class = ProfilingInterpreter
+    if limits.any():
+        interpreter_class = LimitedInterpreter
+        interpreter_args["limits"] = limits
+    interpreter = interpreter_class(output, args.cache_size if args.cache_size > 0 else None, args.live, args.cache_stats,
+                                    **interpreter_args)
+    stats: Dict[str, Dict[str, int | None]] = {}
+
+    # The disk engine and watch mode read the program's folders as it runs, which a binary program has none of
+    if (args.engine == "disk" or args.watch) and not path.isdir(args.input):
+        if path.isfile(args.input) and is_binary_program(args.input):
+            arg_parser.error(f"{args.input} is a binary program, which the disk engine and --watch can't run from its folders; "
+                             "use another engine, or expand it with binary_format.py first")
+        arg_parser.error(f"{args.input} is not a program directory")
+
+    try:
+        if args.watch:
+            from watcher import LiveInterpreter
+            LiveInterpreter(output, args.poll_interval).run_live(args.input, args.jobs)
+        elif args.engine == "disk":
+            interpreter.run_directory(args.input)
+            stats.update(interpreter.cache_stats())
+        else:
+            if is_binary_program(args.input):
+                program = load_program_binary(args.input)
+            elif args.no_cache:
+                program = load_program(args.input, args.jobs)
+            else:
+                from program_cache import ProgramCache
+                program_cache = ProgramCache(args.cache_dir)
+                program = program_cache.load_program(args.input, args.jobs)
+                stats["program_cache"] = program_cache.stats()
+
+            if args.optimize:
+                from optimizer import optimize_program
+                program = optimize_program(program)
+
+            match args.engine:
+                case "tree":
+                    interpreter.run_program(program)
+                case "vm":
+                    from vm import VM, compile_program
+                    VM(compile_program(program), output).run()
+                case "python":
+                    from transpiler import transpile_program, run_python
+                    run_python(transpile_program(program), args.input, output)
+    except ResourceLimitExceeded as e:
+        steps, elapsed, output_bytes, variables = e.stats
+        arg_parser.exit(2, f"Resource limit exceeded: {e}\n"
+                           f"  steps: {steps}, elapsed: {elapsed:.3f}s, output: {output_bytes} bytes, variables: {variables}\n")
+    except Exception as e:
+        node_path = failing_node(e.__traceback__)
+        if node_path is not None:
+            from source_map import load_source_map
+            source_map = load_source_map(args.input)
+            location = None if source_map is None else source_map.describe(node_path)
+            print(f"Error at {node_path}{'' if location is None else f' ({location})'}", file=stderr)
+        raise
+
+    if args.cache_stats:
+        print_cache_stats(stats)
+
+    if args.profile:
+        from source_map import load_source_map
+        profiler = interpreter.profiler # type: ignore
+        source_map = load_source_map(args.input)
+        if args.profile_output is None:
+            profiler.write(stderr, args.profile_format, source_map)
+        else:
+            with open(args.profile_output, "w") as f:
+                profiler.write(f, args.profile_format, source_map)
@@ -0,0 +1,135 @@
+from time import perf_counter
+from typing import List, NamedTuple
+from folders_types import Command, CommandType
+from interpreter import Interpreter, Var
+from output import Output, UnbufferedOutput
+
+# Resource limits for running programs that can't be trusted. Like profiling, limits live in a subclass
+# of Interpreter, so running without them costs nothing; with them, each command costs one comparison,
+# and everything else is checked only when it could have changed or every TIME_CHECK_INTERVAL steps.
+
+TIME_CHECK_INTERVAL = 1024
+
+var_commands = (CommandType.Declare, CommandType.Let, CommandType.Input)
+
+class Limits(NamedTuple):
+    max_steps: int | None = None            # commands executed, counting each iteration of a While
+    max_seconds: float | None = None        # wall time of the whole run
+    max_output_bytes: int | None = None     # UTF-8 bytes printed
+    max_variables: int | None = None        # variables declared
+    max_string_length: int | None = None    # length of a string or char variable
+
+    def any(self) -> bool:
+        return any(limit is not None for limit in self)
+
+class ExecutionStats(NamedTuple):
+    steps: int
+    elapsed: float
+    output_bytes: int
+    variables: int
+
+class ResourceLimitExceeded(Exception):
+    def __init__(self, limit: str, maximum: int | float, stats: ExecutionStats):
+        super().__init__(f"{limit} limit of {maximum} exceeded after {stats.steps} steps in {stats.elapsed:.3f}s")
+        self.limit = limit
+        self.maximum = maximum
+        self.stats = stats
+
+# Counts the bytes printed through it
+class CountingOutput:
+    def __init__(self, output: Output, on_write):
+        self.output = output
+        self.bytes_written = 0
+        self.on_write = on_write
+
+    def write(self, value: int | float | str):
+        self.bytes_written += len(str(value).encode("utf-8"))
+        self.on_write()
+        self.output.write(value)
+
+    def flush(self):
+        self.output.flush()
+
+class LimitedInterpreter(Interpreter):
+    def __init__(self, output: Output | None = None, *args, limits: Limits = Limits(), **kwargs):
+        self.counting_output = CountingOutput(UnbufferedOutput() if output is None else output, self.check_output)
+        super().__init__(self.counting_output, *args, **kwargs) # type: ignore
+        self.limits = limits
+        self.checks_vars = limits.max_variables is not None or limits.max_string_length is not None
+        self.steps = 0
+        self.start = perf_counter()
+        self.next_check = 0
+
+    def stats(self) -> ExecutionStats:
+        return ExecutionStats(self.steps, perf_counter() - self.start, self.counting_output.bytes_written, len(self.vars))
+
+    def exceeded(self, limit: str, maximum: int | float):
+        self.output.flush()
+        raise ResourceLimitExceeded(limit, maximum, self.stats())
+
+    def start_clock(self):
+        self.steps = 0
+        self.start = perf_counter()
+        self.next_check = 0
+
+    # Called when steps reaches next_check: at the step limit, and every TIME_CHECK_INTERVAL steps
+    def check_steps(self):
+        max_steps, max_seconds = self.limits.max_steps, self.limits.max_seconds
+        if max_steps is not None and self.steps > max_steps:
+            self.exceeded("steps", max_steps)
+        if max_seconds is not None and perf_counter() - self.start > max_seconds:
+            self.exceeded("seconds", max_seconds)
+        self.next_check = self.steps + TIME_CHECK_INTERVAL
+        if max_steps is not None:
+            self.next_check = min(self.next_check, max_steps + 1)
+
+    def check_output(self):
+        max_output_bytes = self.limits.max_output_bytes
+        if max_output_bytes is not None and self.counting_output.bytes_written > max_output_bytes:
+            self.exceeded("output_bytes", max_output_bytes)
+
+    def check_var(self, var: Var):
+        max_variables, max_string_length = self.limits.max_variables, self.limits.max_string_length
+        if max_variables is not None and len(self.vars) > max_variables:
+            self.exceeded("variables", max_variables)
+        if max_string_length is not None and isinstance(var.value, str) and len(var.value) > max_string_length:
+            self.exceeded("string_length", max_string_length)
+
+    def step(self):
+        self.steps += 1
+        if self.steps >= self.next_check:
+            self.check_steps()
+
+    # Tree engine
+    def run_program(self, program: List[Command]):
+        self.start_clock()
+        super().run_program(program)
+
+    # A While runs again for each iteration, so a loop whose body the optimizer emptied still counts as
+    # doing something
+    def run_command(self, command: Command) -> List[Command] | None:
+        self.steps += 1
+        if self.steps >= self.next_check:
+            self.check_steps()
+        body = super().run_command(command)
+        if self.checks_vars and command.command_type in var_commands:
+            self.check_var(self.vars[command.var_name]) # type: ignore
+        return body
+
+    # Disk engine
+    def run_directory(self, program_dir: str):
+        self.start_clock()
+        super().run_directory(program_dir)
+
+    def execute_command(self, command_dir: str) -> str | None:
+        self.step()
+        body_dir = super().execute_command(command_dir)
+        if not self.checks_vars:
+            return body_dir
+        c = self.get_dir(command_dir)
+        match self.get_dir_count(c[0]):
+            case CommandType.Declare:
+                self.check_var(self.vars[self.eval_str(c[2])])
+            case CommandType.Let | CommandType.Input:
+                self.check_var(self.vars[self.eval_str(c[1])])
+        return body_dir
@@ -0,0 +1,189 @@
+from os import scandir
+from concurrent.futures import ThreadPoolExecutor
+from struct import unpack
+from sys import intern
+from typing import Dict, List, Type
+from folders_types import CommandType, ExpressionType, TypeType, Command, Expression, If, While, \
+    Declare, Let, Print, Input, IntLit, FloatLit, StrLit, CharLit, EqualTo, LessThan, GreaterThan, \
+    Add, Subtract, Multiply, Divide, Variable
+
+# A scanned folder: the sorted list of its subfolders, plus the path it was read from
+class Folder(list):
+    __slots__ = ("path",)
+
+    def __init__(self, path: str | None = None):
+        super().__init__()
+        self.path = path
+
+def list_dir(dir: str) -> List[str]:
+    return sorted([d.path for d in scandir(dir) if d.is_dir()])
+
+def scan_tree(root: str, jobs: int = 1) -> Folder:
+    if jobs > 1:
+        return scan_tree_parallel(root, jobs)
+
+    tree = Folder(root)
+    stack = [tree]
+    while len(stack) > 0:
+        folder = stack.pop()
+        for path in list_dir(folder.path): # type: ignore
+            child = Folder(path)
+            folder.append(child)
+            stack.append(child)
+    return tree
+
+# Scans one level of the tree at a time, listing every folder of the level concurrently. Results are
+# attached in the order the level was submitted, so the tree is the same however threads are scheduled.
+def scan_tree_parallel(root: str, jobs: int) -> Folder:
+    tree = Folder(root)
+    level = [tree]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while len(level) > 0:
+            next_level = []
+            for folder, paths in zip(level, executor.map(list_dir, [f.path for f in level])):
+                for path in paths:
+                    child = Folder(path)
+                    folder.append(child)
+                    next_level.append(child)
+            level = next_level
+    return tree
+
+def path_of(folder: list) -> str | None:
+    return getattr(folder, "path", None)
+
+def decode_nibble(nibble: list) -> int:
+    assert(len(nibble) == 4)
+    return (len(nibble[0]) << 3) | (len(nibble[1]) << 2) | (len(nibble[2]) << 1) | len(nibble[3])
+
+def decode_byte(byte: list) -> int:
+    assert(len(byte) == 2)
+    return (decode_nibble(byte[0]) << 4) | decode_nibble(byte[1])
+
+def decode_int(value: list) -> int:
+    assert(len(value) == 8)
+
+    result = 0
+    for i in range(8):
+        result |= decode_nibble(value[i]) << (28 - (i * 4))
+
+    if result >= 0x80000000:
+        result = -((result ^ 0xffffffff) + 1)
+
+    return result
+
+def decode_float(value: list) -> float:
+    assert(len(value) == 8)
+    raw_bytes = bytes([decode_byte(value[i:i+2]) for i in range(0, 8, 2)])
+    return unpack("f", raw_bytes[::-1])[0]
+
+# Interned, so the many copies of a variable name share one object and compare by identity first
+def decode_str(value: list) -> str:
+    return intern(bytes([decode_byte(byte) for byte in value]).decode("utf-8"))
+
+def decode_char(value: list) -> str:
+    return chr(decode_byte(value))
+
+binary_expressions: Dict[int, Type[Expression]] = {
+    ExpressionType.Add: Add,
+    ExpressionType.Subtract: Subtract,
+    ExpressionType.Multiply: Multiply,
+    ExpressionType.Divide: Divide,
+    ExpressionType.EqualTo: EqualTo,
+    ExpressionType.GreaterThan: GreaterThan,
+    ExpressionType.LessThan: LessThan,
+}
+
+# Blocks and expressions are decoded with explicit stacks rather than by recursion, so programs of any
+# depth can be loaded
+def decode_commands(commands: list) -> List[Command]:
+    decoded: List[Command] = []
+    stack = [(c, decoded) for c in reversed(commands)]
+    while len(stack) > 0:
+        c, dest = stack.pop()
+        assert(len(c) >= 2)
+
+        command: Command
+        match len(c[0]):
+            case CommandType.If:
+                assert(len(c) == 3)
+                command = If(decode_expression(c[1]), [])
+                stack.extend((sub, command.commands) for sub in reversed(c[2]))
+
+            case CommandType.While:
+                assert(len(c) == 3)
+                command = While(decode_expression(c[1]), [])
+                stack.extend((sub, command.commands) for sub in reversed(c[2]))
+
+            case CommandType.Declare:
+                assert(len(c) == 3)
+                command = Declare(TypeType(len(c[1])), decode_str(c[2]))
+
+            case CommandType.Let:
+                assert(len(c) == 3)
+                command = Let(decode_str(c[1]), decode_expression(c[2]))
+
+            case CommandType.Print:
+                command = Print(decode_expression(c[1]))
+
+            case CommandType.Input:
+                command = Input(decode_str(c[1]))
+
+            case _:
+                raise Exception(f"Invalid command: {len(c[0])}")
+
+        command.path = path_of(c)
+        dest.append(command)
+    return decoded
+
+def decode_command(c: list) -> Command:
+    return decode_commands([c])[0]
+
+def decode_expression(e: list) -> Expression:
+    # Operands are decoded before the operator that combines them, which is pushed back on the stack
+    # with operands_ready set
+    values: List[Expression] = []
+    stack = [(e, False)]
+    while len(stack) > 0:
+        e, operands_ready = stack.pop()
+        assert(len(e) >= 2)
+
+        expr: Expression
+        expr_type = len(e[0])
+        if operands_ready:
+            rhs = values.pop()
+            lhs = values.pop()
+            expr = binary_expressions[expr_type](lhs, rhs) # type: ignore
+        elif expr_type in binary_expressions:
+            assert(len(e) == 3)
+            stack.append((e, True))
+            stack.append((e[2], False))
+            stack.append((e[1], False))
+            continue
+        else:
+            match expr_type:
+                case ExpressionType.Variable:
+                    expr = Variable(decode_str(e[1]))
+
+                case ExpressionType.LiteralValue:
+                    assert(len(e) == 3)
+                    match len(e[1]):
+                        case TypeType.Int:
+                            expr = IntLit(decode_int(e[2]) & 0xffffffff)
+                        case TypeType.Float:
+                            expr = FloatLit(decode_float(e[2]))
+                        case TypeType.String:
+                            expr = StrLit(decode_str(e[2]))
+                        case TypeType.Char:
+                            expr = CharLit(decode_char(e[2]))
+                        case _:
+                            raise Exception(f"Invalid literal: {len(e[1])}")
+
+                case _:
+                    raise Exception(f"Invalid expression: {expr_type}")
+
+        expr.path = path_of(e)
+        values.append(expr)
+    return values[0]
+
+def load_program(program_dir: str, jobs: int = 1) -> List[Command]:
+    return decode_commands(scan_tree(program_dir, jobs))
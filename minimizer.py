@@ -0,0 +1,188 @@
+from heapq import heappush, heappop
+from ctypes import c_float
+from typing import Dict, List, Tuple
+from folders_types import CommandType, ExpressionType, TypeType, Command, Expression, If, While, \
+    Declare, Let, Input, Lit, Variable
+from compiler import FoldersCompiler, count_folders
+from optimizer import walk_commands, command_expressions
+
+# Every byte of a name costs a byte folder, two nibble folders, eight bit folders and a folder per set
+# bit, so names are handed out cheapest first: the empty name, then single bytes with the fewest set
+# bits, and so on. Only ASCII bytes are used, so every name is valid UTF-8. The empty name and control
+# characters are legal: a compiled program holds names only as folders, which every engine reads as
+# opaque strings (the python engine renames variables to v0, v1, ...), and diagnostics print them
+# escaped. Only folderscript can't spell them, and minimized programs are never turned back into it.
+def byte_cost(byte: int) -> int:
+    return 11 + bin(byte).count("1")
+
+def names_by_cost():
+    heap: List[Tuple[int, str]] = [(0, "")]
+    while True:
+        cost, name = heappop(heap)
+        yield name
+        for byte in range(0x80):
+            heappush(heap, (cost + byte_cost(byte), name + chr(byte)))
+
+# The 32 bits a float literal is compiled to, as FoldersCompiler writes them: values beyond the range
+# of a 32 bit float become infinities rather than raising
+def float_bits(value: float) -> bytes:
+    return bytes(c_float(value))
+
+def literal_key(lit: Lit) -> tuple:
+    # Floats are keyed by their bits, so 0.0 and -0.0 (and NaNs) stay distinct, and literals that
+    # compile to the same float are shared
+    if lit.lit_type == TypeType.Float:
+        return (lit.lit_type, float_bits(lit.value)) # type: ignore
+    return (lit.lit_type, lit.value) # type: ignore
+
+def is_default(lit: Lit) -> bool:
+    match lit.lit_type:
+        case TypeType.Int:
+            return lit.value == 0 # type: ignore
+        case TypeType.Float:
+            return float_bits(lit.value) == float_bits(0.0) # type: ignore
+        case TypeType.String:
+            return lit.value == "" # type: ignore
+        case _:
+            return False
+
+def command_cost(command: Command) -> int:
+    encoded: List = []
+    FoldersCompiler().encode_command(command, encoded)
+    return count_folders(encoded)
+
+def expression_cost(expr: Expression) -> int:
+    encoded: List = []
+    FoldersCompiler().encode_expression(expr, encoded)
+    return count_folders(encoded)
+
+# Rewrites a program so that it encodes to fewer folders, without changing what it prints or reads:
+# - Variables are renamed, with the most used getting the cheapest names.
+# - A literal used often enough is replaced by a variable holding it, declared (and, unless the
+#   literal is the type's default value, assigned) at the start of the program, when the cheaper
+#   references pay for the Declare and Let.
+# Names are assigned greedily in order of use, so both compete for the cheap names. Commands and
+# expressions are rewritten in place, so the program passed in should not be used afterwards.
+class FolderMinimizer:
+    def __init__(self):
+        self.var_uses: Dict[str, int] = {}
+        self.literal_uses: Dict[tuple, int] = {}
+        self.literals: Dict[tuple, Lit] = {}
+        self.names: Dict[str, str] = {}
+        self.constants: Dict[tuple, str] = {}
+
+    def minimize(self, program: List[Command]) -> List[Command]:
+        self.count_uses(program)
+        self.assign_names()
+
+        for command in walk_commands(program):
+            self.rewrite_command(command)
+
+        hoisted: List[Command] = []
+        for key, name in self.constants.items():
+            lit = self.literals[key]
+            hoisted.append(Declare(lit.lit_type, name))
+            if not is_default(lit):
+                hoisted.append(Let(name, lit))
+        return hoisted + program
+
+    def count_uses(self, program: List[Command]):
+        for command in walk_commands(program):
+            if command.command_type in [CommandType.Declare, CommandType.Let, CommandType.Input]:
+                self.use_var(command.var_name) # type: ignore
+
+            for expr in command_expressions(command):
+                stack = [expr]
+                while len(stack) > 0:
+                    expr = stack.pop()
+                    match expr.expr_type:
+                        case ExpressionType.Variable:
+                            self.use_var(expr.var_name) # type: ignore
+                        case ExpressionType.LiteralValue:
+                            key = literal_key(expr) # type: ignore
+                            self.literal_uses[key] = self.literal_uses.get(key, 0) + 1
+                            self.literals.setdefault(key, expr) # type: ignore
+                        case _:
+                            stack.append(expr.lhs) # type: ignore
+                            stack.append(expr.rhs) # type: ignore
+
+    def use_var(self, var_name: str):
+        self.var_uses[var_name] = self.var_uses.get(var_name, 0) + 1
+
+    def assign_names(self):
+        candidates = [(uses, 0, var_name) for var_name, uses in self.var_uses.items()]
+        candidates += [(uses, 1, key) for key, uses in self.literal_uses.items()]
+        # Most used first; ties keep the order variables and literals were first seen in
+        candidates.sort(key=lambda c: -c[0])
+
+        names = names_by_cost()
+        name = next(names)
+        for uses, is_literal, item in candidates:
+            if is_literal:
+                lit = self.literals[item]
+                reference = Variable(name)
+                setup = command_cost(Declare(lit.lit_type, name))
+                if not is_default(lit):
+                    setup += command_cost(Let(name, lit))
+                if setup + uses * expression_cost(reference) >= uses * expression_cost(lit):
+                    continue
+                self.constants[item] = name
+            else:
+                self.names[item] = name
+            name = next(names)
+
+    def rewrite_command(self, command: Command):
+        match command.command_type:
+            case CommandType.If | CommandType.While:
+                assert(isinstance(command, If) or isinstance(command, While))
+                command.expr = self.rewrite_expression(command.expr)
+
+            case CommandType.Declare | CommandType.Input:
+                assert(isinstance(command, Declare) or isinstance(command, Input))
+                command.var_name = self.names[command.var_name]
+
+            case CommandType.Let:
+                assert(isinstance(command, Let))
+                command.var_name = self.names[command.var_name]
+                command.value = self.rewrite_expression(command.value)
+
+            case CommandType.Print:
+                command.expr = self.rewrite_expression(command.expr) # type: ignore
+
+    # Operators are kept and their operands replaced, with an explicit stack so expressions of any depth
+    # can be rewritten
+    def rewrite_expression(self, expr: Expression) -> Expression:
+        expr = self.rewrite_operand(expr)
+        stack = [expr]
+        while len(stack) > 0:
+            operator = stack.pop()
+            if operator.expr_type not in [ExpressionType.Variable, ExpressionType.LiteralValue]:
+                operator.lhs = self.rewrite_operand(operator.lhs) # type: ignore
+                operator.rhs = self.rewrite_operand(operator.rhs) # type: ignore
+                stack.append(operator.lhs) # type: ignore
+                stack.append(operator.rhs) # type: ignore
+        return expr
+
+    # A variable with its new name, or a literal's replacement; operators are returned as they are
+    def rewrite_operand(self, expr: Expression) -> Expression:
+        match expr.expr_type:
+            case ExpressionType.Variable:
+                assert(isinstance(expr, Variable))
+                expr.var_name = self.names[expr.var_name]
+                return expr
+
+            case ExpressionType.LiteralValue:
+                assert(isinstance(expr, Lit))
+                name = self.constants.get(literal_key(expr))
+                if name is None:
+                    return expr
+                reference = Variable(name)
+                reference.path = expr.path
+                reference.span = expr.span
+                return reference
+
+            case _:
+                return expr
+
+def minimize_program(program: List[Command]) -> List[Command]:
+    return FolderMinimizer().minimize(program)
@@ -0,0 +1,312 @@
+from copy import copy
+from struct import pack, unpack
+from typing import Dict, Iterator, List, Set, Tuple
+from folders_types import CommandType, ExpressionType, TypeType, Command, Expression, If, While, \
+    Declare, Let, Print, Lit, IntLit, FloatLit, StrLit, CharLit, Variable
+from interpreter import as_i32
+from typechecker import check_program, comparison_coercion, Coercion
+
+def as_f32(value: float) -> float:
+    return unpack("f", pack("f", value))[0]
+
+# The value a literal has at run time once it has been written to folders: ints are signed, and
+# floats are stored as float32
+def literal_value(lit: Lit) -> int | float | str:
+    match lit.lit_type:
+        case TypeType.Int:
+            return as_i32(lit.value) # type: ignore
+        case TypeType.Float:
+            return as_f32(lit.value) # type: ignore
+        case _:
+            return lit.value # type: ignore
+
+def make_literal(value: int | float | str, value_type: TypeType, path: str | None) -> Lit | None:
+    lit: Lit
+    match value_type:
+        case TypeType.Int:
+            lit = IntLit(value & 0xffffffff) # type: ignore
+        case TypeType.Float:
+            # Only results that float32 represents exactly, since the engines compute in doubles
+            try:
+                if as_f32(value) != value: # type: ignore
+                    return None
+            except OverflowError:
+                return None
+            lit = FloatLit(value) # type: ignore
+        case TypeType.String:
+            lit = StrLit(value) # type: ignore
+        case TypeType.Char:
+            if len(value) != 1: # type: ignore
+                return None
+            lit = CharLit(value) # type: ignore
+    lit.path = path
+    lit.value_type = value_type
+    return lit
+
+default_literals = {
+    TypeType.Int: IntLit(0),
+    TypeType.Float: FloatLit(0.0),
+    TypeType.String: StrLit(""),
+}
+
+def is_literal(expr: Expression) -> bool:
+    return expr.expr_type == ExpressionType.LiteralValue
+
+# Whether evaluating the expression can raise: division by anything other than a non-zero literal, or
+# ord() of a char variable, which holds '' until it is first assigned
+def can_fail(expr: Expression) -> bool:
+    stack = [expr]
+    while len(stack) > 0:
+        expr = stack.pop()
+        if expr.expr_type in [ExpressionType.Variable, ExpressionType.LiteralValue]:
+            continue
+        lhs, rhs = expr.lhs, expr.rhs # type: ignore
+        if expr.expr_type == ExpressionType.Divide and (not is_literal(rhs) or literal_value(rhs) in [0, "\0"]):
+            return True
+        if not is_literal(lhs) or not is_literal(rhs):
+            if expr.expr_type in [ExpressionType.EqualTo, ExpressionType.LessThan, ExpressionType.GreaterThan]:
+                if comparison_coercion(lhs.value_type, rhs.value_type) != Coercion.Neither:
+                    return True
+            elif expr.value_type == TypeType.Char:
+                return True
+        stack.append(lhs)
+        stack.append(rhs)
+    return False
+
+# Rewrites a program so that it does less at run time and encodes to fewer folders, without changing
+# what it prints or reads:
+# - Constant subexpressions are folded, with the engines' i32, float32 and char arithmetic. Anything
+#   that would raise at run time (division by zero) or can't be represented exactly is left alone.
+# - A variable that is only ever assigned once, by a top level Let of a literal, is replaced by that
+#   literal after the Let; one that is never assigned is replaced by its default after its Declare.
+# - Ifs and Whiles whose conditions are constant are removed, or inlined when an If is always taken.
+# - Variables that are never read are dropped, along with their Declare and their Lets. A Declare
+#   inside a While is kept, since running it again raises.
+# Each pass can enable the others, so they are repeated until the program stops shrinking. Commands
+# and expressions are rewritten in place, so the program passed in should not be used afterwards.
+class Optimizer:
+    def __init__(self):
+        self.var_types: Dict[str, TypeType] = {}
+        self.constants: Dict[str, Lit] = {}
+        self.lets: Dict[str, int] = {}
+        self.inputs: Set[str] = set()
+        self.reads: Dict[str, int] = {}
+
+    def optimize(self, program: List[Command]) -> List[Command]:
+        size = None
+        while size != program_size(program):
+            size = program_size(program)
+            self.var_types = check_program(program)
+            self.count_writes(program)
+            self.constants = {}
+            program = self.optimize_commands(program)
+            self.count_reads(program)
+            program = self.remove_unused(program)
+        return program
+
+    def count_writes(self, commands: List[Command]):
+        self.lets = {}
+        self.inputs = set()
+        for command in walk_commands(commands):
+            match command.command_type:
+                case CommandType.Let:
+                    self.lets[command.var_name] = self.lets.get(command.var_name, 0) + 1 # type: ignore
+                case CommandType.Input:
+                    self.inputs.add(command.var_name) # type: ignore
+
+    def count_reads(self, commands: List[Command]):
+        self.reads = {}
+        for command in walk_commands(commands):
+            for expr in command_expressions(command):
+                for var_name in variables_in(expr):
+                    self.reads[var_name] = self.reads.get(var_name, 0) + 1
+
+    # Blocks are optimized with an explicit stack, each body before the If or While that owns it is
+    # kept, dropped or inlined. Every frame holds a block's remaining commands, the commands kept from it
+    # so far, and its owner.
+    def optimize_commands(self, commands: List[Command]) -> List[Command]:
+        frames: List[Tuple[Iterator[Command], List[Command], If | While | None]] = [(iter(commands), [], None)]
+        while True:
+            block, optimized, owner = frames[-1]
+            top_level = len(frames) == 1
+            for command in block:
+                match command.command_type:
+                    case CommandType.If | CommandType.While:
+                        assert(isinstance(command, If) or isinstance(command, While))
+                        command.expr = self.fold(command.expr)
+                        frames.append((iter(command.commands), [], command))
+                        break
+
+                    case CommandType.Declare:
+                        assert(isinstance(command, Declare))
+                        var_name = command.var_name
+                        if top_level and self.lets.get(var_name, 0) == 0 and var_name not in self.inputs \
+                            and command.type in default_literals:
+                            self.constants[var_name] = default_literals[command.type]
+
+                    case CommandType.Let:
+                        assert(isinstance(command, Let))
+                        command.value = self.fold(command.value)
+                        var_name = command.var_name
+                        if top_level and self.lets[var_name] == 1 and var_name not in self.inputs \
+                            and is_literal(command.value) and command.value.value_type == self.declared_type(var_name):
+                            self.constants[var_name] = command.value # type: ignore
+
+                    case CommandType.Print:
+                        assert(isinstance(command, Print))
+                        command.expr = self.fold(command.expr)
+
+                optimized.append(command)
+            else:
+                frames.pop()
+                if owner is None:
+                    return optimized
+                owner.commands = optimized
+                self.optimize_block(owner, frames[-1][1])
+
+    # Adds an If or While whose body has been optimized to its parent's commands, unless it can be
+    # dropped or inlined
+    def optimize_block(self, command: If | While, optimized: List[Command]):
+        if command.command_type == CommandType.If:
+            if is_literal(command.expr):
+                if literal_value(command.expr): # type: ignore
+                    optimized.extend(command.commands)
+                return
+            if len(command.commands) == 0 and not can_fail(command.expr):
+                return
+        elif is_literal(command.expr) and not literal_value(command.expr): # type: ignore
+            return
+        optimized.append(command)
+
+    def declared_type(self, var_name: str) -> TypeType | None:
+        return self.var_types.get(var_name)
+
+    # Operands are folded before their operator, with an explicit stack as in TypeChecker.check_expression
+    def fold(self, expr: Expression) -> Expression:
+        folded: List[Expression] = []
+        stack = [(expr, False)]
+        while len(stack) > 0:
+            expr, operands_ready = stack.pop()
+            match expr.expr_type:
+                case ExpressionType.Variable:
+                    assert(isinstance(expr, Variable))
+                    constant = self.constants.get(expr.var_name)
+                    if constant is None:
+                        folded.append(expr)
+                    else:
+                        # Each use gets a node of its own, known by the variable it replaces
+                        lit = copy(constant)
+                        lit.path = expr.path
+                        lit.span = expr.span
+                        folded.append(lit)
+
+                case ExpressionType.LiteralValue:
+                    folded.append(expr)
+
+                case _ if not operands_ready:
+                    stack.append((expr, True))
+                    stack.append((expr.rhs, False)) # type: ignore
+                    stack.append((expr.lhs, False)) # type: ignore
+
+                case _:
+                    expr.rhs = folded.pop() # type: ignore
+                    expr.lhs = folded.pop() # type: ignore
+                    folded.append(self.fold_operation(expr))
+        return folded[0]
+
+    def fold_operation(self, expr: Expression) -> Expression:
+        if not is_literal(expr.lhs) or not is_literal(expr.rhs): # type: ignore
+            return expr
+        try:
+            value = expr.operation(literal_value(expr.lhs), literal_value(expr.rhs)) # type: ignore
+        except (ZeroDivisionError, ValueError, OverflowError, TypeError):
+            return expr
+        folded = make_literal(value, expr.value_type, expr.path) # type: ignore
+        if folded is None:
+            return expr
+        folded.span = expr.span
+        return folded
+
+    def remove_unused(self, commands: List[Command]) -> List[Command]:
+        # Lets whose value could raise keep their variable, so the error still happens
+        keep = set(self.inputs) | set(self.reads)
+        for command in walk_commands(commands):
+            if command.command_type == CommandType.Let and can_fail(command.value): # type: ignore
+                keep.add(command.var_name) # type: ignore
+
+        # A Declare inside a While can run twice, which raises, so it stays even when its Lets go
+        redeclared: Set[str] = set()
+        stack = [(command, False) for command in reversed(commands)]
+        while len(stack) > 0:
+            command, in_loop = stack.pop()
+            if command.command_type == CommandType.Declare and in_loop:
+                redeclared.add(command.var_name) # type: ignore
+            elif isinstance(command, If) or isinstance(command, While):
+                in_body = in_loop or isinstance(command, While)
+                stack.extend((inner, in_body) for inner in reversed(command.commands))
+
+        def kept(command: Command) -> bool:
+            match command.command_type:
+                case CommandType.Declare:
+                    return command.var_name in keep or command.var_name in redeclared # type: ignore
+                case CommandType.Let:
+                    return command.var_name in keep # type: ignore
+                case _:
+                    return True
+
+        def remove(commands: List[Command]) -> List[Command]:
+            return [command for command in commands if kept(command)]
+
+        # Each body is filtered as walk_commands reaches its owner, before it is walked
+        commands = remove(commands)
+        for command in walk_commands(commands):
+            if isinstance(command, If) or isinstance(command, While):
+                command.commands = remove(command.commands)
+        return commands
+
+def walk_commands(commands: List[Command]):
+    stack = list(reversed(commands))
+    while len(stack) > 0:
+        command = stack.pop()
+        yield command
+        if isinstance(command, If) or isinstance(command, While):
+            stack.extend(reversed(command.commands))
+
+def command_expressions(command: Command) -> List[Expression]:
+    match command.command_type:
+        case CommandType.If | CommandType.While | CommandType.Print:
+            return [command.expr] # type: ignore
+        case CommandType.Let:
+            return [command.value] # type: ignore
+        case _:
+            return []
+
+def variables_in(expr: Expression):
+    stack = [expr]
+    while len(stack) > 0:
+        expr = stack.pop()
+        match expr.expr_type:
+            case ExpressionType.Variable:
+                yield expr.var_name # type: ignore
+            case ExpressionType.LiteralValue:
+                pass
+            case _:
+                stack.append(expr.lhs) # type: ignore
+                stack.append(expr.rhs) # type: ignore
+
+def program_size(commands: List[Command]) -> int:
+    size = 0
+    for command in walk_commands(commands):
+        size += 1
+        for expr in command_expressions(command):
+            stack = [expr]
+            while len(stack) > 0:
+                expr = stack.pop()
+                size += 1
+                if expr.expr_type not in [ExpressionType.Variable, ExpressionType.LiteralValue]:
+                    stack.append(expr.lhs) # type: ignore
+                    stack.append(expr.rhs) # type: ignore
+    return size
+
+def optimize_program(program: List[Command]) -> List[Command]:
+    return Optimizer().optimize(program)
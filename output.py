@@ -0,0 +1,47 @@
+import sys
+from typing import List, TextIO
+
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+# Collects Print output and writes it to the stream in chunks of roughly `buffer_size` characters.
+# Engines must flush before reading input, and when the program finishes or fails.
+class BufferedOutput:
+    def __init__(self, stream: TextIO | None = None, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        assert(buffer_size > 0)
+        self.stream = sys.stdout if stream is None else stream
+        self.buffer_size = buffer_size
+        self.parts: List[str] = []
+        self.size = 0
+
+    def write(self, value: int | float | str):
+        text = str(value)
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.parts) > 0:
+            self.stream.write("".join(self.parts))
+            self.parts.clear()
+            self.size = 0
+        self.stream.flush()
+
+# Writes every Print straight through, for interactive use
+class UnbufferedOutput:
+    def __init__(self, stream: TextIO | None = None):
+        self.stream = sys.stdout if stream is None else stream
+
+    def write(self, value: int | float | str):
+        self.stream.write(str(value))
+        self.stream.flush()
+
+    def flush(self):
+        self.stream.flush()
+
+Output = BufferedOutput | UnbufferedOutput
+
+def make_output(buffer_size: int = DEFAULT_BUFFER_SIZE, stream: TextIO | None = None) -> Output:
+    if buffer_size <= 0:
+        return UnbufferedOutput(stream)
+    return BufferedOutput(stream, buffer_size)
@@ -1,10 +1,9 @@
+from functools import lru_cache
 from typing import List, Union, Type
-from parsy import string, regex, seq, forward_declaration, Parser, generate, eof, whitespace as ws
-from folders_types import TypeType, If, While, Declare, Let, Print, Input, IntLit, FloatLit, StrLit, \
+from parsy import string, regex, seq, forward_declaration, Parser, generate, eof, fail, line_info, whitespace as ws
+from folders_types import Span, TypeType, Command, Expression, If, While, Declare, Let, Print, Input, IntLit, FloatLit, StrLit, \
     CharLit, EqualTo, LessThan, GreaterThan, Add, Subtract, Multiply, Divide, Variable
 
-parse_state = { "indent_level": 0 }
-
 def possibly(p: Parser):
     return p.times(0, 1)
 
@@ -14,14 +13,10 @@ def zero_or_more(p: Parser):
 def one_or_more(p: Parser):
     return p.at_least(1)
 
-@generate
-def indent_parser():
-    indent = " " * parse_state["indent_level"] * 4
-    matched = yield string(indent)
-    return matched
-
-def indented(p: Parser):
-    return indent_parser >> p
+# The grammar holds no state: blocks are parsed by separate parsers for each indent level, built the
+# first time that level is reached. Parsers are immutable, so any number of threads can share them.
+def indent_parser(indent_level: int) -> Parser:
+    return string(" " * indent_level * 4)
 
 whitespace = regex(r"[ \t]+")
 optional_whitespace = regex(r"[ \t]*")
@@ -34,6 +29,19 @@ def ows(p: Parser):
 def unescape(s: str):
     return s.encode().decode("unicode_escape")
 
+# Records where the node produced by `p` was found. parsy counts lines and columns from 0.
+def located(p: Parser) -> Parser:
+    def attach(marked):
+        (line, column), node, (end_line, end_column) = marked
+        node.span = Span(line + 1, column + 1, end_line + 1, end_column + 1)
+        return node
+    return p.mark().map(attach)
+
+def joined_span(lhs: Expression, rhs: Expression) -> Span | None:
+    if lhs.span is None or rhs.span is None:
+        return None
+    return Span(lhs.span.line, lhs.span.column, rhs.span.end_line, rhs.span.end_column)
+
 int_decl_parser = string("int").map(lambda _: TypeType.Int)
 float_decl_parser = string("float").map(lambda _: TypeType.Float)
 char_decl_parser = string("char").map(lambda _: TypeType.Char)
@@ -44,11 +52,11 @@ int_parser = regex(r"-?\d+").map(lambda x: IntLit(int(x)))
 string_parser = regex(r'"(?:\\.|[^"\\])*"').map(lambda x: StrLit(unescape(x[1:-1])))
 char_parser = regex(r"'.+'").map(lambda x: CharLit(unescape(x[1:-1])))
 float_lit = regex(r"-?\d+\.\d+").map(lambda x: FloatLit(float(x)))
-lit_parser = float_lit | int_parser | string_parser | char_parser
+lit_parser = located(float_lit | int_parser | string_parser | char_parser)
 
 expr_parser = forward_declaration()
 
-var_ref_parser = identifier.map(Variable)
+var_ref_parser = located(identifier.map(Variable))
 
 mult_or_divide_op_parser = ows(string("*") | string("/"))
 add_or_subtract_op_parser = ows(string("+") | string("-"))
@@ -63,10 +71,9 @@ def make_binary_resolver(op1_symbol: str, op1: BinaryOp, op2: BinaryOp):
 
         prev = res[0]
         for next in res[1]:
-            if next[0] == op1_symbol:
-                prev = op1(prev, next[1])
-            else:
-                prev = op2(prev, next[1])
+            expr = op1(prev, next[1]) if next[0] == op1_symbol else op2(prev, next[1])
+            expr.span = joined_span(prev, next[1])
+            prev = expr
 
         return prev
     return resolver
@@ -81,7 +88,9 @@ def resolve_eq_expr(res: List):
 
     prev = res[0]
     for next in res[1]:
-        prev = EqualTo(prev, next[1])
+        expr = EqualTo(prev, next[1])
+        expr.span = joined_span(prev, next[1])
+        prev = expr
 
     return prev
 
@@ -116,8 +125,6 @@ expr_parser.become(
     ).map(resolve_eq_expr)
 )
 
-command_parser = forward_declaration()
-
 declare_parser = seq(
     type_parser,
     whitespace,
@@ -137,51 +144,56 @@ input_parser = (
 
 comment_parser = possibly(ows(string("#") >> regex(r"[^\n\r]*")))
 
-@generate
-def commands_parser():
-    commands = []
-
-    while True:
-        command_result = yield possibly(command_parser)
-        if len(command_result) == 0:
-            break
-        commands.append(command_result[0])
-        yield (comment_parser >> newline).many()
-
-    return commands
-
-@generate
-def if_parser():
-    yield string("if") >> whitespace
-    if_expr = yield expr_parser
-    yield string(":") >> optional_whitespace >> comment_parser >> newline
-    parse_state["indent_level"] += 1
-    if_commands = yield commands_parser
-    assert(len(if_commands) > 0)
-    parse_state["indent_level"] -= 1
-
-    return If(if_expr, if_commands)
-
-@generate
-def while_parser():
-    yield string("while") >> whitespace
-    while_expr = yield expr_parser
-    yield string(":") >> optional_whitespace >> comment_parser >> newline
-    parse_state["indent_level"] += 1
-    while_commands = yield commands_parser
-    assert(len(while_commands) > 0)
-    parse_state["indent_level"] -= 1
-
-    return While(while_expr, while_commands)
-
-command_parser.become(indented(
-    if_parser | while_parser | seq(let_parser | declare_parser | print_parser | input_parser, comment_parser) \
+simple_command_parser = seq(located(let_parser | declare_parser | print_parser | input_parser), comment_parser) \
     .map(lambda x: x[0])
-))
+
+@lru_cache(maxsize=None)
+def commands_parser(indent_level: int) -> Parser:
+    @generate
+    def parser():
+        commands = []
+
+        while True:
+            command_result = yield possibly(command_parser(indent_level))
+            if len(command_result) == 0:
+                break
+            commands.append(command_result[0])
+            yield (comment_parser >> newline).many()
+
+        return commands
+    return parser
+
+def block_parser(keyword: str, node: Type[If] | Type[While], indent_level: int) -> Parser:
+    @generate
+    def parser():
+        line, column = yield line_info
+        yield string(keyword) >> whitespace
+        expr = yield expr_parser
+        yield string(":") >> optional_whitespace >> comment_parser >> newline
+        commands = yield commands_parser(indent_level + 1)
+        if len(commands) == 0:
+            yield fail("an indented block")
+
+        # A block ends where its last command does, not after the blank lines and comments that follow it
+        block = node(expr, commands)
+        end = commands[-1].span
+        block.span = Span(line + 1, column + 1, end.end_line, end.end_column)
+        return block
+    return parser
+
+@lru_cache(maxsize=None)
+def command_parser(indent_level: int) -> Parser:
+    return indent_parser(indent_level) >> (
+        block_parser("if", If, indent_level) | block_parser("while", While, indent_level) | simple_command_parser
+    )
 
 program_parser = seq(
     (ws >> comment_parser).many(),
-    commands_parser,
+    commands_parser(0),
     possibly(ws),
     eof
 ).map(lambda x: x[1])
+
+# Safe to call from many threads at once; a failed parse leaves nothing behind
+def parse_program(script: str) -> List[Command]:
+    return program_parser.parse(script)
@@ -0,0 +1,242 @@
+import json
+from time import perf_counter_ns
+from typing import Callable, Dict, List, TextIO, Tuple
+from folders_types import Command, Expression, CommandType, ExpressionType
+from interpreter import Interpreter, MAX_RECURSIVE_HEIGHT
+from loader import binary_expressions
+from caches import MISSING
+from source_map import SourceMap
+
+# Counts how often each command and expression runs and how long it takes. Profiling lives in a
+# subclass of Interpreter, so running without it costs nothing. Nodes are known by the folder they were
+# read from; both the tree engine (run_command/evaluate) and the disk engine
+# (execute_command/eval_expression) are covered, as are the explicit stacks they switch to for deep
+# expressions (evaluate_deep/eval_expression_deep). The vm and python engines have no nodes to profile.
+
+class NodeStats:
+    __slots__ = ("kind", "count", "total_ns", "self_ns")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.count = 0
+        self.total_ns = 0   # including the nodes run on its behalf
+        self.self_ns = 0    # excluding them
+
+class Profiler:
+    def __init__(self):
+        self.nodes: Dict[str, NodeStats] = {}
+        # Self time of every distinct stack of nodes, for flamegraphs
+        self.stacks: Dict[Tuple[str, ...], int] = {}
+        self.stack: List[str] = []
+        self.child_ns: List[int] = []
+        self.start_ns: List[int] = []
+
+    # Starts timing a node, until the matching call to leave
+    def enter(self, key: str, kind: str):
+        if key not in self.nodes:
+            self.nodes[key] = NodeStats(kind)
+        self.stack.append(key)
+        self.child_ns.append(0)
+        self.start_ns.append(perf_counter_ns())
+
+    def leave(self):
+        elapsed = perf_counter_ns() - self.start_ns.pop()
+        self_ns = elapsed - self.child_ns.pop()
+        stats = self.nodes[self.stack[-1]]
+        stats.count += 1
+        stats.total_ns += elapsed
+        stats.self_ns += self_ns
+        stack = tuple(self.stack)
+        self.stacks[stack] = self.stacks.get(stack, 0) + self_ns
+        self.stack.pop()
+        if len(self.child_ns) > 0:
+            self.child_ns[-1] += elapsed
+
+    def measure(self, key: str, kind: str, run: Callable, node):
+        self.enter(key, kind)
+        try:
+            return run(node)
+        finally:
+            self.leave()
+
+    # Hottest nodes first, with their place in the script when the program has a source map
+    def report(self, source_map: SourceMap | None = None) -> List[Dict]:
+        rows = []
+        for key, stats in sorted(self.nodes.items(), key=lambda item: item[1].self_ns, reverse=True):
+            span = None if source_map is None else source_map.lookup(key)
+            rows.append({
+                "path": key,
+                "kind": stats.kind,
+                "line": None if span is None else span.line,
+                "column": None if span is None else span.column,
+                "count": stats.count,
+                "total_ns": stats.total_ns,
+                "self_ns": stats.self_ns,
+            })
+        return rows
+
+    def write_text(self, out: TextIO, source_map: SourceMap | None = None, limit: int | None = 30):
+        rows = self.report(source_map)
+        out.write(f"{'self (ms)':>10} {'total (ms)':>11} {'count':>10} {'line':>6}  {'kind':<12} path\n")
+        for row in rows[:limit]:
+            line = "-" if row["line"] is None else row["line"]
+            out.write(f"{row['self_ns'] / 1e6:>10.3f} {row['total_ns'] / 1e6:>11.3f} {row['count']:>10} {line:>6}  "
+                      f"{row['kind']:<12} {row['path']}\n")
+
+    def write_json(self, out: TextIO, source_map: SourceMap | None = None):
+        json.dump(self.report(source_map), out, indent=2)
+        out.write("\n")
+
+    # One line per stack, "frame;frame;frame <microseconds>", as read by flamegraph.pl and speedscope
+    def write_collapsed(self, out: TextIO, source_map: SourceMap | None = None):
+        def frame(key: str) -> str:
+            location = None if source_map is None else source_map.describe(key)
+            name = f"{self.nodes[key].kind} {key}" if location is None else f"{self.nodes[key].kind} {location}"
+            return name.replace(";", ":")
+        for stack, self_ns in self.stacks.items():
+            if self_ns // 1000 > 0:
+                out.write(f"{';'.join(map(frame, stack))} {self_ns // 1000}\n")
+
+    def write(self, out: TextIO, format: str = "text", source_map: SourceMap | None = None):
+        match format:
+            case "text":
+                self.write_text(out, source_map)
+            case "json":
+                self.write_json(out, source_map)
+            case "collapsed":
+                self.write_collapsed(out, source_map)
+            case _:
+                raise Exception(f"Invalid profile format: {format}")
+
+# Nodes made by the optimizer have no folder of their own
+def node_key(node: Command | Expression, kind: str) -> str:
+    return node.path if node.path is not None else f"<{kind} {id(node):x}>"
+
+class ProfilingInterpreter(Interpreter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profiler = Profiler()
+
+    # An If or While whose body is to be run is timed until the body has run (see leave_block), so each
+    # iteration of a While counts as a run of it
+    def run_command(self, command: Command) -> List[Command] | None:
+        kind = CommandType(command.command_type).name
+        self.profiler.enter(node_key(command, kind), kind)
+        body = None
+        try:
+            body = super().run_command(command)
+        finally:
+            if body is None:
+                self.profiler.leave()
+        return body
+
+    def leave_block(self, command: Command) -> List[Command] | None:
+        self.profiler.leave()
+        return super().leave_block(command)
+
+    def evaluate(self, expr: Expression):
+        kind = ExpressionType(expr.expr_type).name
+        return self.profiler.measure(node_key(expr, kind), kind, super().evaluate, expr)
+
+    # Interpreter.evaluate_deep, timing each operator from when its operands are pushed until it has been
+    # applied. The expression itself is already being timed by evaluate, which called this.
+    def evaluate_deep(self, expr: Expression):
+        root = expr
+        values: List[int | float | str] = []
+        stack = [(expr, False)]
+        entered = 0
+        try:
+            while len(stack) > 0:
+                expr, operands_ready = stack.pop()
+                if operands_ready:
+                    rhs = values.pop()
+                    values[-1] = expr.operation(values[-1], rhs) # type: ignore
+                    if expr is not root:
+                        self.profiler.leave()
+                        entered -= 1
+                elif expr.height <= MAX_RECURSIVE_HEIGHT:
+                    values.append(self.evaluate(expr))
+                else:
+                    if expr is not root:
+                        kind = ExpressionType(expr.expr_type).name
+                        self.profiler.enter(node_key(expr, kind), kind)
+                        entered += 1
+                    stack.append((expr, True))
+                    stack.append((expr.rhs, False)) # type: ignore
+                    stack.append((expr.lhs, False)) # type: ignore
+            return values[0]
+        finally:
+            for _ in range(entered):
+                self.profiler.leave()
+
+    # On disk the kind of a node is only read the first time it runs
+    def node_kind(self, node_dir: str, kinds: type) -> str:
+        stats = self.profiler.nodes.get(node_dir)
+        if stats is not None:
+            return stats.kind
+        return kinds(self.get_dir_count(self.get_dir(node_dir)[0])).name
+
+    def execute_command(self, command_dir: str) -> str | None:
+        kind = self.node_kind(command_dir, CommandType)
+        self.profiler.enter(command_dir, kind)
+        body_dir = None
+        try:
+            body_dir = super().execute_command(command_dir)
+        finally:
+            if body_dir is None:
+                self.profiler.leave()
+        return body_dir
+
+    def leave_block_dir(self, command_dir: str) -> str | None:
+        self.profiler.leave()
+        return super().leave_block_dir(command_dir)
+
+    def eval_expression(self, expr_dir: str, depth: int = 0):
+        self.profiler.enter(expr_dir, self.node_kind(expr_dir, ExpressionType))
+        try:
+            return super().eval_expression(expr_dir, depth)
+        finally:
+            self.profiler.leave()
+
+    # Interpreter.eval_expression_deep, timing every node below the one eval_expression is timing, as
+    # eval_expression would have had it recursed: operators until they have been applied, and cached
+    # values and leaves as they are read
+    def eval_expression_deep(self, expr_dir: str):
+        root = expr_dir
+        values: List[int | float | str] = []
+        stack: List[Tuple[str, List[str] | None]] = [(expr_dir, None)]
+        entered = 0
+        try:
+            while len(stack) > 0:
+                expr_dir, e = stack.pop()
+                timed = expr_dir != root
+                if e is not None:
+                    rhs = values.pop()
+                    values[-1] = self.eval_operation(expr_dir, e, self.get_dir_count(e[0]), values[-1], rhs)
+                    if timed:
+                        self.profiler.leave()
+                        entered -= 1
+                    continue
+
+                if timed:
+                    self.profiler.enter(expr_dir, self.node_kind(expr_dir, ExpressionType))
+                    entered += 1
+                value = self.expr_cache.lookup(expr_dir, MISSING)
+                if value is MISSING:
+                    e = self.get_dir(expr_dir)
+                    assert(len(e) >= 2)
+                    if self.get_dir_count(e[0]) in binary_expressions:
+                        assert(len(e) == 3)
+                        stack.append((expr_dir, e))
+                        stack.append((e[2], None))
+                        stack.append((e[1], None))
+                        continue
+                    value = self.eval_leaf(expr_dir, e)
+                values.append(value)
+                if timed:
+                    self.profiler.leave()
+                    entered -= 1
+            return values[0]
+        finally:
+            for _ in range(entered):
+                self.profiler.leave()
@@ -0,0 +1,111 @@
+import marshal
+import pickle
+from hashlib import sha1
+from os import stat, makedirs, replace, getpid, environ, path
+from time import time_ns
+from typing import Dict, List, Tuple
+from folders_types import Command
+from loader import Folder, scan_tree, decode_commands
+
+CACHE_FORMAT_VERSION = 3
+
+# Directories modified this close to (or after) the scan could have changed within the same
+# filesystem timestamp tick, so they are never trusted (the same idea as git's "racily clean" entries)
+RACY_WINDOW_NS = 1_000_000_000
+
+def default_cache_dir() -> str:
+    cache_home = environ.get("XDG_CACHE_HOME", path.join(path.expanduser("~"), ".cache"))
+    return path.join(cache_home, "folders")
+
+def cache_file_path(program_dir: str, cache_dir: str) -> str:
+    key = sha1(f"{path.abspath(program_dir)}\0{program_dir}".encode("utf-8")).hexdigest()
+    return path.join(cache_dir, f"{key}.cache")
+
+# (relative path, inode, mtime, link count) of every directory in the tree, in preorder. Adding,
+# removing or renaming a folder changes the mtime (and usually the link count) of its parent.
+Fingerprint = Tuple[List[str], List[int], List[int], List[int]]
+
+def fingerprint_tree(tree: Folder) -> Fingerprint:
+    root = tree.path
+    assert(root is not None)
+
+    paths, inodes, mtimes, links = [], [], [], []
+    stack = [tree]
+    while len(stack) > 0:
+        folder = stack.pop()
+        assert(folder.path is not None)
+        st = stat(folder.path)
+        paths.append(path.relpath(folder.path, root))
+        inodes.append(st.st_ino)
+        mtimes.append(st.st_mtime_ns)
+        links.append(st.st_nlink)
+        stack.extend(reversed(folder))
+    return paths, inodes, mtimes, links
+
+def fingerprint_matches(program_dir: str, fingerprint: Fingerprint, scanned_at: int) -> bool:
+    paths, inodes, mtimes, links = fingerprint
+    for rel_path, inode, mtime, link_count in zip(paths, inodes, mtimes, links):
+        if mtime >= scanned_at - RACY_WINDOW_NS:
+            return False
+        try:
+            st = stat(path.join(program_dir, rel_path))
+        except OSError:
+            return False
+        if st.st_ino != inode or st.st_mtime_ns != mtime or st.st_nlink != link_count:
+            return False
+    return True
+
+class ProgramCache:
+    def __init__(self, cache_dir: str | None = None):
+        self.cache_dir = default_cache_dir() if cache_dir is None else cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, program_dir: str) -> List[Command] | None:
+        try:
+            with open(cache_file_path(program_dir, self.cache_dir), "rb") as f:
+                version, scanned_at, fingerprint, pickled_program = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if version != CACHE_FORMAT_VERSION or not fingerprint_matches(program_dir, fingerprint, scanned_at):
+            return None
+        # A cache file that is damaged past its header is a miss too
+        try:
+            return pickle.loads(pickled_program)
+        except (pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError, ImportError):
+            return None
+
+    def store(self, program_dir: str, tree: Folder, program: List[Command], scanned_at: int):
+        try:
+            pickled_program = pickle.dumps(program, pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            # Too deeply nested to pickle; such programs are simply not cached
+            return
+
+        cache_path = cache_file_path(program_dir, self.cache_dir)
+        temp_path = f"{cache_path}.{getpid()}.tmp"
+        try:
+            makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_path, "wb") as f:
+                marshal.dump((CACHE_FORMAT_VERSION, scanned_at, fingerprint_tree(tree), pickled_program), f)
+            replace(temp_path, cache_path)
+        except OSError:
+            # A cache that can't be written (read-only, or full) only means the next load scans again
+            return
+
+    def stats(self) -> Dict[str, int | None]:
+        return { "size": None, "max_size": None, "hits": self.hits, "misses": self.misses, "evictions": 0 }
+
+    def load_program(self, program_dir: str, jobs: int = 1) -> List[Command]:
+        program = self.lookup(program_dir)
+        if program is not None:
+            self.hits += 1
+            return program
+
+        self.misses += 1
+        scanned_at = time_ns()
+        tree = scan_tree(program_dir, jobs)
+        program = decode_commands(tree)
+        self.store(program_dir, tree, program, scanned_at)
+        return program
@@ -0,0 +1,121 @@
+import marshal
+import zlib
+from array import array
+from bisect import bisect_left
+from os import stat, replace, getpid, path
+from typing import List, Tuple
+from folders_types import CommandType, ExpressionType, Span, Command, Expression
+from compiler import FoldersCompiler
+from incremental import Node
+
+SOURCE_MAP_VERSION = 1
+
+# A source map records where in the folderscript each command and expression of a compiled program
+# came from, by the node's folder path relative to the program. It is written next to the program, like
+# the incremental manifest, so the program's own folders are untouched, and is only trusted while the
+# program is the same file or directory with the same mtime.
+#
+# Paths are stored sorted, as one zlib compressed block of text, with the spans in a parallel array of
+# 32 bit integers; paths share long prefixes, so this is small. Loading is a decompress and a split, and
+# lookups bisect the sorted paths, so nothing is built per entry however large the program.
+
+def source_map_path(program_path: str) -> str:
+    program_path = path.normpath(program_path)
+    return path.join(path.dirname(program_path), f".{path.basename(program_path)}.folders-sourcemap")
+
+def program_identity(program_path: str) -> Tuple[int, int]:
+    st = stat(program_path)
+    return st.st_ino, st.st_mtime_ns
+
+# (relative folder path, span) of every node that has a span. Folders are named as FoldersCompiler
+# names them, or as in `tree` when it is given: the names actually written, which after an incremental
+# compile are whatever names the folders were created with.
+def source_map_entries(program: List[Command], tree: Node | None = None) -> List[Tuple[str, Span]]:
+    def child(folder: Node | None, i: int) -> Tuple[str, Node | None]:
+        if folder is None:
+            return FoldersCompiler.folder_name_from_index(i), None
+        return folder[i].name, folder[i]
+
+    entries: List[Tuple[str, Span]] = []
+    stack: List[Tuple[str, Node | None, Command | Expression]] = []
+    for i, command in enumerate(program):
+        name, folder = child(tree, i)
+        stack.append((name, folder, command))
+    while len(stack) > 0:
+        node_path, folder, node = stack.pop()
+        if node.span is not None:
+            entries.append((node_path, node.span))
+
+        # The subfolders of a node, by their index in its folder, and the nodes they hold
+        children: List[Tuple[int, Command | Expression]] = []
+        if isinstance(node, Command):
+            match node.command_type:
+                case CommandType.If | CommandType.While:
+                    children.append((1, node.expr)) # type: ignore
+                    commands_name, commands_folder = child(folder, 2)
+                    for i, command in enumerate(node.commands): # type: ignore
+                        name, command_folder = child(commands_folder, i)
+                        stack.append((f"{node_path}/{commands_name}/{name}", command_folder, command))
+                case CommandType.Let:
+                    children.append((2, node.value)) # type: ignore
+                case CommandType.Print:
+                    children.append((1, node.expr)) # type: ignore
+        elif node.expr_type not in [ExpressionType.Variable, ExpressionType.LiteralValue]:
+            children.append((1, node.lhs)) # type: ignore
+            children.append((2, node.rhs)) # type: ignore
+
+        for i, expr in children:
+            name, expr_folder = child(folder, i)
+            stack.append((f"{node_path}/{name}", expr_folder, expr))
+    return entries
+
+def write_source_map(program_path: str, source: str, program: List[Command], tree: Node | None = None):
+    entries = sorted(source_map_entries(program, tree))
+    paths = "\n".join([node_path for node_path, _ in entries]).encode("utf-8")
+    spans = array("I")
+    for _, span in entries:
+        spans.extend(span)
+
+    map_path = source_map_path(program_path)
+    temp_path = f"{map_path}.{getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        marshal.dump((SOURCE_MAP_VERSION, program_identity(program_path), source, zlib.compress(paths), spans.tobytes()), f)
+    replace(temp_path, map_path)
+
+class SourceMap:
+    def __init__(self, program_path: str, source: str, paths: List[str], spans: array):
+        # Node paths of a loaded program start with the program path exactly as it was given
+        self.prefix = f"{program_path.rstrip('/') or '/'}/"
+        self.source = source
+        self.paths = paths
+        self.spans = spans
+
+    def lookup(self, node_path: str) -> Span | None:
+        if not node_path.startswith(self.prefix):
+            return None
+        relative = node_path[len(self.prefix):]
+        i = bisect_left(self.paths, relative)
+        if i == len(self.paths) or self.paths[i] != relative:
+            return None
+        return Span(*self.spans[i * 4:i * 4 + 4])
+
+    # "script:line:column", as compilers print it
+    def describe(self, node_path: str) -> str | None:
+        span = self.lookup(node_path)
+        return None if span is None else f"{self.source}:{span.line}:{span.column}"
+
+def load_source_map(program_path: str) -> SourceMap | None:
+    try:
+        with open(source_map_path(program_path), "rb") as f:
+            version, identity, source, paths, span_bytes = marshal.load(f)
+        if version != SOURCE_MAP_VERSION or tuple(identity) != program_identity(program_path):
+            return None
+        spans = array("I")
+        spans.frombytes(span_bytes)
+        path_list = zlib.decompress(paths).decode("utf-8").split("\n") if len(spans) > 0 else []
+    except (OSError, EOFError, ValueError, TypeError, zlib.error):
+        return None
+    # Four integers per span, one span per path
+    if len(spans) != 4 * len(path_list):
+        return None
+    return SourceMap(program_path, source, path_list, spans)
@@ -0,0 +1,5 @@
+import sys
+from os import path
+
+# The modules live at the repository root and are imported by name, as the scripts there import them
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
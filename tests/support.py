@@ -0,0 +1,60 @@
+import io
+import sys
+from os import path
+from typing import List
+from folders_types import Command
+from compiler import FoldersCompiler
+from fast_parser import parse_program
+from interpreter import Interpreter
+from loader import load_program
+from output import BufferedOutput
+
+ENGINES = ["tree", "vm", "python", "disk"]
+
+EXAMPLES_DIR = path.join(path.dirname(path.dirname(path.abspath(__file__))), "examples")
+
+def read_example(name: str) -> str:
+    with open(path.join(EXAMPLES_DIR, f"{name}.folderscript"), "r") as f:
+        return f.read()
+
+# Compiles a script to folders in `build_dir`, returning the encoded tree
+def compile_script(script: str, build_dir: str, optimize: bool = False, minimize: bool = False,
+                   incremental: bool = False, rescan: bool = False) -> list:
+    return FoldersCompiler().compile(parse_program(script), True, build_dir, optimize=optimize, minimize=minimize,
+                                     incremental=incremental, rescan=rescan)
+
+# Runs an in-memory program on one of the engines that take one, returning what it printed
+def run_program(engine: str, program: List[Command], stdin: str = "") -> str:
+    stream = io.StringIO()
+    output = BufferedOutput(stream)
+    saved_stdin = sys.stdin
+    sys.stdin = io.StringIO(stdin)
+    try:
+        match engine:
+            case "tree":
+                Interpreter(output).run_program(program)
+            case "vm":
+                from vm import VM, compile_program
+                VM(compile_program(program), output).run()
+            case "python":
+                from transpiler import transpile_program, run_python
+                run_python(transpile_program(program), "<test>", output)
+            case _:
+                raise Exception(f"Invalid engine: {engine}")
+    finally:
+        sys.stdin = saved_stdin
+    return stream.getvalue()
+
+# Runs a compiled program from its folders, loading it first for the engines other than disk
+def run_directory(engine: str, program_dir: str, stdin: str = "") -> str:
+    if engine != "disk":
+        return run_program(engine, load_program(program_dir), stdin)
+
+    stream = io.StringIO()
+    saved_stdin = sys.stdin
+    sys.stdin = io.StringIO(stdin)
+    try:
+        Interpreter(BufferedOutput(stream)).run_directory(program_dir)
+    finally:
+        sys.stdin = saved_stdin
+    return stream.getvalue()
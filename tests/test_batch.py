@@ -0,0 +1,40 @@
+import pytest
+from batch import BatchRunner, run_one
+from support import read_example, compile_script
+
+LOOP = "int i\nwhile i < 1:\n    i = i\n"
+
+@pytest.fixture
+def programs(tmp_path):
+    compile_script(read_example("hi"), str(tmp_path / "hi"))
+    compile_script(read_example("name"), str(tmp_path / "name"))
+    compile_script(LOOP, str(tmp_path / "loop"))
+    (tmp_path / "name.in").write_text("Ada\n")
+    return tmp_path
+
+def test_run_one(programs):
+    result = run_one(str(programs / "name"), str(programs / "name.in"), 5, "tree")
+    assert (result.status, result.stdout, result.error) == ("ok", "What's your name >> Hello, Ada\n", None)
+    assert result.instructions is not None and result.instructions > 0
+
+@pytest.mark.parametrize("engine", ["tree", "vm", "python"])
+def test_a_program_that_runs_too_long_times_out(programs, engine):
+    result = run_one(str(programs / "loop"), None, 0.2, engine)
+    assert result.status == "timeout"
+    assert result.error == "Timed out after 0.2s"
+
+def test_a_missing_stdin_file_is_an_error(programs):
+    result = run_one(str(programs / "name"), str(programs / "missing.in"), 5, "tree")
+    assert result.status == "error"
+    assert result.error is not None and result.error.startswith("FileNotFoundError")
+
+def test_a_missing_program_is_an_error(programs):
+    assert run_one(str(programs / "missing"), None, 5, "tree").status == "error"
+
+def test_runner_gives_each_result_with_its_index(programs):
+    paths = [str(programs / name) for name in ["loop", "hi", "name", "hi"]]
+    results = dict(BatchRunner(jobs=2, timeout=0.5).run(paths, stdin_dir=str(programs)))
+    assert sorted(results) == [0, 1, 2, 3]
+    assert [results[i].program for i in range(4)] == paths
+    assert [results[i].status for i in range(4)] == ["timeout", "ok", "ok", "ok"]
+    assert results[2].stdout == "What's your name >> Hello, Ada\n"
@@ -0,0 +1,48 @@
+import pytest
+from binary_format import MAGIC, VERSION, encode_tree, write_binary, read_tree, load_program_binary, is_binary_program, \
+    collapse, expand
+from loader import scan_tree
+from support import read_example, compile_script, run_directory, run_program
+
+@pytest.fixture
+def binary(tmp_path) -> bytes:
+    encoded = compile_script(read_example("name"), str(tmp_path / "program"))
+    return encode_tree(encoded)
+
+def test_collapse_and_expand_round_trip(tmp_path):
+    compile_script(read_example("serpinsky").replace("64", "8"), str(tmp_path / "program"))
+    collapse(str(tmp_path / "program"), str(tmp_path / "program.bin"))
+    expand(str(tmp_path / "program.bin"), str(tmp_path / "expanded"))
+    assert scan_tree(str(tmp_path / "expanded")) == scan_tree(str(tmp_path / "program"))
+    assert run_directory("disk", str(tmp_path / "expanded")) == run_directory("disk", str(tmp_path / "program"))
+
+def test_a_binary_program_runs(tmp_path, binary):
+    (tmp_path / "program.bin").write_bytes(binary)
+    assert is_binary_program(str(tmp_path / "program.bin"))
+    program = load_program_binary(str(tmp_path / "program.bin"))
+    assert run_program("tree", program, "Ada\n") == "What's your name >> Hello, Ada\n"
+
+@pytest.mark.parametrize("corrupt, message", [
+    (lambda data: b"", "Not a binary Folders program"),
+    (lambda data: MAGIC, "Not a binary Folders program"),
+    (lambda data: b"PK\x03\x04" + data[4:], "Not a binary Folders program"),
+    (lambda data: MAGIC + bytes([VERSION + 1]) + data[5:], f"Unsupported binary Folders version: {VERSION + 1}"),
+    (lambda data: data[:len(data) // 2], "Truncated binary Folders program"),
+    # A varint whose continuation bit is set on the last byte
+    (lambda data: data[:-1] + b"\x80", "Truncated binary Folders program"),
+    (lambda data: data + b"\x00", "Unexpected data after the end of the binary Folders program"),
+])
+def test_a_corrupt_binary_is_rejected(tmp_path, binary, corrupt, message):
+    (tmp_path / "program.bin").write_bytes(corrupt(binary))
+    with pytest.raises(Exception, match=message):
+        read_tree(str(tmp_path / "program.bin"))
+
+def test_a_directory_is_not_a_binary_program(tmp_path):
+    compile_script(read_example("hi"), str(tmp_path / "program"))
+    assert not is_binary_program(str(tmp_path / "program"))
+
+def test_write_binary_matches_collapse(tmp_path):
+    encoded = compile_script(read_example("hi"), str(tmp_path / "program"))
+    write_binary(str(tmp_path / "written.bin"), encoded)
+    collapse(str(tmp_path / "program"), str(tmp_path / "collapsed.bin"))
+    assert (tmp_path / "written.bin").read_bytes() == (tmp_path / "collapsed.bin").read_bytes()
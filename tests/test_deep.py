@@ -0,0 +1,99 @@
+import sys
+import pytest
+from os import path
+from typing import List
+from folders_types import TypeType, Command, If, While, Declare, Let, Print, StrLit, IntLit, Variable, EqualTo, \
+    LessThan, Add
+from fast_parser import parse_program
+from compiler import FoldersCompiler, remove_tree
+from optimizer import optimize_program
+from minimizer import minimize_program
+from transpiler import transpile_program
+from binary_format import write_binary, load_program_binary
+from source_map import source_map_entries
+from incremental import written_tree
+from support import ENGINES, compile_script, run_directory, run_program
+
+# Deeper than the default recursion limit, so anything that recurses per level fails
+DEPTH = 1500
+
+# `b = a + a + ... + a`, a left-leaning chain of DEPTH operators
+def chain_script(depth: int = DEPTH) -> str:
+    return f"int a\na = 1\nint b\nb = {' + '.join(['a'] * depth)}\nprint(b)\n"
+
+# Ifs and Whiles nested `depth` deep around a Print, each run once
+def nested_program(depth: int = DEPTH) -> List[Command]:
+    body: List[Command] = [Print(StrLit("deep\n"))]
+    for i in range(depth):
+        if i % 2 == 1:
+            body = [Declare(TypeType.Int, f"v{i}"), If(EqualTo(IntLit(1), IntLit(1)), body)]
+        else:
+            body = [While(LessThan(Variable("k"), IntLit(1)), body + [Let("k", Add(Variable("k"), IntLit(1)))])]
+    return [Declare(TypeType.Int, "k")] + body
+
+# A scratch directory for trees too deep for pytest's own cleanup, which uses the recursive shutil.rmtree
+@pytest.fixture
+def deep_dir(tmp_path):
+    yield tmp_path
+    for entry in tmp_path.iterdir():
+        if entry.is_dir():
+            remove_tree(str(entry))
+
+# Runs with a recursion limit far below the depth of the program
+def with_recursion_limit(limit: int, run):
+    saved = sys.getrecursionlimit()
+    sys.setrecursionlimit(limit)
+    try:
+        return run()
+    finally:
+        sys.setrecursionlimit(saved)
+
+@pytest.mark.parametrize("engine", ["tree", "vm", "python"])
+def test_deep_expression(engine):
+    assert run_program(engine, parse_program(chain_script())) == str(DEPTH)
+
+@pytest.mark.parametrize("engine", ["tree", "vm", "python"])
+def test_deep_expression_optimized_and_minimized(engine):
+    program = minimize_program(optimize_program(parse_program(chain_script())))
+    assert run_program(engine, program) == str(DEPTH)
+
+def test_deep_expression_transpiles():
+    assert "def run(write, read):" in transpile_program(parse_program(chain_script()))
+
+@pytest.mark.parametrize("optimize, minimize", [(False, False), (True, True)])
+def test_deep_expression_on_disk(deep_dir, optimize, minimize):
+    build_dir = str(deep_dir / "program")
+    encoded = compile_script(chain_script(), build_dir, optimize, minimize)
+    for engine in ENGINES:
+        assert run_directory(engine, build_dir) == str(DEPTH)
+
+    write_binary(str(deep_dir / "program.bin"), encoded)
+    assert run_program("tree", load_program_binary(str(deep_dir / "program.bin"))) == str(DEPTH)
+
+def test_deep_expression_compiles_incrementally_with_a_source_map(deep_dir):
+    build_dir = str(deep_dir / "program")
+    compile_script(chain_script(DEPTH // 2), build_dir, incremental=True)
+    compile_script(chain_script(), build_dir, incremental=True)
+    assert run_directory("disk", build_dir) == str(DEPTH)
+    entries = source_map_entries(parse_program(chain_script()), written_tree(build_dir))
+    # 5 commands, the chain's DEPTH variables and DEPTH - 1 operators, and the other two expressions
+    assert len(entries) == 5 + (2 * DEPTH - 1) + 2
+    assert all(path.isdir(path.join(build_dir, node_path)) for node_path, _ in entries)
+
+@pytest.mark.parametrize("engine", ["tree", "vm"])
+@pytest.mark.parametrize("optimize", [False, True])
+def test_deep_nesting(engine, optimize):
+    program = nested_program()
+    if optimize:
+        program = optimize_program(program)
+    assert run_program(engine, program) == "deep\n"
+
+def test_deep_nesting_is_rejected_by_the_python_engine():
+    with pytest.raises(Exception, match="nested too deeply"):
+        transpile_program(nested_program())
+
+def test_deep_nesting_on_disk(deep_dir):
+    # Nesting on disk is bounded by the length of a path, so this is less deep
+    depth = 500
+    FoldersCompiler().compile(nested_program(depth), True, str(deep_dir / "program"))
+    assert with_recursion_limit(250, lambda: run_directory("disk", str(deep_dir / "program"))) == "deep\n"
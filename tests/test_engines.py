@@ -0,0 +1,65 @@
+import pytest
+from fast_parser import parse_program
+from optimizer import optimize_program
+from loader import load_program
+from binary_format import write_binary, load_program_binary
+from support import ENGINES, read_example, compile_script, run_directory, run_program
+
+# The examples, with the input they read
+EXAMPLES = {
+    "hi": "",
+    "name": "Ada\n",
+    "serpinsky": "",
+}
+
+# Made small enough to run quickly on every engine
+def example_script(name: str) -> str:
+    return read_example(name).replace("xm = 64", "xm = 16").replace("ym = 64", "ym = 16")
+
+@pytest.fixture(scope="module")
+def expected():
+    # What the tree engine prints, which every other engine must match
+    return { name: run_program("tree", parse_program(example_script(name)), stdin) for name, stdin in EXAMPLES.items() }
+
+def test_examples_print_what_they_should(expected):
+    assert expected["hi"] == "hi"
+    assert expected["name"] == "What's your name >> Hello, Ada\n"
+    rows = expected["serpinsky"].split("\n")
+    assert rows[0] == "v" * 16
+    assert len(rows) == 17 and rows[-1] == ""
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("name", EXAMPLES)
+def test_engines_agree(tmp_path, expected, engine, name):
+    compile_script(example_script(name), str(tmp_path / "program"))
+    assert run_directory(engine, str(tmp_path / "program"), EXAMPLES[name]) == expected[name]
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("name", EXAMPLES)
+@pytest.mark.parametrize("optimize, minimize", [(True, False), (False, True), (True, True)])
+def test_optimized_and_minimized_programs_agree(tmp_path, expected, engine, name, optimize, minimize):
+    compile_script(example_script(name), str(tmp_path / "program"), optimize, minimize)
+    assert run_directory(engine, str(tmp_path / "program"), EXAMPLES[name]) == expected[name]
+
+@pytest.mark.parametrize("engine", ["tree", "vm", "python"])
+def test_optimizing_a_loaded_program(tmp_path, expected, engine):
+    compile_script(example_script("serpinsky"), str(tmp_path / "program"))
+    program = optimize_program(load_program(str(tmp_path / "program")))
+    assert run_program(engine, program) == expected["serpinsky"]
+
+@pytest.mark.parametrize("engine", ["tree", "vm", "python"])
+def test_binary_programs_agree(tmp_path, expected, engine):
+    encoded = compile_script(example_script("serpinsky"), str(tmp_path / "program"))
+    write_binary(str(tmp_path / "program.bin"), encoded)
+    assert run_program(engine, load_program_binary(str(tmp_path / "program.bin"))) == expected["serpinsky"]
+
+# A Declare inside a While raises the second time round, and still must once the variable, never read,
+# has been optimized away
+REDECLARED = "int i\nwhile i < 2:\n    int x\n    i = i + 1\nprint(i)\n"
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("optimize", [False, True])
+def test_engines_agree_on_a_redeclaration(tmp_path, engine, optimize):
+    compile_script(REDECLARED, str(tmp_path / "program"), optimize)
+    with pytest.raises(AssertionError):
+        run_directory(engine, str(tmp_path / "program"))
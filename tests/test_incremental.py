@@ -0,0 +1,77 @@
+import pytest
+from os import listdir, rmdir, path
+from loader import scan_tree
+from incremental import update_directory, manifest_path
+from support import read_example, compile_script, run_directory
+
+def edited(script: str, edit: int) -> str:
+    lines = script.split("\n")
+    match edit:
+        case 0:
+            # A declaration and an assignment before everything else
+            return "\n".join(["int added", "added = 3 + 4"] + lines)
+        case 1:
+            # A command at the start of the innermost loop
+            i = lines.index("        v = 'v'")
+            return "\n".join(lines[:i] + ["        p = p * 1"] + lines[i:])
+        case 2:
+            # A changed literal
+            return script.replace("p = 1", "p = 10")
+        case 3:
+            # Removed commands
+            return "\n".join([line for line in lines if not line.startswith("if s == 0") and not line.startswith("    print(\"")
+                              and not line.startswith("    input(")])
+        case _:
+            return script
+
+EDITS = [[0], [1], [2], [3], [0, 1, 2, 3], [0, 3, 1]]
+
+# Each edit is compiled incrementally over the previous one, and must give the same folders (their
+# names aside) and the same output as compiling from scratch
+@pytest.mark.parametrize("edits", EDITS)
+def test_incremental_matches_full_compile(tmp_path, edits):
+    incremental_dir = str(tmp_path / "incremental")
+    original = read_example("serpinsky").replace("xm = 64", "xm = 8").replace("ym = 64", "ym = 8")
+    script = original
+    compile_script(script, incremental_dir, incremental=True)
+    for edit in edits + [None]:
+        script = original if edit is None else edited(script, edit)
+        full_dir = str(tmp_path / f"full{edit}")
+        compile_script(script, incremental_dir, incremental=True)
+        compile_script(script, full_dir)
+        assert scan_tree(incremental_dir) == scan_tree(full_dir)
+        assert run_directory("disk", incremental_dir) == run_directory("disk", full_dir)
+
+def test_manifest_or_rescan_give_the_same_tree(tmp_path):
+    build_dir = str(tmp_path / "program")
+    script = read_example("serpinsky")
+    compile_script(script, build_dir, incremental=True)
+    encoded = compile_script(edited(script, 0), str(tmp_path / "full"))
+
+    stats = update_directory(build_dir, encoded, rescan=True)
+    assert stats.folders_created > 0
+    assert scan_tree(build_dir) == scan_tree(str(tmp_path / "full"))
+
+    stats = update_directory(build_dir, encoded)
+    assert stats.folders_created == 0 and stats.folders_removed == 0
+    assert path.isfile(manifest_path(build_dir))
+
+# An edit by hand below the root leaves the root's mtime alone, so only a rescan notices it
+def test_rescan_repairs_a_tree_edited_by_hand(tmp_path):
+    build_dir = str(tmp_path / "program")
+    full_dir = str(tmp_path / "full")
+    script = read_example("hi")
+    compile_script(script, build_dir, incremental=True)
+    compile_script(script, full_dir)
+
+    parent = build_dir
+    while len(listdir(parent)) > 0 and len(listdir(path.join(parent, sorted(listdir(parent))[0]))) > 0:
+        parent = path.join(parent, sorted(listdir(parent))[0])
+    rmdir(path.join(parent, sorted(listdir(parent))[0]))
+
+    compile_script(script, build_dir, incremental=True)
+    assert scan_tree(build_dir) != scan_tree(full_dir)
+
+    compile_script(script, build_dir, incremental=True, rescan=True)
+    assert scan_tree(build_dir) == scan_tree(full_dir)
+    assert run_directory("disk", build_dir) == "hi"
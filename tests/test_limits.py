@@ -0,0 +1,74 @@
+import io
+import pytest
+from fast_parser import parse_program
+from limits import Limits, LimitedInterpreter, ResourceLimitExceeded
+from output import BufferedOutput
+from support import compile_script
+
+LOOP = "int i\nwhile i < 1:\n    i = i\n"
+COUNT = "int i\nwhile i < 3:\n    i = i + 1\n    print(i)\n"
+
+def run_limited(engine: str, script: str, limits: Limits, tmp_path) -> LimitedInterpreter:
+    interpreter = LimitedInterpreter(BufferedOutput(io.StringIO()), limits=limits)
+    if engine == "tree":
+        interpreter.run_program(parse_program(script))
+    else:
+        compile_script(script, str(tmp_path / "program"))
+        interpreter.run_directory(str(tmp_path / "program"))
+    return interpreter
+
+def printed(interpreter: LimitedInterpreter) -> str:
+    return interpreter.counting_output.output.stream.getvalue() # type: ignore
+
+def exceeds(engine: str, script: str, limits: Limits, tmp_path) -> ResourceLimitExceeded:
+    with pytest.raises(ResourceLimitExceeded) as raised:
+        run_limited(engine, script, limits, tmp_path)
+    return raised.value
+
+ENGINES = ["tree", "disk"]
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_program_within_its_limits(tmp_path, engine):
+    # The Declare, four checks of the While's condition, and two commands in each of three iterations
+    limits = Limits(max_steps=11, max_seconds=60, max_output_bytes=3, max_variables=1, max_string_length=0)
+    interpreter = run_limited(engine, COUNT, limits, tmp_path)
+    assert printed(interpreter) == "123"
+    stats = interpreter.stats()
+    assert (stats.steps, stats.output_bytes, stats.variables) == (11, 3, 1)
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_step_limit(tmp_path, engine):
+    error = exceeds(engine, COUNT, Limits(max_steps=10), tmp_path)
+    assert (error.limit, error.maximum, error.stats.steps) == ("steps", 10, 11)
+    assert str(error).startswith("steps limit of 10 exceeded after 11 steps")
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_time_limit(tmp_path, engine):
+    error = exceeds(engine, LOOP, Limits(max_seconds=0.2), tmp_path)
+    assert error.limit == "seconds"
+    assert error.stats.elapsed > 0.2
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_output_limit_stops_before_the_print_that_exceeds_it(tmp_path, engine):
+    interpreter = LimitedInterpreter(BufferedOutput(io.StringIO()), limits=Limits(max_output_bytes=2))
+    with pytest.raises(ResourceLimitExceeded, match="output_bytes limit of 2"):
+        if engine == "tree":
+            interpreter.run_program(parse_program(COUNT))
+        else:
+            compile_script(COUNT, str(tmp_path / "program"))
+            interpreter.run_directory(str(tmp_path / "program"))
+    # What was printed before the limit was hit is flushed
+    assert printed(interpreter) == "12"
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_variable_limit(tmp_path, engine):
+    error = exceeds(engine, "int a\nint b\nint c\n", Limits(max_variables=2), tmp_path)
+    assert (error.limit, error.stats.variables) == ("variables", 3)
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_string_length_limit(tmp_path, engine):
+    script = "string s\nwhile 1 == 1:\n    s = s + \"ab\"\n"
+    error = exceeds(engine, script, Limits(max_string_length=9), tmp_path)
+    assert error.limit == "string_length"
+    # s is "ab" five times over when it passes 9 characters, after the Declare and five iterations
+    assert error.stats.steps == 1 + 5 * 2
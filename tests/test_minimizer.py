@@ -0,0 +1,64 @@
+import pytest
+from typing import List
+from folders_types import TypeType, Command, Declare, Let, Print, Input, FloatLit, IntLit, StrLit, Variable, Add, Divide
+from compiler import FoldersCompiler, count_folders
+from minimizer import names_by_cost, byte_cost
+from support import ENGINES, read_example, compile_script, run_directory
+
+def test_names_are_handed_out_cheapest_first():
+    names = names_by_cost()
+    first = [next(names) for _ in range(300)]
+    assert first[:2] == ["", "\0"]
+    assert len(set(first)) == len(first)
+    assert all(ord(c) < 0x80 for name in first for c in name)
+    costs = [sum(byte_cost(ord(c)) for c in name) for name in first]
+    assert costs == sorted(costs)
+
+# Float literals that only differ once compiled to float32: beyond its range, signed zeros and NaNs
+def float_program() -> List[Command]:
+    program: List[Command] = []
+    for value in [1e39, 1e40, -1e39, -0.0, 0.0, 0.1, 0.1, float("nan"), float("nan"), -0.0, 1e39]:
+        program += [Print(FloatLit(value)), Print(StrLit(" "))]
+    program += [Declare(TypeType.Float, "f"), Print(Variable("f"))]
+    return program
+
+# More variables than there are single byte names, each used a different number of times
+def many_variables_program() -> List[Command]:
+    program: List[Command] = [Declare(TypeType.Int, "total"), Input("total")]
+    for i in range(200):
+        program += [Declare(TypeType.Int, f"v{i}"), Let(f"v{i}", IntLit(i))]
+        for _ in range(i % 3):
+            program.append(Let("total", Add(Variable("total"), Variable(f"v{i}"))))
+    program.append(Print(Variable("total")))
+    return program
+
+def compile_program(program: List[Command], build_dir: str, minimize: bool) -> list:
+    return FoldersCompiler().compile(program, True, build_dir, minimize=minimize)
+
+@pytest.mark.parametrize("make_program, stdin", [(float_program, ""), (many_variables_program, "5\n")])
+def test_minimized_programs_agree(tmp_path, make_program, stdin):
+    plain = compile_program(make_program(), str(tmp_path / "plain"), False)
+    minimized = compile_program(make_program(), str(tmp_path / "minimized"), True)
+    assert count_folders(minimized) < count_folders(plain)
+
+    expected = run_directory("tree", str(tmp_path / "plain"), stdin)
+    for engine in ENGINES:
+        assert run_directory(engine, str(tmp_path / "minimized"), stdin) == expected
+
+def test_float_literals_keep_their_compiled_values(tmp_path):
+    compile_program(float_program(), str(tmp_path / "minimized"), True)
+    assert run_directory("tree", str(tmp_path / "minimized")) == "inf inf -inf -0.0 0.0 0.10000000149011612 " \
+        "0.10000000149011612 nan nan -0.0 inf 0.0"
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_minimized_program_still_fails_where_it_did(tmp_path, engine):
+    program = [Declare(TypeType.Int, "zero"), Print(StrLit("before")), Print(Divide(IntLit(1), Variable("zero"))),
+               Print(StrLit("after"))]
+    compile_program(program, str(tmp_path / "minimized"), True)
+    with pytest.raises(ZeroDivisionError):
+        run_directory(engine, str(tmp_path / "minimized"))
+
+def test_minimizing_an_example_with_input(tmp_path):
+    compile_script(read_example("name"), str(tmp_path / "minimized"), minimize=True)
+    for engine in ENGINES:
+        assert run_directory(engine, str(tmp_path / "minimized"), "Ada\n") == "What's your name >> Hello, Ada\n"
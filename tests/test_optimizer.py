@@ -0,0 +1,46 @@
+import pytest
+from fast_parser import parse_program
+from optimizer import optimize_program, program_size
+from support import ENGINES, compile_script, run_directory
+
+# What a program prints, or the error it raises
+def outcome(engine: str, program_dir: str, stdin: str = "") -> str:
+    try:
+        return run_directory(engine, program_dir, stdin)
+    except Exception as e:
+        return type(e).__name__
+
+SCRIPTS = {
+    # Division by a variable that is never assigned, in a Let whose variable is never read
+    "division by zero": ("int a\nint b\na = 1 / b\nprint(\"x\")\n", "", "ZeroDivisionError"),
+    # ord() of a char that has not been assigned yet
+    "unassigned char": ("char c\nchar d\nd = c + 'a'\nprint(\"x\")\n", "", "TypeError"),
+    "division by a zero literal": ("print(\"x\")\nprint(7 / (3 - 3))\n", "", "ZeroDivisionError"),
+    "i32 overflow": ("int a\na = 2147483647 + 1\nprint(a * 2 - 1)\n", "", "-1"),
+    # Folded with float32 arithmetic, as the engines compute it once compiled
+    "float32": ("float f\nf = 0.1 * 3.0\nprint(f + 0.2)\n", "", None),
+    "read variable": ("int a\na = 2\ninput(a)\nprint(a + 1)\n", "40\n", "41"),
+    "constant blocks": ("int a\na = 3\nwhile a < 3:\n    print(\"never\")\nif a == 3:\n    print(\"inlined\")\n", "", "inlined"),
+    # Only the first of these Lets runs before the print, so neither can be folded into it
+    "assigned in a loop": ("int i\nint k\nk = 5\nwhile i < 3:\n    print(k)\n    k = 1\n    i = i + 1\n", "", "511"),
+}
+
+@pytest.mark.parametrize("name", SCRIPTS)
+def test_optimized_program_does_what_the_original_does(tmp_path, name):
+    script, stdin, expected = SCRIPTS[name]
+    compile_script(script, str(tmp_path / "plain"))
+    compile_script(script, str(tmp_path / "optimized"), optimize=True)
+
+    plain = outcome("tree", str(tmp_path / "plain"), stdin)
+    if expected is not None:
+        assert plain == expected
+    for engine in ENGINES:
+        assert outcome(engine, str(tmp_path / "optimized"), stdin) == plain
+
+def test_errors_are_not_folded_away():
+    for script in ["int a\nint b\na = 1 / b\n", "print(7 / (3 - 3))\n"]:
+        assert program_size(optimize_program(parse_program(script))) > 0
+
+def test_constant_program_folds_down():
+    program = optimize_program(parse_program("int a\na = 2 * 3\nint b\nb = a + 1\nif b > 6:\n    print(b)\n"))
+    assert repr(program) == repr(parse_program("print(7)\n"))
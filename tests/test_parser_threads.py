@@ -0,0 +1,44 @@
+import pytest
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from parsy import ParseError as ParsyError
+import fast_parser
+import parser
+from support import read_example
+
+THREADS = 8
+ROUNDS = 20
+
+# An unterminated block in the middle of a script, which used to leave parser.py's indent level raised
+# for the next parse
+def broken(script: str) -> str:
+    lines = script.splitlines()
+    middle = len(lines) // 2
+    return "\n".join(lines[:middle] + ["if 1 == 1:"] + lines[middle:]) + "\n"
+
+SCRIPTS = [read_example(name) for name in ["hi", "name", "serpinsky"]]
+SCRIPTS += [broken(script) for script in SCRIPTS]
+
+def parse_result(parse: Callable[[str], list], script: str) -> str:
+    try:
+        return repr(parse(script))
+    except (ParsyError, fast_parser.ParseError) as e:
+        return f"error: {e}"
+
+@pytest.fixture
+def switch_often():
+    # Threads switch as often as possible, so parses interleave in the middle of blocks
+    saved = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(saved)
+
+@pytest.mark.parametrize("parse", [parser.parse_program, fast_parser.parse_program], ids=["parsy", "fast"])
+def test_parsing_from_many_threads_matches_a_serial_parse(switch_often, parse):
+    expected = [parse_result(parse, script) for script in SCRIPTS]
+    assert any(result.startswith("error") for result in expected)
+
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        results = list(executor.map(lambda script: parse_result(parse, script), SCRIPTS * ROUNDS))
+    assert results == expected * ROUNDS
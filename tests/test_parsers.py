@@ -0,0 +1,119 @@
+import pytest
+from random import Random
+from typing import List
+from folders_types import Command, Span
+from compiler import FoldersCompiler
+from optimizer import walk_commands, command_expressions
+import fast_parser
+import parser
+from support import read_example
+
+# Escapes, negative and float literals, precedence and parentheses, chained comparisons, comments,
+# and a blank line inside a nested block
+EDGE_CASES = """int a   # trailing comment
+float f
+char c
+string s
+a = -5
+f = 1.5 * (2.25 - -3.0)
+c = '\\n'
+s = "tab\\there \\"quoted\\" \\\\ done"
+if a < 3 == 1:
+    print(s)
+
+    while (a + 1) * 2 > a / 2:
+        a = a - 1
+        if c == 'x':
+            print(c)
+print(a + 7 * (3 - 1) / 2)
+input(s)
+"""
+
+OPERATORS = ["+", "-", "*", "/", "<", ">", "=="]
+
+def random_expression(rng: Random, var_names: List[str], depth: int) -> str:
+    if depth == 0 or rng.random() < 0.3:
+        match rng.randrange(4):
+            case 0:
+                return str(rng.randrange(-1000, 1000))
+            case 1:
+                return f"{rng.uniform(-100, 100):.3f}"
+            case 2:
+                return f'"text {rng.randrange(100)}\\n"'
+            case _:
+                return rng.choice(var_names)
+    lhs = random_expression(rng, var_names, depth - 1)
+    rhs = random_expression(rng, var_names, depth - 1)
+    if rng.random() < 0.2:
+        return f"({lhs} {rng.choice(OPERATORS)} {rhs})"
+    return f"{lhs} {rng.choice(OPERATORS)} {rhs}"
+
+# Syntactically valid folderscript of roughly `lines` lines, with blocks nested up to `max_depth` deep.
+# It isn't meant to type check, since only parsing is compared.
+def generate_script(lines: int, seed: int, max_depth: int = 6) -> str:
+    rng = Random(seed)
+    var_names = [f"var_{i}" for i in range(50)]
+    out = [f"{rng.choice(['int', 'float', 'char', 'string'])} {var_name}" for var_name in var_names]
+    level = 0
+    while len(out) < lines:
+        indent = "    " * level
+        match rng.randrange(8):
+            case 0 | 1 if level < max_depth:
+                keyword = rng.choice(["if", "while"])
+                out.append(f"{indent}{keyword} {random_expression(rng, var_names, 2)}: # block {len(out)}")
+                level += 1
+                out.append(f"{indent}    print({random_expression(rng, var_names, 3)})")
+            case 2 if level > 0:
+                level -= 1
+                out.append("")
+            case 3:
+                out.append(f"{indent}input({rng.choice(var_names)})")
+            case 4 if rng.random() < 0.5:
+                # parser.py matches char literals greedily, so only one per line
+                out.append(f"{indent}{rng.choice(var_names)} = '{chr(rng.randrange(ord('a'), ord('z') + 1))}'")
+            case 5:
+                out.append(f"{indent}print({random_expression(rng, var_names, 4)})")
+            case _:
+                out.append(f"{indent}{rng.choice(var_names)} = {random_expression(rng, var_names, 4)}")
+    return "\n".join(out) + "\n"
+
+# The span of every command and expression, in preorder
+def spans(program: List[Command]) -> List[Span | None]:
+    out: List[Span | None] = []
+    for command in walk_commands(program):
+        out.append(command.span)
+        for expr in command_expressions(command):
+            stack = [expr]
+            while len(stack) > 0:
+                expr = stack.pop()
+                out.append(expr.span)
+                if hasattr(expr, "lhs"):
+                    stack.extend([expr.rhs, expr.lhs]) # type: ignore
+    return out
+
+def assert_same_parse(script: str):
+    parsy_program = parser.parse_program(script)
+    fast_program = fast_parser.parse_program(script)
+    assert repr(fast_program) == repr(parsy_program)
+    assert spans(fast_program) == spans(parsy_program)
+
+    parsy_encoded: list = []
+    fast_encoded: list = []
+    FoldersCompiler().encode_commands(parsy_program, parsy_encoded)
+    FoldersCompiler().encode_commands(fast_program, fast_encoded)
+    assert fast_encoded == parsy_encoded
+
+@pytest.mark.parametrize("name", ["hi", "name", "serpinsky"])
+def test_examples(name):
+    assert_same_parse(read_example(name))
+
+def test_edge_cases():
+    assert_same_parse(EDGE_CASES)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_generated_scripts(seed):
+    assert_same_parse(generate_script(300, seed))
+
+def test_fast_parser_reports_line_and_column():
+    with pytest.raises(fast_parser.ParseError, match="line 2, column 5"):
+        fast_parser.parse_program("int a\na = = 1\n")
@@ -0,0 +1,49 @@
+import io
+import pytest
+from fast_parser import parse_program
+from output import BufferedOutput
+from profiler import ProfilingInterpreter
+from support import compile_script
+
+# Well past MAX_RECURSIVE_HEIGHT, so most of the chain is evaluated with an explicit stack
+DEPTH = 300
+
+def chain_script(first: str = "a") -> str:
+    return f"int a\na = 1\nint z\nint b\nb = {' + '.join([first] + ['a'] * (DEPTH - 1))}\nprint(b)\n"
+
+def profile(engine: str, script: str, tmp_path) -> ProfilingInterpreter:
+    interpreter = ProfilingInterpreter(BufferedOutput(io.StringIO()))
+    if engine == "tree":
+        interpreter.run_program(parse_program(script))
+    else:
+        compile_script(script, str(tmp_path / "program"))
+        interpreter.run_directory(str(tmp_path / "program"))
+    return interpreter
+
+def counts(interpreter: ProfilingInterpreter, kind: str):
+    return [stats.count for stats in interpreter.profiler.nodes.values() if stats.kind == kind]
+
+@pytest.mark.parametrize("engine", ["tree", "disk"])
+def test_every_node_of_a_deep_expression_is_profiled(tmp_path, engine):
+    interpreter = profile(engine, chain_script(), tmp_path)
+    assert interpreter.output.stream.getvalue() == str(DEPTH) # type: ignore
+    assert counts(interpreter, "Add") == [1] * (DEPTH - 1)
+    # The chain's variables and print(b)
+    assert counts(interpreter, "Variable") == [1] * (DEPTH + 1)
+    assert interpreter.profiler.stack == []
+
+    # Each operator is timed inside the one above it: the deepest stack is the Let, every Add and a variable
+    assert max(len(stack) for stack in interpreter.profiler.stacks) == DEPTH + 1
+
+@pytest.mark.parametrize("engine", ["tree", "disk"])
+def test_profile_is_left_balanced_when_a_deep_expression_raises(tmp_path, engine):
+    # The division by zero is at the bottom of the chain, below every operator on the explicit stack
+    interpreter = ProfilingInterpreter(BufferedOutput(io.StringIO()))
+    with pytest.raises(Exception):
+        if engine == "tree":
+            interpreter.run_program(parse_program(chain_script("a / z")))
+        else:
+            compile_script(chain_script("a / z"), str(tmp_path / "program"))
+            interpreter.run_directory(str(tmp_path / "program"))
+    assert interpreter.profiler.stack == []
+    assert interpreter.profiler.child_ns == [] and interpreter.profiler.start_ns == []
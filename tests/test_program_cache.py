@@ -0,0 +1,88 @@
+import marshal
+import pytest
+from os import utime, walk
+from time import time
+from program_cache import ProgramCache, CACHE_FORMAT_VERSION, cache_file_path
+from support import read_example, compile_script, run_program
+
+# Folders written within RACY_WINDOW_NS of a scan are never trusted, so the tests backdate them
+def backdate(program_dir: str):
+    past = time() - 60
+    for dir, _, _ in walk(program_dir):
+        utime(dir, (past, past))
+
+@pytest.fixture
+def program_dir(tmp_path) -> str:
+    program_dir = str(tmp_path / "program")
+    compile_script(read_example("name"), program_dir)
+    backdate(program_dir)
+    return program_dir
+
+@pytest.fixture
+def cache(tmp_path) -> ProgramCache:
+    return ProgramCache(str(tmp_path / "cache"))
+
+def assert_runs(program):
+    assert run_program("tree", program, "Ada\n") == "What's your name >> Hello, Ada\n"
+
+def test_missing_cache_file_is_a_miss(program_dir, cache):
+    assert cache.lookup(program_dir) is None
+    assert_runs(cache.load_program(program_dir))
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    assert_runs(cache.load_program(program_dir))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_recently_written_program_is_not_trusted(tmp_path, cache):
+    program_dir = str(tmp_path / "program")
+    compile_script(read_example("name"), program_dir)
+    cache.load_program(program_dir)
+    cache.load_program(program_dir)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+def test_edited_program_is_a_miss(tmp_path, program_dir, cache):
+    cache.load_program(program_dir)
+    compile_script(read_example("hi"), program_dir)
+    backdate(program_dir)
+    assert run_program("tree", cache.load_program(program_dir)) == "hi"
+    assert (cache.hits, cache.misses) == (0, 2)
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: b"",
+    lambda data: data[:len(data) // 2],
+    lambda data: b"not a cache file" * 10,
+    lambda data: marshal.dumps(("a", "different", "shape")),
+])
+def test_corrupt_cache_file_is_a_miss(program_dir, cache, corrupt):
+    cache.load_program(program_dir)
+    cache_path = cache_file_path(program_dir, cache.cache_dir)
+    with open(cache_path, "rb") as f:
+        data = f.read()
+    with open(cache_path, "wb") as f:
+        f.write(corrupt(data))
+
+    assert_runs(cache.load_program(program_dir))
+    assert (cache.hits, cache.misses) == (0, 2)
+    # The file was written again
+    assert_runs(cache.load_program(program_dir))
+    assert cache.hits == 1
+
+def test_damaged_program_in_a_valid_cache_file_is_a_miss(program_dir, cache):
+    cache.load_program(program_dir)
+    cache_path = cache_file_path(program_dir, cache.cache_dir)
+    with open(cache_path, "rb") as f:
+        version, scanned_at, fingerprint, pickled_program = marshal.load(f)
+    assert version == CACHE_FORMAT_VERSION
+    with open(cache_path, "wb") as f:
+        marshal.dump((version, scanned_at, fingerprint, pickled_program[:len(pickled_program) // 2]), f)
+
+    assert cache.lookup(program_dir) is None
+    assert_runs(cache.load_program(program_dir))
+
+def test_cache_that_cannot_be_written(tmp_path, program_dir):
+    # The cache directory's path is taken by a file
+    (tmp_path / "cache").write_text("")
+    cache = ProgramCache(str(tmp_path / "cache"))
+    assert_runs(cache.load_program(program_dir))
+    assert_runs(cache.load_program(program_dir))
+    assert (cache.hits, cache.misses) == (0, 2)
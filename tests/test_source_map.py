@@ -0,0 +1,85 @@
+import marshal
+import subprocess
+import sys
+import zlib
+import pytest
+from os import path
+from fast_parser import parse_program
+from loader import load_program
+from optimizer import walk_commands
+from source_map import SOURCE_MAP_VERSION, source_map_path, write_source_map, load_source_map
+from support import compile_script, read_example
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+SCRIPT = "int a\na = 7\nif a > 1:\n    print(a / 0)\n"
+
+@pytest.fixture
+def program_dir(tmp_path) -> str:
+    program_dir = str(tmp_path / "program")
+    compile_script(SCRIPT, program_dir)
+    write_source_map(program_dir, "script.folderscript", parse_program(SCRIPT))
+    return program_dir
+
+def test_commands_map_back_to_the_script(program_dir):
+    source_map = load_source_map(program_dir)
+    assert source_map is not None
+    commands = list(walk_commands(load_program(program_dir)))
+    assert [source_map.lookup(command.path).line for command in commands] == [1, 2, 3, 4] # type: ignore
+    print_command = commands[-1]
+    assert source_map.describe(print_command.expr.path) == "script.folderscript:4:11" # type: ignore
+
+def test_paths_outside_the_program_have_no_span(program_dir):
+    source_map = load_source_map(program_dir)
+    assert source_map is not None
+    assert source_map.lookup(f"{program_dir}/zz") is None
+    assert source_map.lookup(f"{program_dir}x/a") is None
+    assert source_map.describe("elsewhere/a") is None
+
+def test_missing_source_map(tmp_path):
+    compile_script(SCRIPT, str(tmp_path / "program"))
+    assert load_source_map(str(tmp_path / "program")) is None
+    assert load_source_map(str(tmp_path / "missing")) is None
+
+def test_source_map_of_a_recompiled_program_is_stale(program_dir):
+    compile_script(read_example("hi"), program_dir)
+    assert load_source_map(program_dir) is None
+
+def rewrite(program_dir: str, change):
+    with open(source_map_path(program_dir), "rb") as f:
+        fields = list(marshal.load(f))
+    with open(source_map_path(program_dir), "wb") as f:
+        marshal.dump(tuple(change(fields)), f)
+
+@pytest.mark.parametrize("change", [
+    lambda fields: [SOURCE_MAP_VERSION + 1] + fields[1:],
+    lambda fields: fields[:3] + [b"not zlib", fields[4]],
+    lambda fields: fields[:3] + [zlib.compress(b"\xff\xfe"), fields[4]],
+    # Spans that are not a whole number of integers, or don't match the paths
+    lambda fields: fields[:4] + [fields[4][:-1]],
+    lambda fields: fields[:4] + [fields[4][:-16]],
+    lambda fields: fields[:4],
+])
+def test_corrupt_source_map(program_dir, change):
+    rewrite(program_dir, change)
+    assert load_source_map(program_dir) is None
+
+def test_truncated_source_map_file(program_dir):
+    with open(source_map_path(program_dir), "rb") as f:
+        data = f.read()
+    with open(source_map_path(program_dir), "wb") as f:
+        f.write(data[:len(data) // 2])
+    assert load_source_map(program_dir) is None
+
+def test_empty_program(tmp_path):
+    program_dir = str(tmp_path / "program")
+    compile_script("", program_dir)
+    write_source_map(program_dir, "empty.folderscript", [])
+    source_map = load_source_map(program_dir)
+    assert source_map is not None and source_map.lookup(f"{program_dir}/a") is None
+
+def test_runtime_error_is_reported_at_its_place_in_the_script(program_dir):
+    result = subprocess.run([sys.executable, path.join(ROOT, "interpreter.py"), "--input", program_dir],
+                            capture_output=True, text=True)
+    assert result.returncode != 0
+    assert "(script.folderscript:4:" in result.stderr
@@ -0,0 +1,136 @@
+import io
+from os import rename
+from typing import Callable, Set
+from folders_types import Command
+from compiler import FoldersCompiler
+from output import BufferedOutput
+from watcher import LiveInterpreter
+from support import compile_script
+
+# Polls too rarely to notice anything by itself, so only the changes a test reports are applied
+NEVER = 3600.0
+
+def name(index: int) -> str:
+    return FoldersCompiler.folder_name_from_index(index)
+
+# Edits the program's folders once, right after the command read from `edit_after` runs, and reports
+# the folders the edit returns as changed
+class EditingInterpreter(LiveInterpreter):
+    def __init__(self, edit_after: str, edit: Callable[[], Set[str]]):
+        super().__init__(BufferedOutput(io.StringIO()), NEVER)
+        self.edit_after = edit_after
+        self.edit: Callable[[], Set[str]] | None = edit
+
+    def run_command(self, command: Command):
+        body = super().run_command(command)
+        if self.edit is not None and command.path == self.edit_after:
+            changed = self.edit()
+            self.edit = None
+            with self.watcher.lock:
+                self.watcher.pending.update(changed)
+                self.watcher.changed = True
+        return body
+
+    def printed(self) -> str:
+        return self.output.stream.getvalue() # type: ignore
+
+# Compiles a one command script and moves its command's folder to `dest`
+def command_folder(tmp_path, script: str, dest: str):
+    compile_script(script, str(tmp_path / "scratch"))
+    rename(str(tmp_path / "scratch" / name(0)), dest)
+    (tmp_path / "scratch").rmdir()
+
+def test_unedited_program_runs(tmp_path):
+    program_dir = str(tmp_path / "program")
+    compile_script("int i\nwhile i < 3:\n    i = i + 1\n    print(i)\n", program_dir)
+    interpreter = EditingInterpreter("", set)
+    interpreter.run_live(program_dir)
+    assert interpreter.printed() == "123"
+    assert interpreter.reloads == 0
+
+def test_command_added_before_the_running_one(tmp_path):
+    program_dir = str(tmp_path / "program")
+    compile_script("print(\"a\")\nprint(\"b\")\nprint(\"c\")\n", program_dir)
+
+    def edit():
+        # "0" sorts before every name the compiler gives
+        command_folder(tmp_path, "print(\"x\")\n", f"{program_dir}/0")
+        return {program_dir}
+
+    interpreter = EditingInterpreter(f"{program_dir}/{name(1)}", edit)
+    interpreter.run_live(program_dir)
+    assert interpreter.printed() == "abc"
+    assert interpreter.reloads == 1
+
+def test_running_command_removed(tmp_path):
+    program_dir = str(tmp_path / "program")
+    compile_script("print(\"a\")\nprint(\"b\")\nprint(\"c\")\n", program_dir)
+
+    def edit():
+        # The command that is running, and the one before it
+        for i in [0, 1]:
+            rename(f"{program_dir}/{name(i)}", str(tmp_path / f"removed{i}"))
+        return {program_dir}
+
+    interpreter = EditingInterpreter(f"{program_dir}/{name(1)}", edit)
+    interpreter.run_live(program_dir)
+    assert interpreter.printed() == "abc"
+
+def test_command_added_after_the_running_one(tmp_path):
+    program_dir = str(tmp_path / "program")
+    compile_script("print(\"a\")\nprint(\"b\")\n", program_dir)
+
+    def edit():
+        command_folder(tmp_path, "print(\"x\")\n", f"{program_dir}/{name(0)}0")
+        return {program_dir}
+
+    interpreter = EditingInterpreter(f"{program_dir}/{name(0)}", edit)
+    interpreter.run_live(program_dir)
+    assert interpreter.printed() == "axb"
+
+def test_edited_command_in_a_running_loop(tmp_path):
+    program_dir = str(tmp_path / "program")
+    compile_script("int i\nwhile i < 2:\n    i = i + 1\n    print(\"a\")\n    print(\"b\")\n", program_dir)
+    loop = f"{program_dir}/{name(1)}"
+    body = f"{loop}/{name(2)}"
+
+    def edit():
+        rename(f"{body}/{name(2)}", str(tmp_path / "removed"))
+        command_folder(tmp_path, "print(\"c\")\n", f"{body}/{name(2)}")
+        # The loop's own folder is reported too, as a watcher does when anything below it is replaced
+        return {loop, f"{body}/{name(2)}"}
+
+    interpreter = EditingInterpreter(f"{body}/{name(1)}", edit)
+    interpreter.run_live(program_dir)
+    # The loop is only reloaded as a whole once it is left, so the edited Print runs straight away
+    assert interpreter.printed() == "acac"
+
+def test_loop_edited_into_an_if_while_it_runs(tmp_path):
+    program_dir = str(tmp_path / "program")
+    compile_script("int i\nwhile i < 3:\n    i = i + 1\n    print(i)\nprint(\"done\")\n", program_dir)
+    loop = f"{program_dir}/{name(1)}"
+
+    def edit():
+        rename(loop, str(tmp_path / "removed"))
+        command_folder(tmp_path, "if i < 3:\n    i = i + 1\n    print(i)\n", loop)
+        return {loop}
+
+    interpreter = EditingInterpreter(f"{loop}/{name(2)}/{name(0)}", edit)
+    interpreter.run_live(program_dir)
+    # The first iteration finishes, and the If it has become doesn't repeat
+    assert interpreter.printed() == "1done"
+
+def test_edit_that_does_not_type_check_is_not_applied(tmp_path):
+    program_dir = str(tmp_path / "program")
+    compile_script("print(\"a\")\nprint(\"b\")\n", program_dir)
+
+    def edit():
+        rename(f"{program_dir}/{name(1)}", str(tmp_path / "removed"))
+        command_folder(tmp_path, "print(undeclared)\n", f"{program_dir}/{name(1)}")
+        return {f"{program_dir}/{name(1)}"}
+
+    interpreter = EditingInterpreter(f"{program_dir}/{name(0)}", edit)
+    interpreter.run_live(program_dir)
+    assert interpreter.printed() == "ab"
+    # It is retried with the next change
+    assert interpreter.failed == {f"{program_dir}/{name(1)}"}
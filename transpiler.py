@@ -0,0 +1,221 @@
+from math import isfinite
+from typing import Dict, List, Tuple
+from folders_types import CommandType, ExpressionType, TypeType, Command, Expression, If, While, \
+    Declare, Let, Print, Input, Lit, Variable
+from typechecker import check_program, comparison_coercion, Coercion
+from interpreter import as_i32
+from output import Output, UnbufferedOutput
+
+default_values = {
+    TypeType.Int: "0",
+    TypeType.Float: "0.0",
+    TypeType.String: "''",
+    TypeType.Char: "''",
+}
+
+input_conversions = {
+    TypeType.Int: "int(read())",
+    TypeType.Float: "float(read())",
+    TypeType.String: "str(read())",
+    TypeType.Char: "str(read())[0]",
+}
+
+# `{}` placeholders are the already-generated lhs and rhs. Int results are wrapped to i32 inline
+# (equivalent to interpreter.as_i32), chars are masked to 8 bits.
+arithmetic_templates = {
+    (ExpressionType.Add, TypeType.Int): "(((({} + {}) + 0x80000000) & 0xffffffff) - 0x80000000)",
+    (ExpressionType.Add, TypeType.Float): "({} + {})",
+    (ExpressionType.Add, TypeType.String): "({} + {})",
+    (ExpressionType.Add, TypeType.Char): "chr((ord({}) + ord({})) & 0xff)",
+    (ExpressionType.Subtract, TypeType.Int): "(((({} - {}) + 0x80000000) & 0xffffffff) - 0x80000000)",
+    (ExpressionType.Subtract, TypeType.Float): "({} - {})",
+    (ExpressionType.Subtract, TypeType.Char): "chr((ord({}) - ord({})) & 0xff)",
+    (ExpressionType.Multiply, TypeType.Int): "(((({} * {}) + 0x80000000) & 0xffffffff) - 0x80000000)",
+    (ExpressionType.Multiply, TypeType.Float): "({} * {})",
+    (ExpressionType.Divide, TypeType.Int): "(((({} // {}) + 0x80000000) & 0xffffffff) - 0x80000000)",
+    (ExpressionType.Divide, TypeType.Float): "({} / {})",
+    (ExpressionType.Divide, TypeType.Char): "chr(ord({}) // ord({}))",
+}
+
+comparison_symbols = {
+    ExpressionType.EqualTo: "==",
+    ExpressionType.LessThan: "<",
+    ExpressionType.GreaterThan: ">",
+}
+
+# Generated expressions nest at most this many operators deep. Deeper subexpressions are assigned to
+# temporaries first, since CPython limits how deeply parentheses (and its own compiler) can nest.
+MAX_EXPRESSION_DEPTH = 32
+
+# CPython allows at most 20 statically nested loops, and 100 levels of indentation, which bound how
+# deeply Whiles and Ifs can be nested here. Deeper programs are rejected; the other engines run them.
+MAX_NESTED_LOOPS = 20
+MAX_INDENT = 98
+
+# Generates Python source for a type-checked program. Each variable becomes a local of the
+# generated `run` function, so the whole program executes as ordinary CPython bytecode.
+class PythonTranspiler:
+    def __init__(self):
+        self.lines: List[str] = []
+        self.var_types: Dict[str, TypeType] = {}
+        self.names: Dict[str, str] = {}
+        self.indent = 1
+        self.loops = 0
+        self.temporaries = 0
+
+    def emit(self, line: str):
+        self.lines.append("    " * self.indent + line)
+
+    def transpile(self, program: List[Command]) -> str:
+        self.var_types = check_program(program)
+        self.names = { var_name: f"v{i}" for i, var_name in enumerate(self.var_types) }
+
+        self.lines.append("def run(write, read):")
+        for var_name, name in self.names.items():
+            self.emit(f"{name} = None # {var_name!r}")
+        self.transpile_commands(program)
+        self.emit("pass")
+
+        return "\n".join(self.lines) + "\n"
+
+    # Blocks are transpiled with an explicit stack. The owner of each body is pushed below its commands,
+    # wrapped in a tuple, to close it once they have been transpiled.
+    def transpile_commands(self, commands: List[Command]):
+        if len(commands) == 0:
+            self.emit("pass")
+        stack: List[Command | Tuple[Command]] = list(reversed(commands))
+        while len(stack) > 0:
+            command = stack.pop()
+            if isinstance(command, tuple):
+                self.indent -= 1
+                if command[0].command_type == CommandType.While:
+                    self.loops -= 1
+                continue
+
+            match command.command_type:
+                case CommandType.If:
+                    assert(isinstance(command, If))
+                    self.emit(f"if {self.transpile_expression(command.expr)}:")
+
+                case CommandType.While:
+                    assert(isinstance(command, While))
+                    # A condition that needs temporaries is tested at the top of the loop's body
+                    self.indent += 1
+                    first_line = len(self.lines)
+                    condition = self.transpile_expression(command.expr)
+                    self.indent -= 1
+                    if len(self.lines) > first_line:
+                        self.lines.insert(first_line, "    " * self.indent + "while True:")
+                        self.emit(f"    if not {condition}:")
+                        self.emit("        break")
+                    else:
+                        self.emit(f"while {condition}:")
+
+                case CommandType.Declare:
+                    assert(isinstance(command, Declare))
+                    name = self.names[command.var_name]
+                    self.emit(f"assert({name} is None)")
+                    self.emit(f"{name} = {default_values[command.type]}")
+
+                case CommandType.Let:
+                    assert(isinstance(command, Let))
+                    self.emit(f"{self.names[command.var_name]} = {self.transpile_expression(command.value)}")
+
+                case CommandType.Print:
+                    assert(isinstance(command, Print))
+                    self.emit(f"write({self.transpile_expression(command.expr)})")
+
+                case CommandType.Input:
+                    assert(isinstance(command, Input))
+                    self.emit(f"{self.names[command.var_name]} = {input_conversions[self.var_types[command.var_name]]}")
+
+                case _:
+                    raise Exception(f"Invalid command: {command.command_type}")
+
+            if isinstance(command, If) or isinstance(command, While):
+                self.indent += 1
+                if command.command_type == CommandType.While:
+                    self.loops += 1
+                if self.indent > MAX_INDENT or self.loops > MAX_NESTED_LOOPS:
+                    raise Exception(f"Blocks are nested too deeply for the python engine, at {command.path or 'a command'}")
+                if len(command.commands) == 0:
+                    self.emit("pass")
+                stack.append((command,))
+                stack.extend(reversed(command.commands))
+
+    def transpile_command(self, command: Command):
+        self.transpile_commands([command])
+
+    # Operands are generated before their operator, with an explicit stack as in TypeChecker.check_expression.
+    # Each generated operand is kept with how many operators deep it nests.
+    def transpile_expression(self, expr: Expression) -> str:
+        self.temporaries = 0
+        operands: List[Tuple[str, int]] = []
+        stack = [(expr, False)]
+        while len(stack) > 0:
+            expr, operands_ready = stack.pop()
+            match expr.expr_type:
+                case ExpressionType.Variable:
+                    assert(isinstance(expr, Variable))
+                    operands.append((self.names[expr.var_name], 0))
+
+                case ExpressionType.LiteralValue:
+                    assert(isinstance(expr, Lit))
+                    operands.append((self.transpile_literal(expr), 0))
+
+                case _ if not operands_ready:
+                    stack.append((expr, True))
+                    stack.append((expr.rhs, False)) # type: ignore
+                    stack.append((expr.lhs, False)) # type: ignore
+
+                case _:
+                    rhs, rhs_depth = operands.pop()
+                    lhs, lhs_depth = operands.pop()
+                    operands.append((self.transpile_operation(expr, lhs, rhs), max(lhs_depth, rhs_depth) + 1))
+                    if operands[-1][1] >= MAX_EXPRESSION_DEPTH:
+                        temporary = f"t{self.temporaries}"
+                        self.temporaries += 1
+                        self.emit(f"{temporary} = {operands[-1][0]}")
+                        operands[-1] = (temporary, 0)
+
+        return operands[0][0]
+
+    def transpile_literal(self, lit: Lit) -> str:
+        if lit.lit_type == TypeType.Int:
+            return repr(as_i32(lit.value)) # type: ignore
+        if lit.lit_type == TypeType.Float and not isfinite(lit.value): # type: ignore
+            return f"float('{lit.value}')" # type: ignore
+        return repr(lit.value) # type: ignore
+
+    def transpile_operation(self, expr: Expression, lhs: str, rhs: str) -> str:
+        match expr.expr_type:
+            case ExpressionType.Add | ExpressionType.Subtract | ExpressionType.Multiply | ExpressionType.Divide:
+                return arithmetic_templates[(expr.expr_type, expr.value_type)].format(lhs, rhs) # type: ignore
+
+            case ExpressionType.EqualTo | ExpressionType.LessThan | ExpressionType.GreaterThan:
+                match comparison_coercion(expr.lhs.value_type, expr.rhs.value_type): # type: ignore
+                    case Coercion.Lhs:
+                        lhs = f"ord({lhs})"
+                    case Coercion.Rhs:
+                        rhs = f"ord({rhs})"
+                return f"(1 if {lhs} {comparison_symbols[expr.expr_type]} {rhs} else 0)"
+
+            case _:
+                raise Exception(f"Invalid expression: {expr.expr_type}")
+
+def transpile_program(program: List[Command]) -> str:
+    return PythonTranspiler().transpile(program)
+
+def run_python(source: str, filename: str = "<folders>", output: Output | None = None):
+    output = UnbufferedOutput() if output is None else output
+
+    def read() -> str:
+        output.flush()
+        return input()
+
+    namespace: Dict = {}
+    exec(compile(source, filename, "exec"), namespace)
+    try:
+        namespace["run"](output.write, read)
+    finally:
+        output.flush()
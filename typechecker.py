@@ -0,0 +1,191 @@
+from typing import Callable, Dict, List
+from folders_types import CommandType, ExpressionType, TypeType, Command, Expression, If, While, \
+    Declare, Let, Print, Input, Lit, Variable
+
+Operation = Callable[[int | float | str, int | float | str], int | float | str]
+
+# i32 wraparound without a function call: ((v + 2^31) mod 2^32) - 2^31
+arithmetic_operations: Dict[tuple, Operation] = {
+    (ExpressionType.Add, TypeType.Int): lambda l, r: ((l + r + 0x80000000) & 0xffffffff) - 0x80000000, # type: ignore
+    (ExpressionType.Add, TypeType.Float): lambda l, r: l + r, # type: ignore
+    (ExpressionType.Add, TypeType.String): lambda l, r: l + r, # type: ignore
+    (ExpressionType.Add, TypeType.Char): lambda l, r: chr((ord(l) + ord(r)) & 0xff), # type: ignore
+    (ExpressionType.Subtract, TypeType.Int): lambda l, r: ((l - r + 0x80000000) & 0xffffffff) - 0x80000000, # type: ignore
+    (ExpressionType.Subtract, TypeType.Float): lambda l, r: l - r, # type: ignore
+    (ExpressionType.Subtract, TypeType.Char): lambda l, r: chr((ord(l) - ord(r)) & 0xff), # type: ignore
+    (ExpressionType.Multiply, TypeType.Int): lambda l, r: ((l * r + 0x80000000) & 0xffffffff) - 0x80000000, # type: ignore
+    (ExpressionType.Multiply, TypeType.Float): lambda l, r: l * r, # type: ignore
+    (ExpressionType.Divide, TypeType.Int): lambda l, r: ((l // r + 0x80000000) & 0xffffffff) - 0x80000000, # type: ignore
+    (ExpressionType.Divide, TypeType.Float): lambda l, r: l / r, # type: ignore
+    (ExpressionType.Divide, TypeType.Char): lambda l, r: chr(ord(l) // ord(r)), # type: ignore
+}
+
+numeric_types = [TypeType.Int, TypeType.Float]
+
+# Which side of a comparison is converted with ord(), following interpreter.compare_on_type
+class Coercion:
+    Neither = 0
+    Lhs     = 1
+    Rhs     = 2
+
+def comparison_coercion(lhs: TypeType, rhs: TypeType) -> int | None:
+    if lhs == rhs:
+        return Coercion.Neither
+    if lhs in numeric_types:
+        if rhs == TypeType.String:
+            return None
+        return Coercion.Rhs if rhs == TypeType.Char else Coercion.Neither
+    if lhs == TypeType.String:
+        return None if rhs in numeric_types else Coercion.Neither
+    return Coercion.Lhs if rhs in numeric_types else Coercion.Rhs
+
+comparison_operations: Dict[tuple, Operation] = {
+    (ExpressionType.EqualTo, Coercion.Neither): lambda l, r: int(l == r),
+    (ExpressionType.EqualTo, Coercion.Lhs): lambda l, r: int(ord(l) == r), # type: ignore
+    (ExpressionType.EqualTo, Coercion.Rhs): lambda l, r: int(l == ord(r)), # type: ignore
+    (ExpressionType.LessThan, Coercion.Neither): lambda l, r: int(l < r), # type: ignore
+    (ExpressionType.LessThan, Coercion.Lhs): lambda l, r: int(ord(l) < r), # type: ignore
+    (ExpressionType.LessThan, Coercion.Rhs): lambda l, r: int(l < ord(r)), # type: ignore
+    (ExpressionType.GreaterThan, Coercion.Neither): lambda l, r: int(l > r), # type: ignore
+    (ExpressionType.GreaterThan, Coercion.Lhs): lambda l, r: int(ord(l) > r), # type: ignore
+    (ExpressionType.GreaterThan, Coercion.Rhs): lambda l, r: int(l > ord(r)), # type: ignore
+}
+
+class TypeCheckError(Exception):
+    def __init__(self, errors: List[str]):
+        super().__init__("\n".join(errors))
+        self.errors = errors
+
+# Resolves the type of every expression ahead of execution, following the rules in docs/spec.md as
+# enforced by the interpreter. Each expression gets a `value_type`, and each arithmetic or comparison
+# node also gets the `operation` specialised for its operand types.
+class TypeChecker:
+    def __init__(self, var_types: Dict[str, TypeType] | None = None):
+        self.var_types: Dict[str, TypeType] = {} if var_types is None else dict(var_types)
+        self.errors: List[str] = []
+
+    def error(self, node: Command | Expression, message: str):
+        location = f"[{node.path}] " if node.path is not None else ""
+        self.errors.append(f"{location}{message}")
+
+    def check(self, program: List[Command]) -> Dict[str, TypeType]:
+        self.check_commands(program)
+        if len(self.errors) > 0:
+            raise TypeCheckError(self.errors)
+        return self.var_types
+
+    # Blocks are checked in program order with an explicit stack, so they can be nested to any depth
+    def check_commands(self, commands: List[Command]):
+        stack = list(reversed(commands))
+        while len(stack) > 0:
+            command = stack.pop()
+            self.check_statement(command)
+            if isinstance(command, If) or isinstance(command, While):
+                stack.extend(reversed(command.commands))
+
+    def check_command(self, command: Command):
+        self.check_commands([command])
+
+    # A command, without the body of an If or While
+    def check_statement(self, command: Command):
+        match command.command_type:
+            case CommandType.If | CommandType.While:
+                assert(isinstance(command, If) or isinstance(command, While))
+                self.check_expression(command.expr)
+
+            case CommandType.Declare:
+                assert(isinstance(command, Declare))
+                if command.var_name in self.var_types:
+                    self.error(command, f"Variable {command.var_name!r} is declared more than once")
+                self.var_types[command.var_name] = command.type
+
+            case CommandType.Let:
+                assert(isinstance(command, Let))
+                self.check_declared(command, command.var_name)
+                self.check_expression(command.value)
+
+            case CommandType.Print:
+                assert(isinstance(command, Print))
+                self.check_expression(command.expr)
+
+            case CommandType.Input:
+                assert(isinstance(command, Input))
+                self.check_declared(command, command.var_name)
+
+            case _:
+                raise Exception(f"Invalid command: {command.command_type}")
+
+    def check_declared(self, node: Command | Expression, var_name: str) -> bool:
+        if var_name not in self.var_types:
+            self.error(node, f"Variable {var_name!r} is used before it is declared")
+            return False
+        return True
+
+    # Operands are checked before their operator, with an explicit stack so expressions of any depth
+    # can be checked. The type of each expression is pushed on `types`; None means it had an error.
+    def check_expression(self, expr: Expression) -> TypeType | None:
+        types: List[TypeType | None] = []
+        stack = [(expr, False)]
+        while len(stack) > 0:
+            expr, operands_ready = stack.pop()
+            match expr.expr_type:
+                case ExpressionType.Variable:
+                    assert(isinstance(expr, Variable))
+                    if self.check_declared(expr, expr.var_name):
+                        expr.value_type = self.var_types[expr.var_name]
+                    types.append(expr.value_type)
+
+                case ExpressionType.LiteralValue:
+                    assert(isinstance(expr, Lit))
+                    expr.value_type = expr.lit_type
+                    types.append(expr.value_type)
+
+                case _ if not operands_ready:
+                    stack.append((expr, True))
+                    stack.append((expr.rhs, False)) # type: ignore
+                    stack.append((expr.lhs, False)) # type: ignore
+
+                case ExpressionType.Add | ExpressionType.Subtract | ExpressionType.Multiply | ExpressionType.Divide:
+                    expr.height = 1 + max(expr.lhs.height, expr.rhs.height) # type: ignore
+                    rhs = types.pop()
+                    types.append(self.check_arithmetic(expr, types.pop(), rhs))
+
+                case ExpressionType.EqualTo | ExpressionType.LessThan | ExpressionType.GreaterThan:
+                    expr.height = 1 + max(expr.lhs.height, expr.rhs.height) # type: ignore
+                    rhs = types.pop()
+                    types.append(self.check_comparison(expr, types.pop(), rhs))
+
+                case _:
+                    raise Exception(f"Invalid expression: {expr.expr_type}")
+
+        return types[0]
+
+    def check_arithmetic(self, expr: Expression, lhs: TypeType | None, rhs: TypeType | None) -> TypeType | None:
+        if lhs is None or rhs is None:
+            return None
+
+        valid_operands = lhs == rhs or (expr.expr_type == ExpressionType.Add \
+            and lhs == TypeType.String and rhs == TypeType.Char)
+        if not valid_operands or (expr.expr_type, lhs) not in arithmetic_operations:
+            self.error(expr, f"Invalid operand types for {expr.expr_type.name}: {lhs.name} and {rhs.name}")
+            return None
+
+        expr.value_type = lhs
+        expr.operation = arithmetic_operations[(expr.expr_type, lhs)]
+        return expr.value_type
+
+    def check_comparison(self, expr: Expression, lhs: TypeType | None, rhs: TypeType | None) -> TypeType | None:
+        if lhs is None or rhs is None:
+            return None
+
+        coercion = comparison_coercion(lhs, rhs)
+        if coercion is None:
+            self.error(expr, f"Cannot compare {lhs.name} with {rhs.name}")
+            return None
+
+        expr.value_type = TypeType.Int
+        expr.operation = comparison_operations[(expr.expr_type, coercion)]
+        return expr.value_type
+
+def check_program(program: List[Command]) -> Dict[str, TypeType]:
+    return TypeChecker().check(program)
@@ -0,0 +1,314 @@
+from enum import IntEnum
+from typing import Dict, List, NamedTuple, Tuple, Any
+from folders_types import CommandType, ExpressionType, TypeType, Command, Expression, If, While, \
+    Declare, Let, Print, Input, Lit, Variable
+from interpreter import as_i32
+from typechecker import check_program, comparison_coercion, Coercion
+from output import Output, UnbufferedOutput
+
+class Op(IntEnum):
+    Load         = 0
+    Const        = 1
+    Store        = 2
+    JumpIfFalse  = 3
+    Jump         = 4
+    AddInt       = 5
+    Add          = 6
+    AddChar      = 7
+    SubInt       = 8
+    SubFloat     = 9
+    SubChar      = 10
+    MulInt       = 11
+    MulFloat     = 12
+    DivInt       = 13
+    DivFloat     = 14
+    DivChar      = 15
+    Ord          = 16
+    EqualTo      = 17
+    LessThan     = 18
+    GreaterThan  = 19
+    Print        = 20
+    Input        = 21
+    Declare      = 22
+
+Instruction = Tuple[int, Any]
+
+# The end of the body of an If or While being compiled: the jump past it to patch, and for a While the
+# start of the condition to jump back to
+class BlockEnd(NamedTuple):
+    jump_to_end: int
+    loop_start: int | None
+
+default_values = {
+    TypeType.Int: 0,
+    TypeType.Float: 0.0,
+    TypeType.String: '',
+    TypeType.Char: '',
+}
+
+arithmetic_ops = {
+    (ExpressionType.Add, TypeType.Int): Op.AddInt,
+    (ExpressionType.Add, TypeType.Float): Op.Add,
+    (ExpressionType.Add, TypeType.String): Op.Add,
+    (ExpressionType.Add, TypeType.Char): Op.AddChar,
+    (ExpressionType.Subtract, TypeType.Int): Op.SubInt,
+    (ExpressionType.Subtract, TypeType.Float): Op.SubFloat,
+    (ExpressionType.Subtract, TypeType.Char): Op.SubChar,
+    (ExpressionType.Multiply, TypeType.Int): Op.MulInt,
+    (ExpressionType.Multiply, TypeType.Float): Op.MulFloat,
+    (ExpressionType.Divide, TypeType.Int): Op.DivInt,
+    (ExpressionType.Divide, TypeType.Float): Op.DivFloat,
+    (ExpressionType.Divide, TypeType.Char): Op.DivChar,
+}
+
+comparison_ops = {
+    ExpressionType.EqualTo: Op.EqualTo,
+    ExpressionType.LessThan: Op.LessThan,
+    ExpressionType.GreaterThan: Op.GreaterThan,
+}
+
+class Program:
+    def __init__(self, code: List[Instruction], slot_names: List[str]):
+        self.code = code
+        self.slot_names = slot_names
+
+    def disassemble(self) -> str:
+        lines = []
+        for pc, (op, arg) in enumerate(self.code):
+            lines.append(f"{pc:>6} {Op(op).name:<12} {'' if arg is None else repr(arg)}")
+        return "\n".join(lines)
+
+# Lowers type-checked folders_types commands (from the loader or the parser) to flat bytecode
+class BytecodeCompiler:
+    def __init__(self):
+        self.code: List[Instruction] = []
+        self.slots: Dict[str, int] = {}
+        self.var_types: Dict[str, TypeType] = {}
+
+    def emit(self, op: Op, arg: Any = None) -> int:
+        self.code.append((int(op), arg))
+        return len(self.code) - 1
+
+    def patch(self, index: int, target: int):
+        op, _ = self.code[index]
+        self.code[index] = (op, target)
+
+    def slot(self, var_name: str) -> int:
+        if var_name not in self.slots:
+            self.slots[var_name] = len(self.slots)
+        return self.slots[var_name]
+
+    def compile(self, program: List[Command]) -> Program:
+        self.var_types = check_program(program)
+        for var_name in self.var_types:
+            self.slot(var_name)
+        self.compile_commands(program)
+        slot_names = sorted(self.slots, key=lambda name: self.slots[name])
+        return Program(self.code, slot_names)
+
+    # Blocks are compiled with an explicit stack, so they can be nested to any depth. A BlockEnd is pushed
+    # below the commands of each body, to close it once they have been compiled.
+    def compile_commands(self, commands: List[Command]):
+        stack: List[Command | BlockEnd] = list(reversed(commands))
+        while len(stack) > 0:
+            item = stack.pop()
+            if isinstance(item, BlockEnd):
+                if item.loop_start is not None:
+                    self.emit(Op.Jump, item.loop_start)
+                self.patch(item.jump_to_end, len(self.code))
+                continue
+
+            command = item
+            match command.command_type:
+                case CommandType.If:
+                    assert(isinstance(command, If))
+                    self.compile_expression(command.expr)
+                    stack.append(BlockEnd(self.emit(Op.JumpIfFalse), None))
+                    stack.extend(reversed(command.commands))
+
+                case CommandType.While:
+                    assert(isinstance(command, While))
+                    start = len(self.code)
+                    self.compile_expression(command.expr)
+                    stack.append(BlockEnd(self.emit(Op.JumpIfFalse), start))
+                    stack.extend(reversed(command.commands))
+
+                case CommandType.Declare:
+                    assert(isinstance(command, Declare))
+                    self.emit(Op.Declare, (self.slot(command.var_name), default_values[command.type]))
+
+                case CommandType.Let:
+                    assert(isinstance(command, Let))
+                    self.compile_expression(command.value)
+                    self.emit(Op.Store, self.slot(command.var_name))
+
+                case CommandType.Print:
+                    assert(isinstance(command, Print))
+                    self.compile_expression(command.expr)
+                    self.emit(Op.Print)
+
+                case CommandType.Input:
+                    assert(isinstance(command, Input))
+                    self.emit(Op.Input, (self.slot(command.var_name), self.var_types[command.var_name]))
+
+                case _:
+                    raise Exception(f"Invalid command: {command.command_type}")
+
+    def compile_command(self, command: Command):
+        self.compile_commands([command])
+
+    # Expressions are compiled with an explicit stack of the expressions still to compile and the
+    # instructions to emit after their operands, so they can be nested to any depth
+    def compile_expression(self, expr: Expression):
+        stack: List[Expression | Op] = [expr]
+        while len(stack) > 0:
+            item = stack.pop()
+            if isinstance(item, Op):
+                self.emit(item)
+                continue
+            expr = item
+
+            match expr.expr_type:
+                case ExpressionType.Variable:
+                    assert(isinstance(expr, Variable))
+                    self.emit(Op.Load, self.slot(expr.var_name))
+
+                case ExpressionType.LiteralValue:
+                    assert(isinstance(expr, Lit))
+                    value = expr.value # type: ignore
+                    if expr.lit_type == TypeType.Int:
+                        value = as_i32(value)
+                    self.emit(Op.Const, value)
+
+                case ExpressionType.Add | ExpressionType.Subtract | ExpressionType.Multiply | ExpressionType.Divide:
+                    stack.append(arithmetic_ops[(expr.expr_type, expr.value_type)]) # type: ignore
+                    stack.append(expr.rhs) # type: ignore
+                    stack.append(expr.lhs) # type: ignore
+
+                case ExpressionType.EqualTo | ExpressionType.LessThan | ExpressionType.GreaterThan:
+                    # Whichever operand is a char compared with a number is converted with Ord
+                    coercion = comparison_coercion(expr.lhs.value_type, expr.rhs.value_type) # type: ignore
+                    stack.append(comparison_ops[expr.expr_type])
+                    if coercion == Coercion.Rhs:
+                        stack.append(Op.Ord)
+                    stack.append(expr.rhs) # type: ignore
+                    if coercion == Coercion.Lhs:
+                        stack.append(Op.Ord)
+                    stack.append(expr.lhs) # type: ignore
+
+                case _:
+                    raise Exception(f"Invalid expression: {expr.expr_type}")
+
+def compile_program(program: List[Command]) -> Program:
+    return BytecodeCompiler().compile(program)
+
+class VM:
+    def __init__(self, program: Program, output: Output | None = None):
+        self.program = program
+        self.output = UnbufferedOutput() if output is None else output
+        self.slots: List[Any] = [None] * len(program.slot_names)
+
+    def run(self):
+        try:
+            self.dispatch()
+        finally:
+            self.output.flush()
+
+    def dispatch(self):
+        code = self.program.code
+        slots = self.slots
+        stack: List[Any] = []
+        push = stack.append
+        pop = stack.pop
+        end = len(code)
+        pc = 0
+
+        LOAD, CONST, STORE, JUMP_IF_FALSE, JUMP = Op.Load.value, Op.Const.value, Op.Store.value, \
+            Op.JumpIfFalse.value, Op.Jump.value
+        ADD_INT, ADD, ADD_CHAR = Op.AddInt.value, Op.Add.value, Op.AddChar.value
+        SUB_INT, SUB_FLOAT, SUB_CHAR = Op.SubInt.value, Op.SubFloat.value, Op.SubChar.value
+        MUL_INT, MUL_FLOAT = Op.MulInt.value, Op.MulFloat.value
+        DIV_INT, DIV_FLOAT, DIV_CHAR = Op.DivInt.value, Op.DivFloat.value, Op.DivChar.value
+        ORD, EQUAL_TO, LESS_THAN, GREATER_THAN = Op.Ord.value, Op.EqualTo.value, Op.LessThan.value, \
+            Op.GreaterThan.value
+        PRINT, INPUT, DECLARE = Op.Print.value, Op.Input.value, Op.Declare.value
+        write = self.output.write
+
+        while pc < end:
+            op, arg = code[pc]
+            pc += 1
+
+            if op == LOAD:
+                push(slots[arg])
+            elif op == CONST:
+                push(arg)
+            elif op == STORE:
+                slots[arg] = pop()
+            elif op == JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op <= DIV_CHAR:
+                rhs = pop()
+                lhs = pop()
+                if op == ADD_INT:
+                    v = (lhs + rhs) & 0xffffffff
+                    push(v - 0x100000000 if v >= 0x80000000 else v)
+                elif op == ADD:
+                    push(lhs + rhs)
+                elif op == ADD_CHAR:
+                    push(chr((ord(lhs) + ord(rhs)) & 0xff))
+                elif op == SUB_INT:
+                    v = (lhs - rhs) & 0xffffffff
+                    push(v - 0x100000000 if v >= 0x80000000 else v)
+                elif op == SUB_FLOAT:
+                    push(lhs - rhs)
+                elif op == SUB_CHAR:
+                    push(chr((ord(lhs) - ord(rhs)) & 0xff))
+                elif op == MUL_INT:
+                    v = (lhs * rhs) & 0xffffffff
+                    push(v - 0x100000000 if v >= 0x80000000 else v)
+                elif op == MUL_FLOAT:
+                    push(lhs * rhs)
+                elif op == DIV_INT:
+                    v = (lhs // rhs) & 0xffffffff
+                    push(v - 0x100000000 if v >= 0x80000000 else v)
+                elif op == DIV_FLOAT:
+                    push(lhs / rhs)
+                else:
+                    push(chr(ord(lhs) // ord(rhs)))
+            elif op == ORD:
+                push(ord(pop()))
+            elif op == EQUAL_TO:
+                rhs = pop()
+                push(1 if pop() == rhs else 0)
+            elif op == LESS_THAN:
+                rhs = pop()
+                push(1 if pop() < rhs else 0)
+            elif op == GREATER_THAN:
+                rhs = pop()
+                push(1 if pop() > rhs else 0)
+            elif op == PRINT:
+                write(pop())
+            elif op == INPUT:
+                self.read_input(*arg)
+            elif op == DECLARE:
+                slot, default = arg
+                assert(slots[slot] is None)
+                slots[slot] = default
+            else:
+                raise Exception(f"Invalid opcode: {op}")
+
+    def read_input(self, slot: int, var_type: TypeType):
+        self.output.flush()
+        input_value = input()
+        match var_type:
+            case TypeType.Int:
+                self.slots[slot] = int(input_value)
+            case TypeType.Char:
+                self.slots[slot] = str(input_value)[0]
+            case TypeType.String:
+                self.slots[slot] = str(input_value)
+            case TypeType.Float:
+                self.slots[slot] = float(input_value)
@@ -0,0 +1,456 @@
+import select
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from ctypes import CDLL, get_errno
+from ctypes.util import find_library
+from os import read, close, stat, strerror, fsencode, path
+from struct import calcsize, unpack_from
+from sys import stderr
+from threading import Thread, Lock, Event
+from typing import Dict, List, Set, Tuple
+from folders_types import CommandType, ExpressionType, TypeType, Command, Expression, If, While, Declare
+from loader import Folder, scan_tree, list_dir, decode_commands, decode_command, decode_expression
+from typechecker import TypeChecker, check_program
+from interpreter import Interpreter
+from output import Output
+
+DEFAULT_POLL_INTERVAL = 0.25
+
+# Collects the paths of folders that changed, from a background thread. The running program only
+# reads `changed` (a plain attribute) between commands, and drains the paths when it is set. Subclasses
+# provide the way changes are noticed: watch starts watching a folder, and wait blocks briefly and
+# returns the paths that changed meanwhile.
+class Watcher(ABC):
+    def __init__(self):
+        self.changed = False
+        self.pending: Set[str] = set()
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = Thread(target=self.run, daemon=True)
+
+    @abstractmethod
+    def watch(self, dir: str):
+        ...
+
+    @abstractmethod
+    def wait(self) -> Set[str]:
+        ...
+
+    def watch_tree(self, tree: Folder):
+        stack = [tree]
+        while len(stack) > 0:
+            folder = stack.pop()
+            self.watch(folder.path) # type: ignore
+            stack.extend(folder)
+
+    def drain(self) -> Set[str]:
+        with self.lock:
+            paths = self.pending
+            self.pending = set()
+            self.changed = False
+        return paths
+
+    def run(self):
+        while not self.stopped.is_set():
+            paths = self.wait()
+            if len(paths) > 0:
+                with self.lock:
+                    self.pending.update(paths)
+                    self.changed = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+# inotify(7) through libc. Every folder is watched for subfolders being created, deleted or renamed,
+# and both the folder and the subfolder are reported.
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ONLYDIR     = 0x01000000
+IN_ISDIR       = 0x40000000
+IN_NONBLOCK    = 0o4000
+IN_CLOEXEC     = 0o2000000
+
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+EVENT_FORMAT = "iIII"
+EVENT_SIZE = calcsize(EVENT_FORMAT)
+WAIT_TIMEOUT = 0.1
+
+class InotifyWatcher(Watcher):
+    def __init__(self):
+        super().__init__()
+        libc = CDLL(find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(get_errno(), strerror(get_errno()))
+        self.paths: Dict[int, str] = {}
+
+    def watch(self, dir: str):
+        wd = self.libc.inotify_add_watch(self.fd, fsencode(dir), WATCH_MASK)
+        if wd < 0:
+            raise OSError(get_errno(), strerror(get_errno()), dir)
+        with self.lock:
+            self.paths[wd] = dir
+
+    def wait(self) -> Set[str]:
+        ready, _, _ = select.select([self.fd], [], [], WAIT_TIMEOUT)
+        if len(ready) == 0:
+            return set()
+
+        data = read(self.fd, 64 * 1024)
+        changed: Set[str] = set()
+        offset = 0
+        with self.lock:
+            while offset < len(data):
+                wd, mask, _, name_len = unpack_from(EVENT_FORMAT, data, offset)
+                name = data[offset + EVENT_SIZE:offset + EVENT_SIZE + name_len].rstrip(b"\0").decode("utf-8")
+                offset += EVENT_SIZE + name_len
+
+                if mask & IN_Q_OVERFLOW:
+                    changed.update(self.paths.values())
+                elif mask & IN_IGNORED:
+                    self.paths.pop(wd, None)
+                elif mask & IN_ISDIR and wd in self.paths:
+                    changed.add(self.paths[wd])
+                    changed.add(f"{self.paths[wd]}/{name}")
+        return changed
+
+    def stop(self):
+        super().stop()
+        close(self.fd)
+
+# Fallback for systems without inotify (or out of inotify watches): stats every folder each interval.
+# A folder is reported when its mtime changes, and also when its inode does, which means it was
+# deleted and recreated under the same name.
+class PollingWatcher(Watcher):
+    def __init__(self, interval: float = DEFAULT_POLL_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self.stamps: Dict[str, Tuple[int, int]] = {}
+
+    def watch(self, dir: str):
+        st = stat(dir)
+        with self.lock:
+            self.stamps[dir] = (st.st_ino, st.st_mtime_ns)
+
+    def wait(self) -> Set[str]:
+        if self.stopped.wait(self.interval):
+            return set()
+
+        with self.lock:
+            snapshot = list(self.stamps.items())
+
+        changed: Dict[str, Tuple[int, int] | None] = {}
+        for dir, stamp in snapshot:
+            try:
+                st = stat(dir)
+            except OSError:
+                changed[dir] = None
+                continue
+            if (st.st_ino, st.st_mtime_ns) != stamp:
+                changed[dir] = (st.st_ino, st.st_mtime_ns)
+
+        with self.lock:
+            for dir, new_stamp in changed.items():
+                if new_stamp is None:
+                    self.stamps.pop(dir, None)
+                else:
+                    self.stamps[dir] = new_stamp
+        return {dir for dir, new_stamp in changed.items() if new_stamp is not None}
+
+def watch_program(tree: Folder, poll_interval: float | None = None) -> Watcher:
+    if poll_interval is None:
+        inotify_watcher = None
+        try:
+            inotify_watcher = InotifyWatcher()
+            inotify_watcher.watch_tree(tree)
+            inotify_watcher.start()
+            return inotify_watcher
+        except OSError as e:
+            print(f"inotify unavailable ({e}), polling for changes instead", file=stderr)
+            if inotify_watcher is not None:
+                close(inotify_watcher.fd)
+        poll_interval = DEFAULT_POLL_INTERVAL
+
+    watcher = PollingWatcher(poll_interval)
+    watcher.watch_tree(tree)
+    watcher.start()
+    return watcher
+
+# The child nodes of an IR node, with the index of the subfolder each one was decoded from
+def child_nodes(node: Command | Expression) -> List[Tuple[Command | Expression, int]]:
+    if isinstance(node, Command):
+        match node.command_type:
+            case CommandType.If | CommandType.While:
+                return [(node.expr, 1)] # type: ignore
+            case CommandType.Let:
+                return [(node.value, 2)] # type: ignore
+            case CommandType.Print:
+                return [(node.expr, 1)] # type: ignore
+            case _:
+                return []
+    if node.expr_type in [ExpressionType.Variable, ExpressionType.LiteralValue]:
+        return []
+    return [(node.lhs, 1), (node.rhs, 2)] # type: ignore
+
+def walk(node: Command | Expression):
+    stack = [node]
+    while len(stack) > 0:
+        node = stack.pop()
+        yield node
+        stack.extend(child for child, _ in child_nodes(node))
+        if isinstance(node, If) or isinstance(node, While):
+            stack.extend(node.commands)
+
+def declared_in(nodes: List[Command]) -> Set[str]:
+    return {n.var_name for c in nodes for n in walk(c) if isinstance(n, Declare)}
+
+# Runs a loaded program while watching its folders. When folders change, only the IR nodes read from
+# them are decoded again: an edited literal or expression is rescanned and swapped in place (so the
+# running interpreter, which holds references to it, sees the new version), and an edited command
+# list keeps its unchanged commands and scans only the new ones. Changes are applied between
+# commands, on the interpreter's own thread. Edits that don't decode or type check yet (a folder
+# that is still being filled in, say) are reported and retried with the next change. An If or While
+# that is edited as a whole while its body is running is only swapped once the body is left, so the
+# commands being run stay the ones that are indexed.
+class LiveInterpreter(Interpreter):
+    def __init__(self, output: Output | None = None, poll_interval: float | None = None):
+        super().__init__(output)
+        self.poll_interval = poll_interval
+        self.program: List[Command] = []
+        self.var_types: Dict[str, TypeType] = {}
+        self.root = ""
+
+        # Every decoded node by the folder it was read from, and every command list by its folder,
+        # mapped to the If or While that owns it (None for the program itself)
+        self.nodes: Dict[str, Command | Expression] = {}
+        self.blocks: Dict[str, If | While | None] = {}
+        self.block_paths: Dict[str, str] = {}
+        self.failed: Set[str] = set()
+        self.deferred: Set[str] = set()
+        self.reloads = 0
+
+        # The Ifs and Whiles whose bodies are running, innermost last
+        self.running: List[Command] = []
+
+    def run_live(self, program_dir: str, jobs: int = 1):
+        self.root = path.normpath(program_dir)
+        tree = scan_tree(self.root, jobs)
+        self.program = decode_commands(tree)
+        self.var_types = check_program(self.program)
+        self.blocks[self.root] = None
+        for command, folder in zip(self.program, tree):
+            self.index(command, folder)
+
+        self.watcher = watch_program(tree, self.poll_interval)
+        try:
+            # The program can be edited while one of its commands runs, so the next command is the one after
+            # its folder, wherever that now is. Commands added or removed before it are neither run nor
+            # repeated.
+            i = 0
+            while i < len(self.program):
+                command = self.program[i]
+                self.run_commands([command])
+                if self.watcher.changed:
+                    self.apply_changes(self.watcher.drain())
+                if i < len(self.program) and self.program[i] is command:
+                    i += 1
+                else:
+                    i = bisect_right([c.path for c in self.program], command.path) # type: ignore
+        finally:
+            self.watcher.stop()
+            self.output.flush()
+
+    def run_command(self, command: Command) -> List[Command] | None:
+        if self.watcher.changed:
+            self.apply_changes(self.watcher.drain())
+        body = super().run_command(command)
+        if body is not None:
+            self.running.append(command)
+        return body
+
+    # Changes are also applied before each iteration of a While, which can itself be edited into a
+    # different command while it runs, and swaps deferred until the block was left are retried
+    def leave_block(self, command: Command) -> List[Command] | None:
+        self.running.pop()
+        if self.watcher.changed or len(self.deferred) > 0:
+            self.apply_changes(self.watcher.drain())
+        return super().leave_block(command)
+
+    def index(self, node: Command | Expression, folder: Folder):
+        stack = [(node, folder)]
+        while len(stack) > 0:
+            node, folder = stack.pop()
+            self.nodes[folder.path] = node # type: ignore
+            stack.extend((child, folder[i]) for child, i in child_nodes(node))
+            if isinstance(node, If) or isinstance(node, While):
+                self.blocks[folder[2].path] = node # type: ignore
+                self.block_paths[folder.path] = folder[2].path # type: ignore
+                stack.extend(zip(node.commands, folder[2]))
+
+    def unindex(self, node: Command | Expression):
+        for n in walk(node):
+            self.nodes.pop(n.path, None) # type: ignore
+            block_path = self.block_paths.pop(n.path, None) # type: ignore
+            if block_path is not None:
+                self.blocks.pop(block_path, None)
+
+    # The nearest folder at or above `dir` that something in the program was decoded from
+    def target_of(self, dir: str) -> str | None:
+        while dir not in self.nodes and dir not in self.blocks:
+            parent = path.dirname(dir)
+            if parent == dir or not parent.startswith(self.root):
+                return None
+            dir = parent
+        return dir
+
+    def apply_changes(self, dirs: Set[str]):
+        targets = {self.target_of(d) for d in dirs | self.failed | self.deferred}
+        self.failed = set()
+        self.deferred = set()
+
+        # Outermost first, skipping anything under a node that has just been reloaded as a whole
+        reloaded: Set[str] = set()
+        for target in sorted([t for t in targets if t is not None], key=len):
+            if any(ancestor in reloaded for ancestor in self.ancestors(target)):
+                continue
+            if target in self.blocks:
+                ok = self.reload_block(target)
+            elif any(self.nodes.get(target) is command for command in self.running):
+                # Edits below it still apply now, to the commands that are running
+                self.deferred.add(target)
+                continue
+            elif target in self.nodes:
+                ok = self.reload_node(target)
+                if ok:
+                    reloaded.add(target)
+            else:
+                continue
+            if not ok:
+                self.failed.add(target)
+
+    def ancestors(self, dir: str):
+        while dir != self.root:
+            dir = path.dirname(dir)
+            yield dir
+
+    def report(self, dir: str, message: str):
+        print(f"[{dir}] Not reloaded: {message}", file=stderr)
+
+    # Swaps the contents of `node` for those of `replacement`, returning what is needed to undo it
+    def swap(self, node: Command | Expression, replacement: Command | Expression):
+        previous = (node.__class__, dict(node.__dict__))
+        node.__class__ = replacement.__class__
+        node.__dict__.clear()
+        node.__dict__.update(replacement.__dict__)
+        return previous
+
+    def restore(self, node: Command | Expression, previous):
+        node.__class__ = previous[0]
+        node.__dict__.clear()
+        node.__dict__.update(previous[1])
+
+    # The expression directly under a command that `dir` (an expression's folder) is part of
+    def statement_expression(self, dir: str) -> Expression:
+        expr = self.nodes[dir]
+        for ancestor in self.ancestors(dir):
+            parent = self.nodes.get(ancestor)
+            if parent is None:
+                continue
+            if isinstance(parent, Command):
+                break
+            expr = parent
+        assert(isinstance(expr, Expression))
+        return expr
+
+    def reload_node(self, dir: str) -> bool:
+        node = self.nodes[dir]
+        try:
+            folder = scan_tree(dir)
+            self.watcher.watch_tree(folder)
+            replacement = decode_command(folder) if isinstance(node, Command) else decode_expression(folder)
+        except Exception as e:
+            self.report(dir, str(e) or type(e).__name__)
+            return False
+
+        stale = list(walk(node))
+        if isinstance(node, Command):
+            assert(isinstance(replacement, Command))
+            removed = declared_in([node])
+            checker = TypeChecker({name: t for name, t in self.var_types.items() if name not in removed})
+            checker.check_command(replacement)
+            if len(checker.errors) > 0:
+                self.report(dir, "\n".join(checker.errors))
+                return False
+            self.swap(node, replacement)
+            self.var_types = checker.var_types
+        else:
+            # A literal changing type changes the type of the expressions around it
+            previous = self.swap(node, replacement)
+            checker = TypeChecker(self.var_types)
+            checker.check_expression(self.statement_expression(dir))
+            if len(checker.errors) > 0:
+                self.restore(node, previous)
+                self.report(dir, "\n".join(checker.errors))
+                return False
+
+        for n in stale:
+            self.unindex(n)
+        self.index(node, folder)
+        self.reloads += 1
+        return True
+
+    def reload_block(self, dir: str) -> bool:
+        owner = self.blocks[dir]
+        old_commands = self.program if owner is None else owner.commands
+        kept = {c.path: c for c in old_commands}
+
+        commands: List[Command] = []
+        scanned: List[Tuple[Command, Folder]] = []
+        try:
+            for child_dir in list_dir(dir):
+                if child_dir in kept:
+                    commands.append(kept.pop(child_dir))
+                    continue
+                folder = scan_tree(child_dir)
+                self.watcher.watch_tree(folder)
+                command = decode_command(folder)
+                commands.append(command)
+                scanned.append((command, folder))
+        except Exception as e:
+            self.report(dir, str(e) or type(e).__name__)
+            return False
+
+        removed = list(kept.values())
+        removed_names = declared_in(removed)
+        checker = TypeChecker({name: t for name, t in self.var_types.items() if name not in removed_names})
+        for command, _ in scanned:
+            checker.check_command(command)
+        if len(checker.errors) > 0:
+            self.report(dir, "\n".join(checker.errors))
+            return False
+
+        for command in removed:
+            self.unindex(command)
+        for command, folder in scanned:
+            self.index(command, folder)
+
+        # A new list rather than an update in place, so a loop already iterating the old one is unaffected
+        if owner is None:
+            self.program = commands
+        else:
+            owner.commands = commands
+        self.var_types = checker.var_types
+        self.reloads += 1
+        return True